@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Content-addressed local cache of downloaded server zips.
+
+Layout of the cache directory:
+
+    objects/<sha256[:2]>/<sha256>   one blob per distinct archive
+    index.json                      archive filename -> sha256, size, last use
+    .lock                           flock()ed while the index is read or written
+
+The cache is keyed by the archive filename (e.g. terraria-server-1449.zip),
+which already carries the version. Blobs are handed out by hardlink when the
+destination is on the same filesystem and copied otherwise, so the directory
+works as a BuildKit cache mount (RUN --mount=type=cache). Total size is capped;
+the least recently used archives are evicted first.
+
+The cache is only used when a location is configured, through the
+TERRARIA_ARTIFACT_CACHE environment variable or the --cache-dir option of
+download_server.py.
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import shutil
+import sys
+import time
+
+import fileutil
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def cache_dir_from_env():
+    """Return the configured cache directory, or None if the cache is disabled."""
+    return os.environ.get("TERRARIA_ARTIFACT_CACHE") or None
+
+
+def max_bytes_from_env():
+    value = os.environ.get("TERRARIA_ARTIFACT_CACHE_MAX_MB")
+    return int(value) * 1024 * 1024 if value else DEFAULT_MAX_BYTES
+
+
+class ArtifactCache:
+    """Version-keyed, content-addressed store of server archives with an LRU size cap."""
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    @contextlib.contextmanager
+    def _locked_index(self):
+        """Yield the index under an exclusive lock and write it back afterwards."""
+        with open(os.path.join(self.root, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+            except FileNotFoundError:
+                index = {}
+            except ValueError:
+                print(f"Warning: rebuilding corrupt cache index {self.index_path}", file=sys.stderr)
+                index = {}
+            yield index
+            fileutil.write_json_atomic(self.index_path, index, prefix=".index-")
+
+    def lookup(self, key):
+        """Return the index entry for key if its blob is present, else None."""
+        with self._locked_index() as index:
+            entry = index.get(key)
+            if entry is None:
+                return None
+            path = self._object_path(entry["sha256"])
+            try:
+                if os.path.getsize(path) != entry["size"]:
+                    raise OSError("size mismatch")
+            except OSError:
+                del index[key]
+                return None
+            entry["last_used"] = time.time()
+            return dict(entry)
+
+    def fetch(self, key, dest_path):
+        """Place the cached archive for key at dest_path. Returns the entry, or None on a miss."""
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        source = self._object_path(entry["sha256"])
+        tmp_path = dest_path + ".cache-tmp"
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            # Different filesystem (e.g. a BuildKit cache mount): copy instead
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, dest_path)
+        return entry
+
+    def store(self, key, path, sha256=None):
+        """Add the archive at path under key. Returns its sha256.
+
+        Pass sha256 when it is already known (e.g. computed during the download)
+        to avoid reading the file again.
+        """
+        sha256 = sha256 or fileutil.file_sha256(path)
+        size = os.path.getsize(path)
+        object_path = self._object_path(sha256)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if not os.path.exists(object_path):
+            tmp_path = f"{object_path}.{os.getpid()}.tmp"
+            try:
+                os.link(path, tmp_path)
+            except OSError:
+                shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, object_path)
+
+        with self._locked_index() as index:
+            index[key] = {"sha256": sha256, "size": size, "last_used": time.time()}
+            self._evict(index, keep=key)
+        return sha256
+
+    def _evict(self, index, keep=None):
+        """Remove least recently used archives until the cache fits in max_bytes."""
+        blobs = {}
+        for entry in index.values():
+            blobs[entry["sha256"]] = entry["size"]
+        total = sum(blobs.values())
+
+        for key in sorted(index, key=lambda k: index[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            sha256 = index.pop(key)["sha256"]
+            if any(e["sha256"] == sha256 for e in index.values()):
+                continue
+            total -= blobs[sha256]
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._object_path(sha256))
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Asyncio API for version discovery, filename lookup and the download.
+
+For programs that drive these scripts from an event loop. Each coroutine runs
+the matching sync function in a worker thread, so results, printed progress
+and error handling are exactly those of the sync version, and adds:
+
+    timeout    seconds the whole call may take; past it, requests in progress
+               are interrupted and asyncio.TimeoutError is raised
+    limiter    cap on requests in flight, shared by every call given the same
+               one (default: shared_limiter, DEFAULT_CONCURRENCY slots)
+
+Cancelling the awaiting task interrupts the call the same way. Either way the
+coroutine only returns once the worker has stopped, so nothing keeps running
+(or writing files) behind the caller's back.
+
+    import asyncio, async_api
+
+    async def main():
+        version = await async_api.find_highest_version(jobs=8, timeout=30)
+        await async_api.download_server(version, "/srv/terraria", timeout=600)
+
+    asyncio.run(main())
+
+The sync functions stay the implementation and the command line entry points
+are unchanged. A probe_cache.ProbeCache is not thread-safe, so concurrent calls
+must not share one.
+"""
+
+import asyncio
+import contextlib
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import download_server as download_module
+import get_latest_filename as filename_module
+import get_latest_version
+import http_pool
+import range_download
+
+DEFAULT_CONCURRENCY = 8
+# Worker threads for concurrent calls; requests beyond the limiter wait inside them
+MAX_WORKERS = 32
+
+shared_limiter = threading.BoundedSemaphore(DEFAULT_CONCURRENCY)
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="terraria-async")
+
+
+def set_concurrency(limit):
+    """Replace the shared limiter with one allowing limit requests in flight.
+
+    Calls already running keep the limiter they started with.
+    """
+    global shared_limiter
+    if limit < 1:
+        raise ValueError("concurrency limit must be at least 1")
+    shared_limiter = threading.BoundedSemaphore(limit)
+
+
+async def run(func, *args, timeout=None, limiter=None, **kwargs):
+    """Run a sync function in a worker thread under a deadline, cancellation and the limiter.
+
+    Every http_pool request func makes, including those of its own worker
+    threads, counts against limiter and is interrupted on cancellation or when
+    timeout runs out.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    scope = http_pool.CallScope(deadline, shared_limiter if limiter is None else limiter)
+
+    def call():
+        with http_pool.use_scope(scope):
+            return func(*args, **kwargs)
+
+    future = loop.run_in_executor(_executor, call)
+    try:
+        result = await asyncio.wait_for(asyncio.shield(future), timeout)
+    except BaseException:
+        if not future.done():
+            scope.cancel()
+            # Let the worker notice and unwind before handing control back
+            with contextlib.suppress(BaseException):
+                await asyncio.shield(future)
+        raise
+    # The sync code may have swallowed the deadline error and returned anyway
+    if scope.expired:
+        raise asyncio.TimeoutError()
+    return result
+
+
+async def get_latest_filename(*, timeout=None, limiter=None):
+    """Async get_latest_filename.get_latest_filename()."""
+    return await run(filename_module.get_latest_filename, timeout=timeout, limiter=limiter)
+
+
+async def get_base_version(cache=None, *, timeout=None, limiter=None):
+    """Async get_latest_version.get_base_version()."""
+    return await run(get_latest_version.get_base_version, cache, timeout=timeout, limiter=limiter)
+
+
+async def is_version_available(version, *, timeout=None, limiter=None):
+    """Async get_latest_version.is_version_available()."""
+    return await run(get_latest_version.is_version_available, version, timeout=timeout, limiter=limiter)
+
+
+async def find_highest_version(jobs=1, cache=None, strategy="linear", stats=None, *, timeout=None, limiter=None):
+    """Async get_latest_version.find_highest_version().
+
+    With jobs > 1, the concurrent probes count against the limiter one by one.
+    """
+    return await run(functools.partial(get_latest_version.find_highest_version, jobs, cache, strategy, stats),
+                     timeout=timeout, limiter=limiter)
+
+
+async def download_server(version, dir_path="", connections=range_download.DEFAULT_CONNECTIONS, cache_dir=None,
+                          use_cache=True, linux_only=False, filename=None, *, timeout=None, limiter=None):
+    """Async download_server.download_server().
+
+    An interrupted download leaves its .part file and state behind, so the next
+    call resumes it like an interrupted sync download.
+    """
+    return await run(functools.partial(download_module.download_server, version, dir_path, connections=connections,
+                                       cache_dir=cache_dir, use_cache=use_cache, linux_only=linux_only,
+                                       filename=filename),
+                     timeout=timeout, limiter=limiter)
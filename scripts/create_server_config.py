@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Write server-config.conf from the container's environment variables.
+
+    python3 create_server_config.py [-o server-config.conf]
+
+Every setting the Dockerfile defines (autocreate, seed, difficulty,
+maxplayers, port, password, motd, worldpath, banlist, secure, language, upnp,
+npcstream, priority, plus world and worldname) is validated before anything
+is written, so a typo such as maxplayers=abc stops the container at once
+with a clear message instead of after the server has loaded the world.
+Unset variables take the Dockerfile defaults, and so do empty ones
+(priority= in a compose file) except for the free text settings, where
+empty is a value.
+
+world, worldpath and worldname are resolved as before:
+
+    world set, file exists       load it
+    world set, file missing      create it (worldname defaults to the file name)
+    world not set                create or load worldpath/worldname.wld
+
+world is always moved into worldpath (or the default Worlds directory).
+
+With worldpool set (see world_pool.py), a world that would be autocreated is
+taken from the pool of pre-generated worlds when it holds one of the same
+size, difficulty and seed, and a background fill replaces it. Pooled worlds
+are named "World" in the game, so none is taken when worldname is set to
+another name.
+
+The file is written in one atomic replace. Its first line is a digest of the
+resolved settings; when it matches, the existing file is left untouched.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+import tempfile
+
+import world_pool
+
+CONFIG_NAME = "server-config.conf"
+TERRARIA_DIR = os.environ.get("TERRARIA_DIR", "/root/.local/share/Terraria")
+DEFAULT_WORLDS_DIR = "/root/.local/share/Terraria/Worlds"
+DEFAULT_BANLIST = "banlist.txt"
+DIGEST_PREFIX = "# settings-sha256: "
+LANGUAGE_PATTERN = re.compile(r"[a-z]{2}[-/_][A-Za-z]{2,4}")
+
+
+class ConfigError(ValueError):
+    """One or more settings are invalid."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def integer(low, high=None):
+    """Validator for a whole number in [low, high]."""
+    def validate(value):
+        if not re.fullmatch(r"-?\d+", value.strip()):
+            raise ValueError("must be a whole number")
+        number = int(value)
+        if number < low or (high is not None and number > high):
+            raise ValueError(f"must be between {low} and {high}" if high is not None else f"must be at least {low}")
+        return str(number)
+    return validate
+
+
+def text(value):
+    if "\n" in value or "\r" in value:
+        raise ValueError("must not contain a line break")
+    return value
+
+
+def pool_spec(value):
+    if value.strip():
+        world_pool.parse_spec(value)
+    return value.strip()
+
+
+def language(value):
+    if not LANGUAGE_PATTERN.fullmatch(value):
+        raise ValueError("must be a language code such as en-US")
+    return value
+
+
+# name -> (default, validator); the defaults are the ENV values of the Dockerfile
+SETTINGS = {
+    "world": ("", text),
+    "worldname": ("", text),
+    "autocreate": ("1", integer(1, 3)),
+    "seed": ("", text),
+    "difficulty": ("1", integer(0, 3)),
+    "maxplayers": ("16", integer(1, 255)),
+    "port": ("7777", integer(1, 65535)),
+    "password": ("", text),
+    "motd": ("Welcome!", text),
+    "worldpath": (os.path.join(TERRARIA_DIR, "Worlds"), text),
+    "banlist": (DEFAULT_BANLIST, text),
+    "secure": ("1", integer(0, 1)),
+    "language": ("en/US", language),
+    "upnp": ("1", integer(0, 1)),
+    "npcstream": ("1", integer(0)),
+    "priority": ("1", integer(0, 5)),
+    "worldpool": ("", pool_spec),
+    "worldpoolcount": (str(world_pool.DEFAULT_COUNT), integer(0)),
+    "worldpoolcpus": (str(world_pool.DEFAULT_CPUS), integer(1)),
+}
+
+
+def load_settings(environ=None):
+    """Validate the settings in environ (default os.environ). Raises ConfigError listing every problem."""
+    environ = os.environ if environ is None else environ
+    settings, errors = {}, []
+    for name, (default, validate) in SETTINGS.items():
+        value = environ.get(name)
+        if value is None or (validate is not text and not value.strip()):
+            settings[name] = default
+            continue
+        try:
+            settings[name] = validate(value)
+        except ValueError as e:
+            errors.append(f"{name} {e}, got '{value}'")
+    if errors:
+        raise ConfigError(errors)
+    return settings
+
+
+def resolve_world(settings):
+    """Return (world, worldname) with world moved into worldpath and worldname derived from it."""
+    world, worldname, worldpath = settings["world"], settings["worldname"], settings["worldpath"]
+    if world:
+        world = f"{worldpath or DEFAULT_WORLDS_DIR}/{os.path.basename(world)}"
+    if not worldname and world:
+        # Like ${name%.*}: drop the last extension
+        worldname = os.path.basename(world)
+        if "." in worldname:
+            worldname = worldname.rsplit(".", 1)[0]
+    return world, worldname
+
+
+def render(settings, world_exists=os.path.isfile):
+    """Return the config lines and the messages to print for settings."""
+    world, worldname = resolve_world(settings)
+    create = [f"autocreate={settings['autocreate']}", f"seed={settings['seed']}",
+              f"worldname={worldname}", f"difficulty={settings['difficulty']}"]
+    if world and world_exists(world):
+        messages = [f"{CONFIG_NAME}: Loading world: {world}"]
+        lines = [f"world={world}"]
+    elif world:
+        messages = [f"{CONFIG_NAME}: World {world} doesn't exists. Creating it using:",
+                    f"worldname: {worldname}", f"autocreate: {settings['autocreate']}",
+                    f"seed: {settings['seed']}", f"difficulty: {settings['difficulty']}"]
+        lines = [f"world={world}"] + create
+    else:
+        messages = []
+        lines = [f"world={settings['worldpath']}/{worldname}.wld"] + create
+
+    lines += [f"{name}={settings[name]}" for name in
+              ("maxplayers", "port", "password", "motd", "worldpath", "banlist",
+               "secure", "language", "upnp", "npcstream", "priority")]
+    return lines, messages
+
+
+def claim_pooled_world(settings):
+    """Move a matching pre-generated world to where the server would autocreate one. Returns its pool path."""
+    world, worldname = resolve_world(settings)
+    if not world:
+        if not worldname:
+            return None
+        world = f"{settings['worldpath']}/{worldname}.wld"
+    if os.path.exists(world):
+        return None
+    if settings["worldname"] not in ("", world_pool.POOL_WORLD_NAME):
+        print(f"{CONFIG_NAME}: Not using a pre-generated world: they are named {world_pool.POOL_WORLD_NAME}, "
+              f"not {settings['worldname']}")
+        return None
+    worldpath = os.path.dirname(world)
+    claimed = world_pool.claim(world_pool.pool_dir(worldpath), settings["autocreate"],
+                               settings["difficulty"], settings["seed"], world)
+    if claimed is not None:
+        print(f"{CONFIG_NAME}: Using pre-generated world {claimed} for {world}")
+        if worldname != world_pool.POOL_WORLD_NAME:
+            print(f"Warning: {world} is named {world_pool.POOL_WORLD_NAME} in the game, not {worldname}",
+                  file=sys.stderr)
+    return claimed
+
+
+def settings_digest(lines):
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def write_config(path, lines):
+    """Write lines to path atomically, unless it already holds them. Returns True if written."""
+    header = DIGEST_PREFIX + settings_digest(lines)
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.readline().rstrip("\n") == header:
+                return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".server-config-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("\n".join([header] + lines) + "\n")
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def create_config(path=CONFIG_NAME, environ=None):
+    """Validate the environment and write the config to path. Returns True if the file changed."""
+    settings = load_settings(environ)
+    if settings["worldpool"]:
+        claim_pooled_world(settings)
+        world, _ = resolve_world(settings)
+        # Only starts a fill when a claim or a raised count left the pool short
+        world_pool.start_fill(os.path.dirname(world) if world else settings["worldpath"], settings["worldpool"],
+                              int(settings["worldpoolcount"]), int(settings["worldpoolcpus"]))
+    lines, messages = render(settings)
+    for message in messages:
+        print(message)
+    if settings["banlist"] in ("", DEFAULT_BANLIST):
+        open(os.path.join(os.path.dirname(path), DEFAULT_BANLIST), "a").close()
+    return write_config(path, lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the Terraria server config from environment variables.")
+    parser.add_argument("-o", "--output", default=CONFIG_NAME, help=f"config file to write (default: {CONFIG_NAME})")
+    args = parser.parse_args(argv)
+    try:
+        changed = create_config(args.output)
+    except ConfigError as e:
+        for error in e.errors:
+            print(f"Error: {error}", file=sys.stderr)
+        print(f"Not starting: fix the settings above, {args.output} was left unchanged", file=sys.stderr)
+        return 1
+    print(f"Wrote {args.output}" if changed else f"{args.output} is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
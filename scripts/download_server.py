@@ -1,21 +1,32 @@
-import urllib.request
-import urllib.error
-import json
+import argparse
 import os
 import sys
-import shutil
 
+import artifact_cache
 import get_latest_filename
+import install_manifest
+import mirror
+import range_download
+import remote_zip
+import tracing
+import version_index
 
 
-def download_server(version, dir_path=""):
+def is_linux_member(name):
+    """True for members of the <version>/Linux/ tree of the server archive."""
+    parts = name.split("/")
+    return len(parts) > 2 and parts[1] == "Linux"
+
+
+def archive_filename(version):
+    """Return the server archive name for 'latest' or a version such as 1449 or 1.4.4.9."""
     if not isinstance(version, str):
         raise TypeError("Version must be a string")
     
     match version:
         case "latest":
             print("Getting latest filename...")
-            filename = get_latest_filename.get_latest_filename()
+            return get_latest_filename.get_latest_filename()
         
         case _:
             print("Using Custom Version")
@@ -25,25 +36,116 @@ def download_server(version, dir_path=""):
             formated_version = formated_version.zfill(4)
             assert len(formated_version) == 4, "Version must be 4 digits"
             print("Formated version:", formated_version)
-            filename = f"terraria-server-{formated_version}.zip"
-    
-    url = f"https://terraria.org/api/download/pc-dedicated-server/{filename}"
+            return f"terraria-server-{formated_version}.zip"
+
+
+def archive_url(filename):
+    """Download URL of an archive on terraria.org, or on the mirror set by TERRARIA_MIRROR."""
+    return mirror.archive_url(filename)
+
+
+def archive_version(filename):
+    """terraria-server-1449.zip -> 1449"""
+    return filename.removeprefix("terraria-server-").removesuffix(".zip")
+
+
+def check_released(filename, index_path=None):
+    """Reject a version the local version index knows is absent, without a request.
+
+    Without an index, or for a version it cannot tell about, nothing is checked.
+    """
+    server_version = archive_version(filename)
+    if version_index.VersionIndex(index_path).exists(server_version) is False:
+        raise ValueError(f"Version {server_version} was never released (see version_index.py list)")
+
+
+def download_server(version, dir_path="", connections=range_download.DEFAULT_CONNECTIONS,
+                    cache_dir=None, use_cache=True, linux_only=False, filename=None):
+    filename = filename or archive_filename(version)
+    if version != "latest":
+        check_released(filename)
+    url = archive_url(filename)
 
     if not dir_path:
         dir_path = os.getcwd()
 
     output_path = os.path.join(dir_path, "terraria-server.zip")
+    server_version = archive_version(filename)
+
+    cache = None
+    cache_dir = cache_dir or artifact_cache.cache_dir_from_env()
+    if use_cache and cache_dir:
+        cache = artifact_cache.ArtifactCache(cache_dir, max_bytes=artifact_cache.max_bytes_from_env())
+        with tracing.phase("cache_lookup") as phase:
+            entry = cache.fetch(filename, output_path)
+            if entry is not None:
+                phase.bytes = entry["size"]
+        if entry is not None:
+            print(f"Using cached {filename} (sha256 {entry['sha256']}) from {cache_dir}")
+            install_manifest.write_download_info(dir_path, server_version, filename, entry["size"], entry["sha256"])
+            return
+
+    if mirror.local_dir() is not None:
+        print(f"Copying {filename} from the mirror at {mirror.local_dir()}...")
+        with tracing.phase("download", source="mirror") as phase:
+            entry = mirror.copy_archive(filename, output_path)
+            phase.bytes = entry["size"]
+        install_manifest.write_download_info(dir_path, server_version, filename, entry["size"], entry["sha256"])
+        return
+
+    if linux_only:
+        # Fetch just the Linux tree; prune_unused_files.py moves it into place
+        print(f"Fetching the Linux files of {url} into {dir_path}...")
+        try:
+            with tracing.phase("download", source="ranges") as phase:
+                _, fetched, archive_size = remote_zip.extract_remote(url, dir_path, is_linux_member,
+                                                                     connections=connections)
+                phase.bytes = fetched
+            # Only part of the archive was fetched, so there is no archive digest
+            install_manifest.write_download_info(dir_path, server_version, filename, archive_size)
+            return
+        except remote_zip.RangesNotSupported:
+            print("Server does not support range requests, falling back to a full download")
+
     print(f"Downloading {url} to {output_path}...")
 
-    req = urllib.request.Request(url)
-    req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-    with urllib.request.urlopen(req) as response, open(output_path, 'wb') as out_file:
-        shutil.copyfileobj(response, out_file)
+    with tracing.phase("download", source="network") as phase:
+        result = range_download.fetch(url, output_path, connections=connections)
+        phase.bytes = result.size
+    print(f"sha256 {result.sha256}")
+    install_manifest.write_download_info(dir_path, server_version, filename, result.size, result.sha256)
+
+    if cache is not None:
+        cache.store(filename, output_path, sha256=result.sha256)
+        print(f"Stored {filename} in {cache_dir}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download the Terraria dedicated server zip.")
+    parser.add_argument("version", help="'latest' or a version such as 1449 or 1.4.4.9")
+    parser.add_argument("output_dir", nargs="?", default="", help="directory to write terraria-server.zip to")
+    parser.add_argument("-c", "--connections", type=int,
+                        default=int(os.environ.get("TERRARIA_DOWNLOAD_CONNECTIONS", range_download.DEFAULT_CONNECTIONS)),
+                        help="parallel connections for range requests (default: 4, or $TERRARIA_DOWNLOAD_CONNECTIONS)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="artifact cache directory (default: $TERRARIA_ARTIFACT_CACHE, unset disables the cache)")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor update the artifact cache")
+    parser.add_argument("--linux-only", action="store_true",
+                        help="on a cache miss, fetch only the Linux members of the archive with range requests")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="write request timings and metrics to FILE, JSON lines or OpenMetrics for .prom "
+                             "(default: $TERRARIA_TRACE, unset disables tracing)")
+    args = parser.parse_args(argv)
+    tracing.setup(args.trace)
+    try:
+        download_server(args.version, args.output_dir, connections=args.connections,
+                        cache_dir=args.cache_dir, use_cache=not args.no_cache, linux_only=args.linux_only)
+    except (ValueError, OSError) as e:
+        # OSError covers a mirror without the archive and network failures
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python download_server.py <version> [output directory]")
-        sys.exit(1)
-    
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else ""
-    download_server(sys.argv[1], output_dir)
+    sys.exit(main())
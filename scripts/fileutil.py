@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+File helpers shared by the download, cache and install scripts.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """Return the hex sha256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        # No walrus: install_manifest.py runs on the Python 3.7 of the arm64 image
+        for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def preallocate(fd, size):
+    """Reserve size bytes for fd, falling back to a sparse ftruncate where fallocate is unsupported."""
+    if size <= 0:
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
+
+
+def sync_file(f):
+    """Flush an open file and fsync it, so its data is on disk before it is renamed into view."""
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def fsync_path(path):
+    """fsync a file or directory by path; for a directory, this makes renames and new entries in it durable."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, data, prefix=".tmp-", sync=False):
+    """Write data as JSON to path through a temporary file in the same directory and os.replace().
+
+    With sync, the file is fsynced before the replace.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=prefix)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+            if sync:
+                sync_file(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -1,19 +1,28 @@
-import urllib.request
+import urllib.error
 import json
 
-def get_latest_filename():
+import http_pool
+import mirror
+import tracing
+
+# The names list is tiny, so a slow answer is worth a hedged duplicate
+NAMES_LATENCY = http_pool.LatencyTracker()
+
+def get_filenames():
+    """Return every archive name of the dedicated-servers-names list, newest first, or None on failure."""
     try:
-        url = "https://terraria.org/api/get/dedicated-servers-names"
-        req = urllib.request.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
+        if mirror.source():
+            return mirror.filenames()
 
-        with urllib.request.urlopen(req, timeout=10) as response:
+        url = mirror.OFFICIAL_NAMES_URL
+
+        with tracing.phase("names_list"), http_pool.request_with_retries(url, hedge=NAMES_LATENCY) as response:
             data = response.read().decode('utf-8')
 
         parsed_data = json.loads(data)
 
         if isinstance(parsed_data, list) and parsed_data:
-            return parsed_data[0]
+            return parsed_data
         else:
             raise ValueError("Unexpected data format")
         
@@ -21,5 +30,10 @@ def get_latest_filename():
         print(f"Error fetching latest filename: {e}")
         return None
 
+def get_latest_filename():
+    filenames = get_filenames()
+    return filenames[0] if filenames else None
+
 if __name__ == "__main__":
+    tracing.setup()
     print(get_latest_filename())
\ No newline at end of file
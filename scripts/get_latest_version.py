@@ -2,49 +2,163 @@
 """
 Find the latest available Terraria dedicated server version.
 
-Scrapes the Terraria Fandom wiki to get a base version, then increments
-to find the actual latest version available for download.
+Scrapes the Terraria Fandom wiki (or asks the dedicated-servers-names API) to get
+a base version, then increments to find the actual latest version available for
+download.
+
+With --check-only VERSION, only answers whether anything newer than VERSION
+has been published, with a handful of requests (see check_for_update()).
+
+With --trace FILE (or TERRARIA_TRACE), request timings, probe counts and the
+duration of each phase are written to FILE (see tracing.py).
 
 Assumes that version numbers always start with 1, have 4 numbers, each number is between 0-9 (no 2-digit minor version for example)
 and is in the format: 1.M.m.h where { M: major, m: minor, h: hotfix }
 """
 
+import argparse
 import sys
-import urllib.request
 import urllib.error
 import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import get_latest_filename
+import http_pool
+import mirror
+import probe_cache
+import tracing
 
 DEFAULT_VERSION = '1450'
+# Exit status of --check-only when nothing newer than the given version exists
+NOTHING_NEW_EXIT = 3
+# Statuses that mean a version does not exist; anything else is not an answer
+ABSENT_STATUSES = (404, 410)
+PROBE_LATENCY = http_pool.LatencyTracker()
+WIKI_URL = "https://terraria.fandom.com/wiki/Server"
+# Download links on the wiki. The file name part is bounded so a match never
+# spans more than DOWNLOAD_URL_MAX_LENGTH bytes of the page.
+DOWNLOAD_URL_PREFIX = b'https://terraria.org/api/download/pc-dedicated-server/'
+DOWNLOAD_URL_PATTERN = re.compile(re.escape(DOWNLOAD_URL_PREFIX) + rb'[^"]{0,64}')
+DOWNLOAD_URL_MAX_LENGTH = len(DOWNLOAD_URL_PREFIX) + 64
+SCRAPE_CHUNK_SIZE = 16 * 1024
+SCRAPE_MAX_BYTES = 1024 * 1024
+SCRAPE_STOP_AFTER = 64 * 1024
+
+
+class UnknownAvailability(Exception):
+    """A version the search depends on could not be probed."""
+
+
+def scan_download_urls(response, chunk_size=SCRAPE_CHUNK_SIZE, max_bytes=SCRAPE_MAX_BYTES,
+                       stop_after=SCRAPE_STOP_AFTER, decompress=None):
+    """Return the last server download URL in a response, reading it in chunks.
+
+    Matches that straddle two chunks are found by rescanning the last
+    DOWNLOAD_URL_MAX_LENGTH bytes together with the next chunk. Reading stops
+    after max_bytes, or once stop_after bytes have gone by without a download
+    URL after the last one (the versions table is over). Only one chunk and the
+    overlap are held in memory.
+
+    Args:
+        response: Object with a read(size) method returning bytes
+        decompress: Optional zlib decompressobj for a compressed body
+
+    Returns:
+        The last URL as a string, or None if there was none
+    """
+    carry = b''
+    carry_offset = 0  # stream offset of carry[0]
+    read = 0
+    last_url = None
+    last_end = None
+
+    while read < max_bytes:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        if decompress is not None:
+            chunk = decompress.decompress(chunk)
+        read += len(chunk)
+        buffer = carry + chunk
+
+        # Only accept matches that cannot still grow into the next chunk
+        limit = len(buffer) - DOWNLOAD_URL_MAX_LENGTH
+        for match in DOWNLOAD_URL_PATTERN.finditer(buffer):
+            if match.start() >= limit:
+                break
+            if carry_offset + match.start() >= (last_end or 0):
+                last_url, last_end = match.group(), carry_offset + match.end()
+
+        keep = min(len(buffer), DOWNLOAD_URL_MAX_LENGTH)
+        carry_offset += len(buffer) - keep
+        carry = buffer[len(buffer) - keep:]
+
+        if last_end is not None and carry_offset - last_end > stop_after:
+            break
+    else:
+        print(f"Warning: stopped reading the wiki page after {max_bytes} bytes", file=sys.stderr)
+
+    # Nothing more will be read, so matches in the overlap are complete
+    for match in DOWNLOAD_URL_PATTERN.finditer(carry):
+        if carry_offset + match.start() >= (last_end or 0):
+            last_url, last_end = match.group(), carry_offset + match.end()
+
+    return last_url.decode('ascii', 'replace') if last_url is not None else None
+
 
-def get_base_version():
+def get_base_version(cache=None):
     """Get the base Terraria version by scraping the Terraria Fandom wiki.
 
+    The page is streamed through scan_download_urls() rather than read whole.
+    With a ProbeCache, the previous page's ETag and Last-Modified are sent so
+    an unchanged page is answered with a bodiless 304 and the stored version is
+    reused; new validators are stored after a successful scrape.
+
+    With a mirror configured (TERRARIA_MIRROR), the newest version in its
+    index is used and the wiki is not contacted.
+
     Returns the version string on success, or None on failure.
     """
     try:
-        url = "https://terraria.fandom.com/wiki/Server"
-        req = urllib.request.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-
-        with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8')
-
-        # Extract download URLs
-        pattern = r'https://terraria\.org/api/download/pc-dedicated-server/[^"]*'
-        matches = re.findall(pattern, html)
-
-        if not matches:
+        if mirror.source():
+            return mirror.latest_version()
+
+        url = WIKI_URL
+
+        previous = cache.base_version_validators() if cache is not None else None
+        headers = {'Accept-Encoding': 'gzip'}
+        if previous is not None:
+            if previous['etag']:
+                headers['If-None-Match'] = previous['etag']
+            if previous['last_modified']:
+                headers['If-Modified-Since'] = previous['last_modified']
+
+        with tracing.phase("wiki_scrape"), http_pool.request_with_retries(url, headers=headers) as response:
+            if response.status == 304 and previous is not None:
+                cache.set_base_version(previous['value'])
+                return previous['value']
+
+            decompress = None
+            if response.headers.get('Content-Encoding') == 'gzip':
+                decompress = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            latest_url = scan_download_urls(response, decompress=decompress)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+
+        if latest_url is None:
             print("Error: Could not find Terraria download URL on Fandom wiki", file=sys.stderr)
             return None
 
-        # Get the last (most recent) URL and extract version
-        latest_url = matches[-1]
+        # Extract the version from the last (most recent) URL
         version = latest_url.split('/terraria-server-')[1].split('.zip')[0]
 
         if not version:
             print("Error: Could not extract version from URL", file=sys.stderr)
             return None
 
+        if cache is not None:
+            cache.set_base_version(version, etag=etag, last_modified=last_modified)
         return version
     except (urllib.error.URLError, urllib.error.HTTPError, Exception) as e:
         print(f"Error fetching Terraria version: {e}", file=sys.stderr)
@@ -66,62 +180,134 @@ def int_to_version(version_int):
 
 
 def is_version_available(version):
-    """Check if a version is available for download."""
-    url = f"https://terraria.org/api/download/pc-dedicated-server/terraria-server-{version}.zip"
+    """Check if a version is available for download.
+
+    Transient failures (timeouts, connection errors, 429, 5xx) are retried with
+    backoff, and a probe slower than usual is hedged with a duplicate.
+
+    Returns:
+        True if the archive exists, False if terraria.org (or the mirror)
+        answered that it does not (404/410), or None if there was no definite answer. None is falsy,
+        but callers deciding what the latest version is must not take it for
+        False.
+    """
+    available = _check_available(version)
+    tracing.probe(version, available)
+    return available
+
+
+def _check_available(version):
+    """is_version_available() without the probe count."""
+    if mirror.local_dir() is not None:
+        try:
+            return mirror.has_version(version)
+        except (OSError, ValueError):
+            return None
+    url = mirror.archive_url(mirror.filename_for(version))
 
     try:
         # Try HEAD request first (more efficient)
-        req = urllib.request.Request(url, method='HEAD')
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-
         try:
-            urllib.request.urlopen(req, timeout=10)
+            http_pool.request_with_retries(url, method='HEAD', hedge=PROBE_LATENCY).close()
             return True
         except urllib.error.HTTPError as e:
-            # If HEAD is not supported, try GET
+            # If HEAD is not supported, try GET. Only the status matters, so the
+            # body is not read and the connection is dropped on close.
             if e.code == 405:
-                req = urllib.request.Request(url)
-                req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-                urllib.request.urlopen(req, timeout=10)
+                http_pool.request_with_retries(url).close()
                 return True
-            return False
-    except (urllib.error.URLError, urllib.error.HTTPError, Exception):
-        return False
+            raise
+    except urllib.error.HTTPError as e:
+        return False if e.code in ABSENT_STATUSES else None
+    except Exception:
+        return None
 
 
-def find_highest_version():
-    """Find the highest available Terraria version.
+def probe_versions(versions, jobs):
+    """Check several versions concurrently.
 
-    Systematically searches for the highest version by:
-    1. Finding the highest major version
-    2. Finding the highest minor version within that major
-    3. Finding the highest hotfix version within that minor
+    Args:
+        versions: Iterable of version strings to check
+        jobs: Maximum number of requests in flight
 
     Returns:
-        String of highest available version found
+        Dict mapping each version string to its availability (see is_version_available())
     """
+    versions = list(dict.fromkeys(versions))
+    if not versions:
+        return {}
 
-    base_version = get_base_version()
-    if base_version is None:
-        # If scraping failed, use the default version
-        print(f"Base version from web scraper: could not find anything, using default version {DEFAULT_VERSION}")
-        base_version = DEFAULT_VERSION
-    else:
-        print(f"Base version from web scraper: {base_version}")
+    with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(versions)))) as pool:
+        return dict(zip(versions, pool.map(http_pool.in_context(is_version_available), versions)))
 
-    base_int = version_to_int(base_version)
-    base_str = str(base_int).zfill(4)  # Ensure 4 digits
 
-    # Parse base version components (assume format: 1Mmh where M=major, m=minor, h=hotfix)
-    if len(base_str) < 4:
-        print(f"Error: Invalid version format '{base_version}'", file=sys.stderr)
-        return base_version
+def get_api_version():
+    """Get the newest version listed by the dedicated-servers-names API.
 
-    major = int(base_str[1])
-    minor = int(base_str[2])
-    hotfix = int(base_str[3])
+    Returns the version string on success, or None on failure.
+    """
+    filename = get_latest_filename.get_latest_filename()
+    match = re.fullmatch(r'terraria-server-(\d+)\.zip', filename or '')
+    return match.group(1) if match else None
 
-    print(f"Starting search from base version {base_version} (1.{major}.{minor}.{hotfix})")
+
+def gallop(lo, is_available, limit=9, prefetch=None):
+    """Find the highest digit in [lo, limit] that is available, given that lo is.
+
+    Like the linear walk, assumes the available digits form a contiguous run
+    starting at lo. Probes lo+1, lo+2, lo+4, ... until one is missing, then
+    bisects the gap. No change or a single increment (the usual hotfix) costs
+    the same as counting up; an increment of n costs about 2*log2(n) probes
+    instead of n + 1, which is one more for n = 2 or 4 and fewer from 6 up.
+
+    Args:
+        lo: Digit known to be available
+        is_available: Callable taking a digit and returning its availability
+        limit: Highest possible digit
+        prefetch: Optional callable given the doubling candidates up front
+
+    Returns:
+        The highest available digit
+    """
+    candidates = []
+    step = 1
+    while lo + step < limit:
+        candidates.append(lo + step)
+        step *= 2
+    if lo < limit:
+        candidates.append(limit)
+    if prefetch is not None:
+        prefetch(candidates)
+
+    missing = None
+    for candidate in candidates:
+        if not is_available(candidate):
+            missing = candidate
+            break
+        lo = candidate
+    if missing is None:
+        return lo
+
+    while missing - lo > 1:
+        middle = (lo + missing) // 2
+        if is_available(middle):
+            lo = middle
+        else:
+            missing = middle
+    return lo
+
+
+def _linear_walk(major, minor, hotfix, probe, prefetch):
+    """Count each digit up from the base version until a probe fails.
+
+    Returns the (major, minor, hotfix) digits of the highest version found.
+    """
+    # Probe the whole frontier at once: next majors, next minors, remaining hotfixes
+    prefetch(
+        [str(int(f"1{m}00")) for m in range(major + 1, 10)]
+        + [str(int(f"1{major}{m}0")) for m in range(minor + 1, 10)]
+        + [str(int(f"1{major}{minor}{h}")) for h in range(hotfix + 1, 10)]
+    )
 
     # Step 1: Find highest major version
     print("\n=== Finding highest major version ===")
@@ -133,7 +319,7 @@ def find_highest_version():
         test_version = int(f"1{test_major}00")
         print(f"Testing major version 1.{test_major}.0.0 ({test_version})...", end=" ", flush=True)
 
-        if is_version_available(str(test_version)):
+        if probe(str(test_version)):
             print("✓ Available")
             highest_major = test_major
             test_major += 1
@@ -155,13 +341,14 @@ def find_highest_version():
     else:
         highest_minor = 0
         test_minor = 0
+        prefetch([str(int(f"1{highest_major}{m}0")) for m in range(0, 10)])
 
     while test_minor <= 9:  # Minor version can only be 0-9
         # Test version with highest major, test minor, hotfix=0
         test_version = int(f"1{highest_major}{test_minor}0")
         print(f"Testing minor version 1.{highest_major}.{test_minor}.0 ({test_version})...", end=" ", flush=True)
 
-        if is_version_available(str(test_version)):
+        if probe(str(test_version)):
             print("✓ Available")
             highest_minor = test_minor
             test_minor += 1
@@ -183,13 +370,14 @@ def find_highest_version():
     else:
         highest_hotfix = 0
         test_hotfix = 0
+        prefetch([str(int(f"1{highest_major}{highest_minor}{h}")) for h in range(0, 10)])
 
     while test_hotfix <= 9:  # Hotfix version can only be 0-9
         # Test version with highest major, highest minor, test hotfix
         test_version = int(f"1{highest_major}{highest_minor}{test_hotfix}")
         print(f"Testing hotfix version 1.{highest_major}.{highest_minor}.{test_hotfix} ({test_version})...", end=" ", flush=True)
 
-        if is_version_available(str(test_version)):
+        if probe(str(test_version)):
             print("✓ Available")
             highest_hotfix = test_hotfix
             test_hotfix += 1
@@ -197,12 +385,313 @@ def find_highest_version():
             print("✗ Not available")
             break
 
+    return highest_major, highest_minor, highest_hotfix
+
+
+def _gallop_walk(major, minor, hotfix, probe, prefetch):
+    """Gallop through each digit, reusing what earlier steps already confirmed.
+
+    After a major (or minor) bump, 1.M.0.0 (or 1.M.m.0) is already known to be
+    available, so the next digit starts from 0 without probing it again.
+    Returns the (major, minor, hotfix) digits of the highest version found.
+    """
+    def search(level, start, make_version):
+        def available(digit):
+            version = make_version(digit)
+            print(f"Testing {level} version {'.'.join(str(version))} ({version})...", end=" ", flush=True)
+            result = probe(str(version))
+            print("✓ Available" if result else "✗ Not available")
+            return result
+
+        print(f"\n=== Finding highest {level} version ===")
+        return gallop(start, available, prefetch=lambda digits: prefetch([str(make_version(d)) for d in digits]))
+
+    highest_major = search("major", major, lambda d: int(f"1{d}00"))
+    print(f"Highest major version: 1.{highest_major}.x.x")
+
+    start = minor if highest_major == major else 0
+    highest_minor = search("minor", start, lambda d: int(f"1{highest_major}{d}0"))
+    print(f"Highest minor version: 1.{highest_major}.{highest_minor}.x")
+
+    start = hotfix if (highest_major, highest_minor) == (major, minor) else 0
+    highest_hotfix = search("hotfix", start, lambda d: int(f"1{highest_major}{highest_minor}{d}"))
+    return highest_major, highest_minor, highest_hotfix
+
+
+# Search strategies: name -> (where the base version comes from, how digits are searched).
+#   wiki:  Fandom wiki scrape (or its cached value)
+#   api:   dedicated-servers-names API, falling back to the wiki
+#   agree: both; no probes at all when they name the same version
+STRATEGIES = {
+    "linear": ("wiki", _linear_walk),
+    "gallop": ("wiki", _gallop_walk),
+    "api": ("api", _gallop_walk),
+    "agree": ("agree", _gallop_walk),
+}
+
+
+def find_highest_version(jobs=1, cache=None, strategy="linear", stats=None):
+    """Find the highest available Terraria version.
+
+    Systematically searches for the highest version by:
+    1. Finding the highest major version
+    2. Finding the highest minor version within that major
+    3. Finding the highest hotfix version within that minor
+
+    The strategy (see STRATEGIES) picks the source of the base version and how
+    each digit is searched. "linear" counts up one digit at a time; the others
+    gallop and can start from the dedicated-servers-names API, or stop right
+    away when the API and the wiki agree.
+
+    With jobs > 1, every candidate of a step (and, for the linear walk, the whole
+    frontier above the base version) is probed concurrently before the step
+    walks through the results. The walk itself is unchanged, so the answer is
+    identical to the sequential search.
+
+    When a ProbeCache is given, a fresh cached base version replaces the wiki
+    scrape, the search starts from the highest version already confirmed, and
+    cached probe results are reused instead of being requested again.
+
+    Args:
+        jobs: Maximum number of concurrent availability checks (1 = sequential)
+        cache: Optional probe_cache.ProbeCache
+        strategy: Name of the search strategy
+        stats: Optional dict filled with the strategy name, the number of
+            availability requests ("probes") and of cached answers used ("cached")
+
+    Returns:
+        String of highest available version found, or None if a probe the
+        answer depends on got no definite answer, even after retries
+    """
+    seed, walk = STRATEGIES[strategy]
+    if stats is None:
+        stats = {}
+    stats.update(strategy=strategy, probes=0, cached=0)
+
+    api_version = None
+    if seed in ("api", "agree"):
+        api_version = get_api_version()
+        if api_version is None:
+            print("Base version from dedicated-servers-names API: could not find anything")
+        else:
+            print(f"Base version from dedicated-servers-names API: {api_version}")
+
+    if seed == "api" and api_version is not None:
+        base_version = api_version
+    else:
+        base_version = cache.get_base_version() if cache is not None else None
+        if base_version is not None:
+            print(f"Base version from cache: {base_version}")
+        else:
+            base_version = get_base_version(cache)
+            if base_version is None:
+                # If scraping failed, use the default version
+                print(f"Base version from web scraper: could not find anything, using default version {DEFAULT_VERSION}")
+                base_version = DEFAULT_VERSION
+            else:
+                print(f"Base version from web scraper: {base_version}")
+                if cache is not None:
+                    cache.set_base_version(base_version)
+
+    agreed = seed == "agree" and api_version is not None and version_to_int(api_version) == version_to_int(base_version)
+    if seed == "agree" and api_version is not None and version_to_int(api_version) > version_to_int(base_version):
+        base_version = api_version
+
+    # Confirmed versions never disappear, so start above the highest one we know of
+    if cache is not None:
+        highest_hit = cache.highest_hit()
+        if highest_hit is not None and version_to_int(highest_hit) > version_to_int(base_version):
+            print(f"Highest cached available version: {highest_hit}")
+            base_version = highest_hit
+            agreed = False
+
+    if agreed:
+        print(f"\nAPI and web scraper agree on {base_version}, skipping the probe search")
+        if cache is not None:
+            cache.save()
+        return base_version
+
+    base_int = version_to_int(base_version)
+    base_str = str(base_int).zfill(4)  # Ensure 4 digits
+
+    # Parse base version components (assume format: 1Mmh where M=major, m=minor, h=hotfix)
+    if len(base_str) < 4:
+        print(f"Error: Invalid version format '{base_version}'", file=sys.stderr)
+        return base_version
+
+    major = int(base_str[1])
+    minor = int(base_str[2])
+    hotfix = int(base_str[3])
+
+    print(f"Starting search from base version {base_version} (1.{major}.{minor}.{hotfix})")
+
+    # Results of concurrent probes. Stays empty in sequential mode.
+    known = {}
+
+    def cached(version):
+        return cache.lookup(version) if cache is not None else None
+
+    def probe(version):
+        if version in known:
+            result = known[version]
+        else:
+            result = cached(version)
+            if result is not None:
+                stats["cached"] += 1
+            else:
+                result = is_version_available(version)
+                stats["probes"] += 1
+                if cache is not None and result is not None:
+                    cache.record(version, result)
+        if result is None:
+            raise UnknownAvailability(version)
+        return result
+
+    def prefetch(versions):
+        if jobs > 1:
+            pending = [v for v in versions if v not in known and cached(v) is None]
+            results = probe_versions(pending, jobs)
+            stats["probes"] += len(results)
+            known.update(results)
+            if cache is not None:
+                for version, available in results.items():
+                    if available is not None:
+                        cache.record(version, available)
+
+    # An unanswered probe would make the walk stop early and report an older
+    # version as the latest, so the search gives up instead
+    try:
+        with tracing.phase("probe_search", strategy=strategy):
+            highest_major, highest_minor, highest_hotfix = walk(major, minor, hotfix, probe, prefetch)
+    except UnknownAvailability as e:
+        print(f"Error: could not tell whether {e} is available, not guessing the latest version", file=sys.stderr)
+        if cache is not None:
+            cache.save()
+        return None
+
     highest_version = str(int(f"1{highest_major}{highest_minor}{highest_hotfix}"))
     print(f"\nHighest available version found: {highest_version} (1.{highest_major}.{highest_minor}.{highest_hotfix})")
 
+    if cache is not None:
+        cache.save()
+
     return highest_version
 
 
+def next_candidates(version):
+    """Return the next hotfix, minor and major versions after version.
+
+    Digits already at 9 have no successor, so at most three versions are
+    returned, e.g. 1452 -> ['1453', '1460', '1500'].
+    """
+    major, minor, hotfix = (int(d) for d in str(version_to_int(version)).zfill(4)[1:])
+    candidates = []
+    if hotfix < 9:
+        candidates.append(f"1{major}{minor}{hotfix + 1}")
+    if minor < 9:
+        candidates.append(f"1{major}{minor + 1}0")
+    if major < 9:
+        candidates.append(f"1{major + 1}00")
+    return candidates
+
+
+def check_for_update(last_version, cache=None):
+    """Check whether anything newer than last_version has been published.
+
+    Meant to be cheap enough for a frequent trigger: the wiki is fetched with a
+    conditional request (a 304 when it has not changed and a ProbeCache holds
+    its validators) while the next hotfix, minor and major versions are probed
+    once each, all concurrently. Cached hits are trusted, cached misses are not,
+    since a missing version may be published at any time.
+
+    Args:
+        last_version: Last published version string, e.g. '1452'
+        cache: Optional probe_cache.ProbeCache
+
+    Returns:
+        The newest version seen above last_version, last_version itself if
+        every probe came back missing, or None if some probe got no answer
+    """
+    last_int = version_to_int(last_version)
+    candidates = next_candidates(last_version)
+    print(f"Checking for a release after {last_version}: wiki and {', '.join(candidates) or 'no candidates'}")
+
+    def probe(version):
+        if cache is not None and cache.lookup(version):
+            return True
+        return is_version_available(version)
+
+    with tracing.phase("update_check"), ThreadPoolExecutor(max_workers=len(candidates) + 1) as pool:
+        wiki = pool.submit(http_pool.in_context(get_base_version), cache)
+        results = dict(zip(candidates, pool.map(http_pool.in_context(probe), candidates)))
+        base_version = wiki.result()
+
+    if cache is not None:
+        for version, available in results.items():
+            if available is not None:
+                cache.record(version, available)
+        cache.save()
+
+    newer = [version_to_int(v) for v, available in results.items() if available]
+    if base_version is None:
+        print("Wiki: could not find anything")
+    else:
+        print(f"Wiki links {base_version}")
+        if version_to_int(base_version) > last_int:
+            newer.append(version_to_int(base_version))
+    if newer:
+        return int_to_version(max(newer))
+
+    unanswered = [v for v, available in results.items() if available is None]
+    if unanswered:
+        print(f"Error: no answer for {', '.join(unanswered)}", file=sys.stderr)
+        return None
+    return int_to_version(last_int)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Find the latest available Terraria dedicated server version.")
+    parser.add_argument("-s", "--strategy", choices=list(STRATEGIES), default="linear",
+                        help="search strategy (default: linear)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="maximum number of concurrent version probes (default: 1, sequential)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ignore and do not update the on-disk probe cache")
+    parser.add_argument("--cache-file", default=None,
+                        help="probe cache location (default: $TERRARIA_CACHE_DIR/probe-cache.json)")
+    parser.add_argument("--check-only", metavar="VERSION", default=None,
+                        help="only check whether a version newer than VERSION (the last published one) exists; "
+                             f"exits with {NOTHING_NEW_EXIT} when there is none")
+    parser.add_argument("--hit-ttl", type=int, default=probe_cache.DEFAULT_HIT_TTL,
+                        help="seconds an available version stays cached")
+    parser.add_argument("--miss-ttl", type=int, default=probe_cache.DEFAULT_MISS_TTL,
+                        help="seconds an unavailable version stays cached")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="write request timings and metrics to FILE, JSON lines or OpenMetrics for .prom "
+                             "(default: $TERRARIA_TRACE, unset disables tracing)")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.check_only is not None and not re.fullmatch(r"1\d{3}", args.check_only):
+        parser.error("--check-only takes a version like 1452")
+    return args
+
+
 if __name__ == "__main__":
-    latest = find_highest_version()
+    args = parse_args()
+    tracing.setup(args.trace)
+    cache = None
+    if not args.no_cache:
+        cache = probe_cache.ProbeCache(args.cache_file, hit_ttl=args.hit_ttl, miss_ttl=args.miss_ttl)
+    if args.check_only is not None:
+        latest = check_for_update(args.check_only, cache=cache)
+        if latest is None:
+            sys.exit(1)
+        print(latest)
+        sys.exit(NOTHING_NEW_EXIT if latest == int_to_version(version_to_int(args.check_only)) else 0)
+    stats = {}
+    latest = find_highest_version(jobs=args.jobs, cache=cache, strategy=args.strategy, stats=stats)
+    print(f"Strategy {stats['strategy']}: {stats['probes']} probes, {stats['cached']} cached answers", file=sys.stderr)
+    if latest is None:
+        sys.exit(1)
     print(latest)
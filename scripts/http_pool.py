@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for the download and version discovery scripts.
+
+Keeps persistent http.client connections pooled per host so that repeated
+requests to terraria.org (version probes, the filename API, the download
+itself) reuse one TCP/TLS session instead of paying a new handshake each time.
+It also holds the settings every script used to repeat: the User-Agent,
+the default timeout and the retry policy for dropped keep-alive connections.
+
+Errors are reported with the same exception types as urllib.request.urlopen
+(urllib.error.HTTPError for 4xx/5xx statuses, urllib.error.URLError for
+connection failures), so callers keep their existing error handling.
+
+request_with_retries() adds the policy for flaky answers: transient failures
+(timeouts, connection errors, 408/425/429/5xx) are retried with jittered
+exponential backoff while definite answers such as a 404 are not, and small
+idempotent requests can be hedged with a duplicate once they take longer than
+the usual latency.
+
+A CallScope installed in the current context (see use_scope()) puts every
+request of a call under one deadline, one cancellation switch and a shared
+limit on requests in flight. The asyncio API (async_api.py) uses it to run the
+sync code in worker threads; without a scope nothing changes.
+
+With tracing on (see tracing.py), each request records how long name
+resolution, connecting, the first response byte and the body transfer took.
+"""
+
+import collections
+import contextlib
+import contextvars
+import http.client
+import math
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import tracing
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+DEFAULT_TIMEOUT = 10
+MAX_REDIRECTS = 5
+MAX_IDLE_PER_HOST = 4
+
+# Number of extra attempts for idempotent requests whose connection fails,
+# e.g. when the server has closed an idle keep-alive connection.
+RETRIES = 1
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+CONNECTION_ERRORS = (http.client.HTTPException, OSError)
+# Longest wait for a limiter slot between two checks for cancellation
+SLOT_POLL_INTERVAL = 0.05
+
+# request_with_retries(): attempts in total, and the backoff before attempt n + 1,
+# drawn uniformly from [0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** n)]
+RETRY_ATTEMPTS = 3
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 2.0
+MAX_RETRY_AFTER = 10
+TRANSIENT_STATUSES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+# Hedging: a duplicate goes out once a request has taken longer than this
+# percentile of recent latencies (HEDGE_DEFAULT_DELAY until enough are known)
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 8
+HEDGE_DEFAULT_DELAY = 1.0
+HEDGE_MIN_DELAY = 0.05
+HEDGE_WORKERS = 32
+
+
+class RequestCancelled(urllib.error.URLError):
+    """The call a request belongs to was cancelled or ran out of time."""
+
+
+class CallScope:
+    """Deadline, cancellation and concurrency limit shared by the requests of one call.
+
+    deadline is a time.monotonic() value or None. limiter is an object with
+    acquire(timeout=...) and release(), such as a threading.BoundedSemaphore,
+    shared by every scope that should count against the same limit; each
+    request holds one slot from before it is sent until its response is closed.
+
+    cancel() can be called from any thread: requests not yet sent raise
+    RequestCancelled, and the sockets of requests in progress are shut down so
+    blocked reads return at once. expired tells whether a request was refused
+    because the deadline had passed.
+    """
+
+    def __init__(self, deadline=None, limiter=None):
+        self.deadline = deadline
+        self.limiter = limiter
+        self.cancelled = threading.Event()
+        self.expired = False
+        self._lock = threading.Lock()
+        self._active = set()
+
+    def check(self):
+        """Raise RequestCancelled if the call was cancelled or its deadline has passed."""
+        if self.cancelled.is_set():
+            raise RequestCancelled("request cancelled")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.expired = True
+            raise RequestCancelled("deadline exceeded")
+
+    def timeout(self, timeout):
+        """Cap a socket timeout to the time left before the deadline."""
+        self.check()
+        if self.deadline is None:
+            return timeout
+        remaining = self.deadline - time.monotonic()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def acquire_slot(self):
+        if self.limiter is None:
+            return
+        while not self.limiter.acquire(timeout=min(SLOT_POLL_INTERVAL, self.timeout(SLOT_POLL_INTERVAL))):
+            self.check()
+
+    def release_slot(self):
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def attach(self, conn):
+        with self._lock:
+            self._active.add(conn)
+        # cancel() may have run between the check before sending and attach()
+        if self.cancelled.is_set():
+            _shutdown(conn)
+
+    def detach(self, conn):
+        with self._lock:
+            self._active.discard(conn)
+
+    def cancel(self):
+        """Cancel the call: fail new requests and interrupt the ones in progress."""
+        self.cancelled.set()
+        with self._lock:
+            active = list(self._active)
+        for conn in active:
+            _shutdown(conn)
+
+
+_scope = contextvars.ContextVar("http_pool_scope", default=None)
+
+
+def current_scope():
+    """Return the CallScope of the current context, or None."""
+    return _scope.get()
+
+
+@contextlib.contextmanager
+def use_scope(scope):
+    """Run the requests made in this block (and in_context() workers) under scope."""
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def in_context(func):
+    """Wrap func to run in a copy of the caller's context.
+
+    Thread pools do not carry contextvars over to their workers; wrapping the
+    function handed to submit()/map() keeps worker requests in the caller's
+    CallScope.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+    return run
+
+
+def _shutdown(conn):
+    sock = getattr(conn, 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class PooledResponse:
+    """Response wrapper that hands its connection back to the pool once done.
+
+    Behaves like the object returned by urllib.request.urlopen for the parts the
+    scripts use: read(), readinto(), status, headers, getheader(), url and use as
+    a context manager.
+    """
+
+    def __init__(self, pool, key, conn, response, url, scope=None, timing=None):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._scope = scope
+        self._timing = timing
+        self._holds_slot = False
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def getcode(self):
+        return self.status
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, amt=None):
+        if self._scope is not None:
+            self._scope.check()
+        data = self._response.read(amt)
+        if self._timing is not None:
+            self._timing.bytes += len(data)
+        if amt is None or not data:
+            self.close()
+        return data
+
+    def readinto(self, buffer):
+        if self._scope is not None:
+            self._scope.check()
+        n = self._response.readinto(buffer)
+        if self._timing is not None:
+            self._timing.bytes += n
+        if n == 0:
+            self.close()
+        return n
+
+    def close(self):
+        """Release the connection: back to the pool if fully read, closed otherwise."""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        tracing.end_request(self._timing, self.status)
+        if self._scope is not None:
+            cancelled = self._scope.cancelled.is_set()
+            self._scope.detach(conn)
+            if self._holds_slot:
+                self._scope.release_slot()
+            if cancelled:
+                # The socket may have been shut down under the response
+                self._response.close()
+                self._pool.release(self._key, conn, False)
+                return
+        self._pool.release(self._key, conn, _finish(self._response))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """Per-host pool of idle keep-alive connections."""
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+
+    def _new_connection(self, scheme, host, port, timeout):
+        proxy = _proxy_for(scheme, host)
+        if proxy is None:
+            conn_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = conn_class(host, port, timeout=timeout)
+        else:
+            proxy_parts = urllib.parse.urlsplit(proxy)
+            proxy_class = http.client.HTTPSConnection if proxy_parts.scheme == 'https' else http.client.HTTPConnection
+            if scheme == 'https':
+                conn = proxy_class(proxy_parts.hostname, proxy_parts.port or 8080, timeout=timeout)
+                conn.set_tunnel(host, port)
+            else:
+                conn = proxy_class(proxy_parts.hostname, proxy_parts.port or 8080, timeout=timeout)
+                conn.via_proxy = True
+        with self._lock:
+            self.connections_opened += 1
+        return conn
+
+    def acquire(self, scheme, host, port, timeout):
+        """Return (connection, reused) for the given origin."""
+        key = (scheme, host, port)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                conn = idle.pop()
+            conn.timeout = timeout
+            try:
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+            except OSError:
+                conn.close()
+                continue
+            return conn, True
+        return self._new_connection(scheme, host, port, timeout), False
+
+    def release(self, key, conn, reusable=True):
+        """Return a connection to the pool, or close it."""
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def request(self, url, method='GET', headers=None, timeout=DEFAULT_TIMEOUT, retries=RETRIES):
+        """Send a request and return a PooledResponse.
+
+        Follows redirects, raises urllib.error.HTTPError for 4xx/5xx responses and
+        urllib.error.URLError when the server cannot be reached.
+        """
+        all_headers = {'User-Agent': USER_AGENT}
+        if headers:
+            all_headers.update(headers)
+
+        scope = _scope.get()
+        if scope is not None:
+            scope.acquire_slot()
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                response = self._send(url, method, all_headers, timeout, retries, scope)
+                if response.status in REDIRECT_CODES and response.getheader('Location'):
+                    location = urllib.parse.urljoin(url, response.getheader('Location'))
+                    response.close()
+                    if response.status == 303 and method != 'HEAD':
+                        method = 'GET'
+                    url = location
+                    continue
+                if response.status >= 400:
+                    response.close()
+                    raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+                # The slot is given back when the caller closes the response
+                response._holds_slot = True
+                return response
+
+            raise urllib.error.URLError(f"Too many redirects for {url}")
+        except BaseException:
+            if scope is not None:
+                scope.release_slot()
+            raise
+
+    def _send(self, url, method, headers, timeout, retries, scope=None):
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise urllib.error.URLError(f"Unsupported URL scheme: {url}")
+        host = parts.hostname
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, host, port)
+        target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+        attempts_left = 1 + (retries if method in IDEMPOTENT_METHODS else 0)
+        while True:
+            if scope is not None:
+                timeout = scope.timeout(timeout)
+            conn, reused = self.acquire(scheme, host, port, timeout)
+            path = url if getattr(conn, 'via_proxy', False) else target
+            if scope is not None:
+                scope.attach(conn)
+            timing = tracing.start_request(method, url, reused)
+            try:
+                if timing is not None and conn.sock is None:
+                    _timed_connect(conn, timing)
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+            except socket.timeout as e:
+                tracing.end_request(timing, error=e)
+                conn.close()
+                if scope is not None:
+                    scope.detach(conn)
+                    scope.check()
+                raise
+            except CONNECTION_ERRORS as e:
+                tracing.end_request(timing, error=e)
+                conn.close()
+                if scope is not None:
+                    scope.detach(conn)
+                    scope.check()
+                # A stale pooled connection does not count as an attempt
+                if not reused:
+                    attempts_left -= 1
+                if attempts_left <= 0:
+                    raise urllib.error.URLError(e)
+                continue
+            if timing is not None:
+                timing.ttfb = timing.lap()
+            return PooledResponse(self, key, conn, response, url, scope, timing)
+
+
+def _timed_connect(conn, timing):
+    """Open conn, timing name resolution apart from the TCP (and TLS) connect."""
+    def create_connection(address, *args, **kwargs):
+        host, port = address
+        started = time.perf_counter()
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        timing.dns = time.perf_counter() - started
+        error = OSError(f"getaddrinfo returned no address for {host}")
+        for *_, sockaddr in addresses:
+            try:
+                return socket.create_connection(sockaddr[:2], *args, **kwargs)
+            except OSError as e:
+                error = e
+        raise error
+
+    conn._create_connection = create_connection
+    try:
+        conn.connect()
+    finally:
+        conn._create_connection = socket.create_connection
+    # The next lap, the time to first byte, starts once connected
+    timing.connect = timing.lap() - (timing.dns or 0)
+
+
+def _finish(response, limit=64 * 1024):
+    """Read away a small unread body and close the response.
+
+    Returns True when the connection is left in a state where it can be reused.
+    """
+    try:
+        while not response.isclosed() and limit > 0:
+            chunk = response.read(min(limit, 16 * 1024))
+            if not chunk:
+                break
+            limit -= len(chunk)
+        reusable = response.isclosed() and not response.will_close
+    except CONNECTION_ERRORS:
+        reusable = False
+    response.close()
+    return reusable
+
+
+def _proxy_for(scheme, host):
+    """Return the proxy URL configured in the environment for this host, if any."""
+    if urllib.request.proxy_bypass(host):
+        return None
+    return urllib.request.getproxies().get(scheme)
+
+
+def is_transient(error):
+    """True for failures worth retrying: no answer at all, or a status saying "try again later"."""
+    if isinstance(error, RequestCancelled):
+        return False
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code in TRANSIENT_STATUSES
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+def backoff_delay(attempt, error=None, rng=random):
+    """Seconds to wait before retrying after failed attempt number attempt (from 0).
+
+    Full jitter, so clients that failed together do not retry together. A
+    Retry-After header on the error is honored up to MAX_RETRY_AFTER seconds.
+    """
+    delay = rng.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    retry_after = getattr(error, 'headers', None) and error.headers.get('Retry-After')
+    if retry_after and retry_after.strip().isdigit():
+        delay = max(delay, min(int(retry_after), MAX_RETRY_AFTER))
+    return delay
+
+
+def _sleep(delay):
+    """time.sleep() that wakes up on cancellation and never sleeps past the deadline."""
+    scope = _scope.get()
+    if scope is None:
+        time.sleep(delay)
+        return
+    scope.cancelled.wait(scope.timeout(delay))
+    scope.check()
+
+
+class LatencyTracker:
+    """Recent latencies of one kind of request, to decide when to hedge it."""
+
+    def __init__(self, size=64):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def hedge_delay(self):
+        """Seconds after which a request of this kind is slower than usual."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        index = max(0, math.ceil(HEDGE_PERCENTILE * len(samples)) - 1)
+        return max(HEDGE_MIN_DELAY, samples[index])
+
+
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='http-hedge')
+
+
+def _discard(future):
+    """Close the response of a hedged request that lost the race."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _hedged(send, tracker):
+    """Call send(), and once more if the first call is slower than tracker's hedge delay.
+
+    The first definite outcome wins: a response, or an error that is not
+    transient (a 404 is an answer). If every call fails transiently, the first
+    error is raised.
+    """
+    def timed():
+        started = time.monotonic()
+        response = send()
+        tracker.record(time.monotonic() - started)
+        return response
+
+    futures = [_hedge_executor.submit(in_context(timed))]
+    done, _ = wait(futures, timeout=tracker.hedge_delay())
+    if not done:
+        futures.append(_hedge_executor.submit(in_context(timed)))
+
+    pending = set(futures)
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is None or not is_transient(error):
+                for other in futures:
+                    if other is not future:
+                        other.add_done_callback(_discard)
+                return future.result()
+            first_error = first_error or error
+    raise first_error
+
+
+def request_with_retries(url, method='GET', headers=None, timeout=DEFAULT_TIMEOUT, attempts=RETRY_ATTEMPTS,
+                         hedge=None):
+    """request() with retries of transient failures and optional hedging.
+
+    Transient failures (see is_transient()) are retried up to attempts times in
+    total with jittered exponential backoff; other errors, such as a 404, are
+    raised at once. With a LatencyTracker as hedge, each attempt that is still
+    unanswered after the tracker's hedge delay is duplicated and the first
+    answer is used. Only hedge idempotent requests with small bodies.
+    """
+    for attempt in range(attempts):
+        try:
+            if hedge is None:
+                return request(url, method=method, headers=headers, timeout=timeout)
+            return _hedged(lambda: request(url, method=method, headers=headers, timeout=timeout), hedge)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            _sleep(backoff_delay(attempt, e))
+
+
+_default_pool = ConnectionPool()
+
+
+def get_pool():
+    """Return the process-wide connection pool."""
+    return _default_pool
+
+
+def request(url, method='GET', headers=None, timeout=DEFAULT_TIMEOUT, retries=RETRIES):
+    """Send a request through the process-wide pool. See ConnectionPool.request."""
+    return _default_pool.request(url, method=method, headers=headers, timeout=timeout, retries=retries)
+
+
+def close_all():
+    """Close every idle connection of the process-wide pool."""
+    _default_pool.close_all()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+TCP front proxy that starts the server on demand and hibernates it when idle.
+
+    python3 idle_proxy.py --listen-port 7777 --server-port 17777 --idle-timeout 600 \\
+        [--idle-action suspend|stop] -- ./TerrariaServer.bin.x86_64 -config server-config.conf
+
+The proxy listens on the public port; the server, configured with the
+internal port, is only started when the first player connects, and
+connections are forwarded to it once it accepts them. After --idle-timeout
+seconds without connections the server is either suspended (SIGSTOP: no
+CPU, and SIGCONT wakes it in an instant) or stopped with the "exit" console
+command, which saves the world and frees its memory, at the cost of loading
+the world again on the next connection.
+
+The init-TerrariaServer-*.sh entrypoints run the server behind it when the
+idletimeout environment variable is set (see the README). SIGTERM and SIGINT
+stop the server the same way and exit. It runs on Python 3.7, the version of
+the arm64 (mono) image.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ACTIONS = ("suspend", "stop")
+NATIVE_SERVER = "TerrariaServer.bin.x86_64"
+MONO_SERVER = "TerrariaServer.exe"
+DEFAULT_SERVER_PORT = 17777
+# Loading a large world can take a while before the server accepts connections
+START_TIMEOUT = 180.0
+STOP_TIMEOUT = 8.0
+CONNECT_RETRY_INTERVAL = 0.2
+POLL_INTERVAL = 0.5
+BUFFER_SIZE = 64 * 1024
+
+
+class BackendUnavailable(Exception):
+    """The server could not be started or reached."""
+
+
+def listen_socket(host, port):
+    """A listening TCP socket; socket.create_server() needs Python 3.8."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen()
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def server_command(working_dir="."):
+    """The command starting one server in working_dir: the native binary, or the mono one on arm64."""
+    if os.path.exists(os.path.join(working_dir, NATIVE_SERVER)):
+        return [f"./{NATIVE_SERVER}"]
+    return ["mono", "--server", "--gc=sgen", "-O=all", f"./{MONO_SERVER}"]
+
+
+class Backend:
+    """The server process behind the proxy, started, suspended and stopped on demand."""
+
+    def __init__(self, command, port, host="127.0.0.1", start_timeout=START_TIMEOUT, stop_timeout=STOP_TIMEOUT):
+        self.command = command
+        self.host = host
+        self.port = port
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.process = None
+        self.suspended = False
+        self.starts = 0
+        self._lock = threading.Lock()
+
+    def running(self):
+        """True while the process is alive, suspended or not."""
+        return self.process is not None and self.process.poll() is None
+
+    def awake(self):
+        return self.running() and not self.suspended
+
+    def ensure_running(self):
+        """Start or resume the server and wait until it accepts connections."""
+        with self._lock:
+            if self.running():
+                if self.suspended:
+                    print("Resuming the server", flush=True)
+                    self.process.send_signal(signal.SIGCONT)
+                    self.suspended = False
+                return
+            print(f"Starting the server: {' '.join(self.command)}", flush=True)
+            try:
+                self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE)
+            except OSError as e:
+                raise BackendUnavailable(f"could not start the server: {e}") from e
+            self.suspended = False
+            self.starts += 1
+            self._wait_ready()
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + self.start_timeout
+        while True:
+            if self.process.poll() is not None:
+                raise BackendUnavailable(f"the server exited with status {self.process.returncode} while starting")
+            try:
+                socket.create_connection((self.host, self.port), timeout=CONNECT_RETRY_INTERVAL).close()
+                print(f"Server is accepting connections on port {self.port}", flush=True)
+                return
+            except OSError:
+                pass
+            if time.monotonic() >= deadline:
+                self._stop()
+                raise BackendUnavailable(f"the server did not open port {self.port} within {self.start_timeout:g}s")
+            time.sleep(CONNECT_RETRY_INTERVAL)
+
+    def connect(self):
+        try:
+            return socket.create_connection((self.host, self.port), timeout=self.start_timeout)
+        except OSError as e:
+            raise BackendUnavailable(f"could not connect to the server: {e}") from e
+
+    def suspend(self):
+        with self._lock:
+            if self.awake():
+                self.process.send_signal(signal.SIGSTOP)
+                self.suspended = True
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+    def stop_if(self, condition):
+        """Stop the server if condition() holds once no other start or stop is under way; True if it did."""
+        with self._lock:
+            if not condition():
+                return False
+            self._stop()
+            return True
+
+    def _stop(self):
+        """Ask the server to save and exit, and kill it if it is still running after stop_timeout."""
+        if not self.running():
+            self.process = None
+            return
+        if self.suspended:
+            self.process.send_signal(signal.SIGCONT)
+            self.suspended = False
+        try:
+            self.process.stdin.write(b"exit\n")
+            self.process.stdin.flush()
+        except OSError:
+            pass
+        try:
+            self.process.wait(self.stop_timeout)
+        except subprocess.TimeoutExpired:
+            print("The server did not exit in time, killing it", file=sys.stderr, flush=True)
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+def _pump(src, dst):
+    """Copy src to dst until either side closes, then shut both down."""
+    try:
+        while True:
+            data = src.recv(BUFFER_SIZE)
+            if not data:
+                break
+            dst.sendall(data)
+    except OSError:
+        pass
+    finally:
+        for sock in (src, dst):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class IdleProxy:
+    """Accepts players on the public port and forwards them to the Backend."""
+
+    def __init__(self, backend, listen_port, listen_host="0.0.0.0", idle_timeout=600.0, idle_action="suspend"):
+        if idle_action not in ACTIONS:
+            raise ValueError(f"idle action must be one of {', '.join(ACTIONS)}")
+        self.backend = backend
+        self.idle_timeout = idle_timeout
+        self.idle_action = idle_action
+        self.active = 0
+        # Connections accepted so far, to tell whether one came in after an idle check
+        self.accepted = 0
+        self.last_activity = time.monotonic()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._idle_stop = None
+        self._listener = listen_socket(listen_host, listen_port)
+        self._listener.settimeout(POLL_INTERVAL)
+        self.address = self._listener.getsockname()
+
+    def serve_forever(self):
+        """Accept connections until shutdown(), hibernating the server whenever it is idle."""
+        print(f"Listening on port {self.address[1]}, the server starts with the first connection", flush=True)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    client, peer = self._listener.accept()
+                except socket.timeout:
+                    self.check_idle()
+                    continue
+                except OSError:
+                    if self._stopping.is_set():
+                        break
+                    raise
+                with self._lock:
+                    self.active += 1
+                    self.accepted += 1
+                threading.Thread(target=self._handle, args=(client, peer), daemon=True).start()
+        finally:
+            self._listener.close()
+            self.backend.stop()
+
+    def shutdown(self):
+        self._stopping.set()
+
+    def check_idle(self, now=None):
+        """Suspend or stop the server once it has had no connection for idle_timeout seconds.
+
+        A stop can take up to stop_timeout, so it runs on its own thread and
+        accepting goes on. A connection accepted before the stop starts
+        cancels it; one accepted while it runs waits for it in
+        Backend.ensure_running() and starts the server again.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = self.active == 0 and now - self.last_activity >= self.idle_timeout
+            accepted = self.accepted
+        if not idle or not self.backend.awake():
+            return
+        if self.idle_action == "suspend":
+            print(f"No connections for {self.idle_timeout:g}s, suspending the server", flush=True)
+            self.backend.suspend()
+        elif self._idle_stop is None or not self._idle_stop.is_alive():
+            print(f"No connections for {self.idle_timeout:g}s, stopping the server", flush=True)
+            self._idle_stop = threading.Thread(target=self._stop_if_idle, args=(accepted,), daemon=True)
+            self._idle_stop.start()
+
+    def _stop_if_idle(self, accepted):
+        """Stop the server unless a connection was accepted since check_idle() found it idle.
+
+        The check runs under the Backend lock, so a connection accepted just
+        before cannot have gone through ensure_running() to a server about to stop.
+        """
+        def still_idle():
+            with self._lock:
+                return self.accepted == accepted
+
+        if not self.backend.stop_if(still_idle):
+            print("A connection came in, keeping the server running", flush=True)
+
+    def _handle(self, client, peer):
+        upstream = None
+        try:
+            self.backend.ensure_running()
+            upstream = self.backend.connect()
+            for sock in (client, upstream):
+                sock.settimeout(None)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            reply = threading.Thread(target=_pump, args=(upstream, client), daemon=True)
+            reply.start()
+            _pump(client, upstream)
+            reply.join()
+        except BackendUnavailable as e:
+            print(f"Error: dropping the connection from {peer[0]}: {e}", file=sys.stderr, flush=True)
+        finally:
+            client.close()
+            if upstream is not None:
+                upstream.close()
+            with self._lock:
+                self.active -= 1
+                self.last_activity = time.monotonic()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Start the server on the first connection and hibernate it when idle.")
+    parser.add_argument("--listen-port", type=int, default=7777, help="public port players connect to (default: 7777)")
+    parser.add_argument("--server-port", type=int, default=DEFAULT_SERVER_PORT,
+                        help=f"port the server is configured with (default: {DEFAULT_SERVER_PORT})")
+    parser.add_argument("--idle-timeout", type=float, default=600,
+                        help="seconds without connections before the server hibernates (default: 600)")
+    parser.add_argument("--idle-action", choices=ACTIONS, default="suspend",
+                        help="suspend the process (fast wake-up) or stop it (frees its memory) (default: suspend)")
+    parser.add_argument("--start-timeout", type=float, default=START_TIMEOUT,
+                        help=f"seconds to wait for the server to accept connections (default: {START_TIMEOUT:g})")
+    parser.add_argument("command", nargs=argparse.REMAINDER, help="server command, after --")
+    args = parser.parse_args(argv)
+    command = args.command[1:] if args.command[:1] == ["--"] else args.command
+    if not command:
+        parser.error("the server command is missing")
+    if args.listen_port == args.server_port:
+        parser.error("--listen-port and --server-port must differ")
+    if args.idle_timeout <= 0:
+        parser.error("--idle-timeout must be positive")
+
+    backend = Backend(command, args.server_port, start_timeout=args.start_timeout)
+    try:
+        proxy = IdleProxy(backend, args.listen_port, idle_timeout=args.idle_timeout, idle_action=args.idle_action)
+    except OSError as e:
+        print(f"Error: cannot listen on port {args.listen_port}: {e}", file=sys.stderr)
+        return 1
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: proxy.shutdown())
+    proxy.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,21 @@
 #!/bin/bash
 
-./create-server-config.sh;
+# With idletimeout set, idle_proxy.py takes the public port and starts the server on internalport
+if [ "${idletimeout:-0}" != "0" ]; then
+    server_port="${internalport:-17777}"
+    port="${server_port}" python3 create_server_config.py || exit 1
+else
+    python3 create_server_config.py || exit 1
+fi
+
+if [ "${verifyinstall:-0}" != "0" ]; then
+    python3 install_manifest.py verify || exit 1
+fi
+
+if [ "${idletimeout:-0}" != "0" ]; then
+    exec python3 idle_proxy.py --listen-port "${port:-7777}" --server-port "${server_port}" \
+        --idle-timeout "${idletimeout}" --idle-action "${idleaction:-suspend}" \
+        -- ./TerrariaServer.bin.x86_64 -config server-config.conf
+fi
 
 ./TerrariaServer.bin.x86_64 -config server-config.conf
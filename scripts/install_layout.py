@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Versioned install layout: servers are staged aside and switched atomically.
+
+    <dir>/.server-versions/<version>/    complete server trees, each with its manifest
+    <dir>/.server-versions/current       symlink to the active tree
+    <dir>/<entry> -> .server-versions/current/<entry>   one link per top-level entry
+
+prune_unused_files.py and upgrade.py build the new tree in a staging directory
+next to the installed ones, so on the same filesystem. commit() renames it
+into place and flips `current` with os.replace(), which is atomic, so the
+server sees either the old files or the new ones and a crash never leaves a
+half-installed server. Worlds, server-config.conf and the scripts stay plain
+files in <dir>.
+
+Previously active trees are kept for instant rollback, newest first, up to a
+retention count (TERRARIA_KEEP_VERSIONS, default 1):
+
+    python3 install_layout.py list [directory]
+    python3 install_layout.py rollback [directory]
+
+A flat install from an older version of these scripts is migrated on its first
+commit: its top-level server entries are replaced by the links.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import fileutil
+
+VERSIONS_DIR = ".server-versions"
+CURRENT_NAME = "current"
+STAGING_PREFIX = ".staging-"
+MANIFEST_NAME = "install-manifest.json"
+DEFAULT_KEEP = 1
+
+
+def keep_from_env():
+    """Number of previous versions to keep, from TERRARIA_KEEP_VERSIONS."""
+    return int(os.environ.get("TERRARIA_KEEP_VERSIONS", DEFAULT_KEEP))
+
+
+def versions_dir(working_dir):
+    return os.path.join(working_dir, VERSIONS_DIR)
+
+
+def current_name(working_dir):
+    """Name of the active version tree, or None for a flat (or no) install."""
+    try:
+        return os.readlink(os.path.join(versions_dir(working_dir), CURRENT_NAME))
+    except OSError:
+        return None
+
+
+def current_dir(working_dir):
+    """Path of the active version tree, or None for a flat (or no) install."""
+    name = current_name(working_dir)
+    return os.path.join(versions_dir(working_dir), name) if name else None
+
+
+def installed_versions(working_dir):
+    """Names of the installed trees, most recently activated first."""
+    base = versions_dir(working_dir)
+    try:
+        names = os.listdir(base)
+    except FileNotFoundError:
+        return []
+    trees = [name for name in names
+             if not name.startswith(".") and name != CURRENT_NAME and os.path.isdir(os.path.join(base, name))]
+    return sorted(trees, key=lambda name: os.stat(os.path.join(base, name)).st_mtime_ns, reverse=True)
+
+
+def new_staging(working_dir):
+    """Create an empty staging directory for the next tree.
+
+    Staging directories left behind by interrupted installs are removed first;
+    installs into the same directory must not run concurrently.
+    """
+    base = versions_dir(working_dir)
+    os.makedirs(base, exist_ok=True)
+    for name in os.listdir(base):
+        if name.startswith(STAGING_PREFIX):
+            shutil.rmtree(os.path.join(base, name), ignore_errors=True)
+    return tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=base)
+
+
+def _link_target(entry):
+    return os.path.join(VERSIONS_DIR, CURRENT_NAME, entry)
+
+
+def _is_our_link(path, entry):
+    return os.path.islink(path) and os.readlink(path) == _link_target(entry)
+
+
+def _replace_with_link(path, target):
+    """Atomically point path at target, replacing a file or link; directories are removed first."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    tmp_path = os.path.join(os.path.dirname(path), f".link-{os.getpid()}-{os.path.basename(path)}")
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(tmp_path)
+    os.symlink(target, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _legacy_entries(working_dir):
+    """Top-level entries listed by the manifest of a flat install, if there is one."""
+    path = os.path.join(working_dir, MANIFEST_NAME)
+    if os.path.islink(path) or not os.path.isfile(path):
+        return set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            files = json.load(f).get("files", {})
+    except (OSError, ValueError):
+        return set()
+    return {name.split("/")[0] for name in files}
+
+
+def activate(working_dir, name, keep=None):
+    """Make the installed tree name the active one.
+
+    Links for entries new in this tree are created before the flip (they
+    dangle until then), links for entries it no longer has are removed after.
+    With keep, older trees beyond the keep most recent previous ones are deleted.
+    """
+    base = versions_dir(working_dir)
+    target = os.path.join(base, name)
+    if not os.path.isdir(target):
+        raise FileNotFoundError(f"No installed version '{name}' in {base}")
+    entries = set(os.listdir(target))
+    legacy = _legacy_entries(working_dir)
+
+    for entry in sorted(entries):
+        path = os.path.join(working_dir, entry)
+        if not os.path.lexists(path):
+            os.symlink(_link_target(entry), path)
+
+    # The switch itself: one rename of a symlink
+    tmp_link = os.path.join(base, f".{CURRENT_NAME}-{os.getpid()}")
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(tmp_link)
+    os.symlink(name, tmp_link)
+    os.replace(tmp_link, os.path.join(base, CURRENT_NAME))
+    fileutil.fsync_path(base)
+    # The activation time orders rollback and retention
+    os.utime(target)
+
+    for entry in sorted(entries):
+        path = os.path.join(working_dir, entry)
+        if not _is_our_link(path, entry):
+            # Real files and directories of a flat install
+            _replace_with_link(path, _link_target(entry))
+    for entry in os.listdir(working_dir):
+        path = os.path.join(working_dir, entry)
+        if entry not in entries and (_is_our_link(path, entry) or entry in legacy):
+            _remove(path)
+
+    if keep is not None:
+        remove_old_versions(working_dir, keep)
+
+
+def commit(working_dir, staging_dir, version, keep=DEFAULT_KEEP):
+    """Move a complete staging directory into place as version and activate it. Returns its name."""
+    base = versions_dir(working_dir)
+    name = version
+    n = 1
+    while os.path.lexists(os.path.join(base, name)):
+        name = f"{version}.{n}"
+        n += 1
+    # The writers fsync the staged files; their directory entries must be on
+    # disk too before the rename makes the tree reachable
+    for directory, _, _ in os.walk(staging_dir, topdown=False):
+        fileutil.fsync_path(directory)
+    os.rename(staging_dir, os.path.join(base, name))
+    fileutil.fsync_path(base)
+    activate(working_dir, name, keep)
+    print(f"Activated {name}")
+    return name
+
+
+def remove_old_versions(working_dir, keep):
+    """Delete installed trees other than the active one beyond the keep most recent."""
+    active = current_name(working_dir)
+    previous = [name for name in installed_versions(working_dir) if name != active]
+    for name in previous[keep:]:
+        print(f"Removing old version {name}")
+        shutil.rmtree(os.path.join(versions_dir(working_dir), name))
+
+
+def rollback(working_dir):
+    """Activate the most recently active tree before the current one. Returns its name."""
+    active = current_name(working_dir)
+    previous = [name for name in installed_versions(working_dir) if name != active]
+    if not previous:
+        raise FileNotFoundError(f"No previous version to roll back to in {versions_dir(working_dir)}")
+    activate(working_dir, previous[0])
+    return previous[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the installed Terraria server versions.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in (("list", "list installed versions, active first"),
+                               ("rollback", "switch back to the previously active version")):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument("directory", nargs="?", default=".")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        active = current_name(args.directory)
+        for name in installed_versions(args.directory):
+            print(f"{'*' if name == active else ' '} {name}")
+        return 0
+
+    try:
+        name = rollback(args.directory)
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"Rolled back to {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
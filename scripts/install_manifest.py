@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Install manifest of the extracted Terraria server files.
+
+prune_unused_files.py writes install-manifest.json after installing the server.
+It records the server version, the digest of the archive it came from and the
+size, modification time, sha256 and CRC32 of every installed file.
+
+    python3 install_manifest.py verify [directory] [--full]
+
+checks an install against its manifest. By default only stat() data is
+compared (existence, size and modification time), which is cheap enough to run
+at every container start. Modification times are compared in whole seconds,
+the precision image layers keep them with. --full re-hashes every file.
+
+It only uses what the Python 3.7 of the arm64 (mono) image provides.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import zlib
+
+import fileutil
+
+MANIFEST_NAME = "install-manifest.json"
+DOWNLOAD_INFO_NAME = "download-info.json"
+# Image layers store modification times in whole seconds
+NS_PER_SECOND = 10 ** 9
+
+
+def file_digests(path):
+    """Return the hex sha256 and the CRC32 of a file, reading it once."""
+    digest = hashlib.sha256()
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(fileutil.HASH_BUFFER_SIZE), b""):
+            digest.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+    return digest.hexdigest(), crc
+
+
+def file_entry(path, sha256, crc32=None):
+    """Manifest entry for an installed file whose digests are already known.
+
+    crc32 is the CRC stored for the member in the server zip; upgrade.py
+    compares it with the central directory of a newer archive.
+    """
+    st = os.stat(path)
+    entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha256}
+    if crc32 is not None:
+        entry["crc32"] = crc32
+    return entry
+
+
+def read_download_info(working_dir):
+    """Return what download_server.py recorded about the archive, or an empty dict."""
+    try:
+        with open(os.path.join(working_dir, DOWNLOAD_INFO_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_download_info(working_dir, version, filename, size=None, sha256=None):
+    """Record the downloaded archive for prune_unused_files.py to put in the manifest."""
+    fileutil.write_json_atomic(os.path.join(working_dir, DOWNLOAD_INFO_NAME), {
+        "version": version,
+        "archive": {"name": filename, "size": size, "sha256": sha256},
+    })
+
+
+def write_manifest(working_dir, files, download_info=None, arch=None):
+    """Write the manifest for files ({relative path: entry}) installed in working_dir.
+
+    arch is the architecture the files were pruned for, if any; upgrades keep to it.
+    """
+    download_info = download_info or {}
+    manifest = {
+        "version": download_info.get("version"),
+        "archive": download_info.get("archive"),
+        "files": files,
+    }
+    if arch:
+        manifest["arch"] = arch
+    path = os.path.join(working_dir, MANIFEST_NAME)
+    fileutil.write_json_atomic(path, manifest, prefix=".manifest-", sync=True)
+    return path
+
+
+def load_manifest(working_dir):
+    with open(os.path.join(working_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify(working_dir, full=False):
+    """Check installed files against the manifest. Returns a list of problems."""
+    manifest = load_manifest(working_dir)
+    problems = []
+    for name, entry in sorted(manifest["files"].items()):
+        path = os.path.join(working_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            problems.append(f"{name}: missing")
+            continue
+        if st.st_size != entry["size"]:
+            problems.append(f"{name}: size {st.st_size}, expected {entry['size']}")
+        elif full:
+            if fileutil.file_sha256(path) != entry["sha256"]:
+                problems.append(f"{name}: sha256 mismatch")
+        elif st.st_mtime_ns // NS_PER_SECOND != entry["mtime_ns"] // NS_PER_SECOND:
+            problems.append(f"{name}: modified since install")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a Terraria server install against its manifest.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    verify_parser = subparsers.add_parser("verify", help="verify installed files")
+    verify_parser.add_argument("directory", nargs="?", default=".")
+    verify_parser.add_argument("--full", action="store_true", help="compare sha256 digests instead of stat data")
+    args = parser.parse_args(argv)
+
+    try:
+        problems = verify(args.directory, full=args.full)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: cannot read {MANIFEST_NAME} in {args.directory}: {e}", file=sys.stderr)
+        return 2
+
+    if problems:
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        print(f"Install verification failed: {len(problems)} problem(s)", file=sys.stderr)
+        return 1
+    print("Install verified.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
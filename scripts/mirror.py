@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Mirror of the dedicated server archives, for offline and air-gapped builds.
+
+A mirror is a directory holding server zips under their official names and an
+index.json describing them:
+
+    terraria-server-1449.zip
+    terraria-server-1450.zip
+    index.json    {"versions": {"1450": {"filename": ..., "size": ..., "sha256": ...}, ...}}
+
+Fill or refresh one with
+
+    python3 mirror.py DIRECTORY VERSION... [--jobs N]
+
+where each VERSION is 1449, 1.4.4.9, a range such as 1440-1452 or 'latest'.
+Versions in a range that were never published are skipped; archives already
+in the index are not downloaded again.
+
+Setting TERRARIA_MIRROR to such a directory (or to an http(s) URL serving
+one) makes version discovery and downloads use it instead of terraria.org and
+the wiki: the newest indexed version is the base version, versions are
+probed against the mirror, and download_server.py copies or hard-links the
+zip from a local mirror instead of downloading it.
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+import fileutil
+import http_pool
+import range_download
+
+OFFICIAL_DOWNLOAD_BASE = "https://terraria.org/api/download/pc-dedicated-server/"
+OFFICIAL_NAMES_URL = "https://terraria.org/api/get/dedicated-servers-names"
+INDEX_NAME = "index.json"
+DEFAULT_JOBS = 4
+# Statuses that mean a version was never published
+ABSENT_STATUSES = (404, 410)
+
+
+def source():
+    """The configured mirror (a directory or an http(s) URL), or None for terraria.org."""
+    return os.environ.get("TERRARIA_MIRROR") or None
+
+
+def local_dir(location=None):
+    """The mirror directory if the mirror is on local disk, otherwise None."""
+    location = location or source()
+    if location is None or location.startswith(("http://", "https://")):
+        return None
+    return location.removeprefix("file://")
+
+
+def download_base(location=None):
+    """Base URL the archives are fetched from, ending with a slash."""
+    location = location or source()
+    if location is None:
+        return OFFICIAL_DOWNLOAD_BASE
+    return location.rstrip("/") + "/"
+
+
+def archive_url(filename):
+    return download_base() + filename
+
+
+def filename_for(version):
+    return f"terraria-server-{version}.zip"
+
+
+def load_index(location=None):
+    """Return the mirror index ({"versions": {...}}); raises OSError or ValueError if unreadable."""
+    location = location or source()
+    directory = local_dir(location)
+    if directory is not None:
+        try:
+            with open(os.path.join(directory, INDEX_NAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"versions": {}}
+    with http_pool.request_with_retries(download_base(location) + INDEX_NAME) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def newest_first(index):
+    return sorted(index["versions"], key=int, reverse=True)
+
+
+def latest_version(location=None):
+    """Newest version in the mirror index, or None."""
+    versions = newest_first(load_index(location))
+    return versions[0] if versions else None
+
+
+def filenames(location=None):
+    """Archive names in the mirror index, newest first, like the dedicated-servers-names list."""
+    return [filename_for(version) for version in newest_first(load_index(location))]
+
+
+def has_version(version, location=None):
+    """Whether a local mirror holds the archive of version."""
+    entry = load_index(location)["versions"].get(version)
+    return entry is not None and os.path.isfile(os.path.join(local_dir(location), entry["filename"]))
+
+
+def copy_archive(filename, output_path, location=None):
+    """Hard-link or copy an archive out of a local mirror. Returns its index entry.
+
+    Raises FileNotFoundError if the mirror does not have it.
+    """
+    directory = local_dir(location)
+    version = filename.removeprefix("terraria-server-").removesuffix(".zip")
+    entry = load_index(location)["versions"].get(version)
+    src = os.path.join(directory, filename)
+    if entry is None or not os.path.isfile(src):
+        raise FileNotFoundError(f"{filename} is not in the mirror at {directory}")
+    if os.path.lexists(output_path):
+        os.remove(output_path)
+    try:
+        os.link(src, output_path)
+    except OSError:
+        shutil.copyfile(src, output_path)
+    if os.path.getsize(output_path) != entry["size"]:
+        os.remove(output_path)
+        raise OSError(f"{src} does not match the mirror index")
+    return entry
+
+
+def parse_versions(specs):
+    """Expand version arguments ('1449', '1.4.4.9', '1440-1452', 'latest') to version strings."""
+    versions = []
+    for spec in specs:
+        if spec == "latest":
+            versions.append(spec)
+            continue
+        match = re.fullmatch(r"([\d.]+)(?:-([\d.]+))?", spec)
+        if not match:
+            raise ValueError(f"Invalid version '{spec}'")
+        first = int(match.group(1).replace(".", ""))
+        last = int((match.group(2) or match.group(1)).replace(".", ""))
+        if not 1000 <= first <= last <= 9999:
+            raise ValueError(f"Invalid version range '{spec}'")
+        versions.extend(str(v) for v in range(first, last + 1))
+    return list(dict.fromkeys(versions))
+
+
+def write_index(directory, index):
+    fileutil.write_json_atomic(os.path.join(directory, INDEX_NAME), index, prefix=".index-")
+
+
+def latest_upstream(names_url=OFFICIAL_NAMES_URL):
+    """Newest version listed by the dedicated-servers-names API, or None."""
+    try:
+        with http_pool.request_with_retries(names_url) as response:
+            names = json.loads(response.read().decode("utf-8"))
+    except (urllib.error.URLError, ValueError) as e:
+        print(f"Error fetching the server names list: {e}", file=sys.stderr)
+        return None
+    match = re.fullmatch(r"terraria-server-(\d+)\.zip", names[0] if isinstance(names, list) and names else "")
+    return match.group(1) if match else None
+
+
+def mirror(directory, versions, jobs=DEFAULT_JOBS, connections=range_download.DEFAULT_CONNECTIONS,
+           upstream=OFFICIAL_DOWNLOAD_BASE):
+    """Download versions into the mirror directory and update its index.
+
+    Returns (mirrored, missing, failed) lists of versions: those now in the
+    mirror, those upstream does not have and those that could not be fetched.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index = load_index(directory)
+    if "latest" in versions:
+        latest = latest_upstream()
+        versions = [v for v in versions if v != "latest"]
+        if latest is None:
+            return [], [], ["latest"]
+        versions.append(latest)
+    versions = list(dict.fromkeys(versions))
+
+    def fetch(version):
+        filename = filename_for(version)
+        entry = index["versions"].get(version)
+        path = os.path.join(directory, filename)
+        if entry is not None and os.path.isfile(path) and os.path.getsize(path) == entry["size"]:
+            return version, entry, None
+        try:
+            result = range_download.fetch(upstream + filename, path, connections=connections)
+        except urllib.error.HTTPError as e:
+            return version, None, "missing" if e.code in ABSENT_STATUSES else str(e)
+        except (urllib.error.URLError, OSError) as e:
+            return version, None, str(e)
+        return version, {"filename": filename, "size": result.size, "sha256": result.sha256}, None
+
+    mirrored, missing, failed = [], [], []
+    if versions:
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(versions)))) as pool:
+            for version, entry, error in pool.map(http_pool.in_context(fetch), versions):
+                if entry is not None:
+                    index["versions"][version] = entry
+                    mirrored.append(version)
+                elif error == "missing":
+                    missing.append(version)
+                else:
+                    print(f"Error mirroring {version}: {error}", file=sys.stderr)
+                    failed.append(version)
+    write_index(directory, index)
+    return mirrored, missing, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download server archives into a local mirror directory.")
+    parser.add_argument("directory", help="mirror directory")
+    parser.add_argument("versions", nargs="+", help="versions to mirror: 1449, 1.4.4.9, 1440-1452 or latest")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help=f"archives downloaded at once (default: {DEFAULT_JOBS})")
+    parser.add_argument("-c", "--connections", type=int, default=range_download.DEFAULT_CONNECTIONS,
+                        help="parallel connections per archive (default: 4)")
+    parser.add_argument("--upstream", default=OFFICIAL_DOWNLOAD_BASE,
+                        help="base URL to download from (default: terraria.org)")
+    args = parser.parse_args(argv)
+
+    try:
+        versions = parse_versions(args.versions)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    mirrored, missing, failed = mirror(args.directory, versions, jobs=args.jobs, connections=args.connections,
+                                       upstream=download_base(args.upstream))
+    print(f"Mirrored {len(mirrored)} version(s) in {args.directory}"
+          + (f", {len(missing)} not published" if missing else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of version probe results for get_latest_version.py.
+
+Stores the outcome of is_version_available() for each probed version and the
+base version scraped from the Fandom wiki, so that consecutive runs (e.g. the
+hourly Jenkins job) do not repeat requests whose answer is already known. The
+wiki page's ETag and Last-Modified are kept with the base version so an
+expired one is revalidated with a conditional request.
+
+Hits and misses expire separately: a confirmed version is not going to be
+pulled from terraria.org, while a missing one may be published at any time.
+The number of entries is bounded; the least recently checked ones are evicted
+first.
+"""
+
+import json
+import os
+import sys
+import time
+
+import fileutil
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "terraria-server-docker")
+DEFAULT_HIT_TTL = 30 * 24 * 3600   # 30 days
+DEFAULT_MISS_TTL = 10 * 60         # 10 minutes
+DEFAULT_MAX_ENTRIES = 256
+
+
+def default_cache_path():
+    """Return the cache file path, honoring the TERRARIA_CACHE_DIR environment variable."""
+    cache_dir = os.environ.get("TERRARIA_CACHE_DIR") or DEFAULT_CACHE_DIR
+    return os.path.join(cache_dir, "probe-cache.json")
+
+
+class ProbeCache:
+    """JSON file backed cache of probe results and the scraped base version."""
+
+    def __init__(self, path=None, hit_ttl=DEFAULT_HIT_TTL, miss_ttl=DEFAULT_MISS_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.path = path or default_cache_path()
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.probes = {}
+        self.base_version = None
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """Load the cache file. A missing or corrupt file yields an empty cache."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.probes = {str(k): v for k, v in data.get("probes", {}).items()}
+            self.base_version = data.get("base_version")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Warning: ignoring unreadable cache {self.path}: {e}", file=sys.stderr)
+            self.probes = {}
+            self.base_version = None
+
+    def save(self):
+        """Write the cache atomically if it changed since it was loaded."""
+        if not self.dirty:
+            return
+        self._evict()
+        data = {"probes": self.probes, "base_version": self.base_version}
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fileutil.write_json_atomic(self.path, data, prefix=".probe-cache-")
+            self.dirty = False
+        except OSError as e:
+            print(f"Warning: could not write cache {self.path}: {e}", file=sys.stderr)
+
+    def _fresh(self, entry, ttl):
+        return self.clock() - entry.get("checked", 0) < ttl
+
+    def lookup(self, version):
+        """Return True/False for a fresh cached probe result, or None if unknown."""
+        entry = self.probes.get(str(version))
+        if entry is None:
+            return None
+        ttl = self.hit_ttl if entry.get("available") else self.miss_ttl
+        if not self._fresh(entry, ttl):
+            return None
+        return bool(entry["available"])
+
+    def record(self, version, available):
+        """Store the result of a probe."""
+        self.probes[str(version)] = {"available": bool(available), "checked": self.clock()}
+        self.dirty = True
+
+    def highest_hit(self):
+        """Return the highest version still known to be available, or None."""
+        hits = [int(v) for v, entry in self.probes.items()
+                if entry.get("available") and self._fresh(entry, self.hit_ttl)]
+        return str(max(hits)) if hits else None
+
+    def get_base_version(self):
+        """Return the cached scraped base version if it has not expired."""
+        if self.base_version and self._fresh(self.base_version, self.hit_ttl):
+            return self.base_version.get("value")
+        return None
+
+    def base_version_validators(self):
+        """Return the stored base version with the wiki page's ETag and Last-Modified, even if expired.
+
+        Returns a dict with "value", "etag" and "last_modified" keys, or None.
+        """
+        if not self.base_version or not self.base_version.get("value"):
+            return None
+        return {
+            "value": self.base_version["value"],
+            "etag": self.base_version.get("etag"),
+            "last_modified": self.base_version.get("last_modified"),
+        }
+
+    def set_base_version(self, version, etag=None, last_modified=None):
+        """Store the base version scraped from the wiki.
+
+        Validators of the page it came from are kept when the value is unchanged
+        and none are given.
+        """
+        previous = self.base_version or {}
+        if etag is None and last_modified is None and previous.get("value") == version:
+            etag, last_modified = previous.get("etag"), previous.get("last_modified")
+        self.base_version = {"value": version, "checked": self.clock()}
+        if etag:
+            self.base_version["etag"] = etag
+        if last_modified:
+            self.base_version["last_modified"] = last_modified
+        self.dirty = True
+
+    def _evict(self):
+        """Drop expired entries, then the least recently checked ones above max_entries."""
+        for version, entry in list(self.probes.items()):
+            ttl = self.hit_ttl if entry.get("available") else self.miss_ttl
+            if not self._fresh(entry, ttl):
+                del self.probes[version]
+
+        overflow = len(self.probes) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self.probes, key=lambda v: self.probes[v].get("checked", 0))
+            for version in oldest[:overflow]:
+                del self.probes[version]
@@ -1,36 +1,290 @@
 #!/usr/bin/env python3
+import argparse
+import fnmatch
+import hashlib
+import json
 import os
 import sys
+import stat
 import shutil
+import threading
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
-def prune(working_dir="."):
+import fileutil
+import install_layout
+import install_manifest
+import tracing
+
+COPY_BUFFER_SIZE = 1024 * 1024
+# zlib and hashlib release the GIL on large buffers, so members inflate in parallel threads
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Per-architecture keep/drop patterns, shipped next to this script
+ARCH_FILES_NAME = "arch-files.json"
+
+
+def load_arch_rules(arch, path=None):
+    """Return the keep/drop patterns for arch from the arch files manifest.
+
+    Patterns are matched against install-relative paths and each of their
+    parent directories, so a directory pattern covers everything below it.
+    """
+    path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), ARCH_FILES_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            rules = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error: cannot read {path}: {e}")
+        sys.exit(1)
+    if arch not in rules:
+        print(f"Error: no file rules for architecture '{arch}' in {path} (known: {', '.join(sorted(rules))}).")
+        sys.exit(1)
+    return rules[arch]
+
+
+def wanted(relative_path, rules):
+    """Whether an install-relative path is installed under rules (None installs everything)."""
+    if rules is None:
+        return True
+    parts = relative_path.rstrip("/").split("/")
+    paths = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+    def matches(patterns):
+        return any(fnmatch.fnmatchcase(p, pattern) for pattern in patterns for p in paths)
+
+    return matches(rules.get("keep", ["*"])) and not matches(rules.get("drop", []))
+
+
+def member_mode(info):
+    """Return the unix mode stored in a zip member, or 0 if there is none."""
+    return (info.external_attr >> 16) & 0xFFFF
+
+
+def safe_destination(working_dir, relative_path):
+    """Join a member path onto working_dir, refusing paths that escape it."""
+    normalized = os.path.normpath(relative_path)
+    if os.path.isabs(normalized) or normalized == ".." or normalized.startswith(".." + os.sep):
+        raise ValueError(f"Refusing to extract unsafe path '{relative_path}'")
+    return os.path.join(working_dir, normalized)
+
+
+def workers_from_env():
+    """Number of extraction threads, from TERRARIA_EXTRACT_WORKERS."""
+    return int(os.environ.get("TERRARIA_EXTRACT_WORKERS", DEFAULT_WORKERS))
+
+
+def extract_member(zip_ref, info, dst):
+    """Stream one zip member to dst, keeping its permission bits.
+
+    The output file is preallocated to the member's size. zipfile checks the
+    CRC32 once the member has been read to the end and raises BadZipFile on a
+    mismatch, as it does for a member shorter than its recorded size.
+    Returns the sha256 of the written file, computed while writing it, or None
+    for directories and symlinks.
+    """
+    mode = member_mode(info)
+    if info.is_dir():
+        os.makedirs(dst, exist_ok=True)
+        return None
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if stat.S_ISLNK(mode):
+        os.symlink(zip_ref.read(info).decode("utf-8"), dst)
+        return None
+
+    digest = hashlib.sha256()
+    written = 0
+    with zip_ref.open(info) as src, open(dst, "wb", buffering=COPY_BUFFER_SIZE) as out:
+        fileutil.preallocate(out.fileno(), info.file_size)
+        while chunk := src.read(COPY_BUFFER_SIZE):
+            digest.update(chunk)
+            out.write(chunk)
+            written += len(chunk)
+        # On disk before install_layout.commit() renames the tree into place
+        fileutil.sync_file(out)
+    if written != info.file_size:
+        raise zipfile.BadZipFile(f"{info.filename}: got {written} of {info.file_size} bytes")
+    if mode & 0o7777:
+        os.chmod(dst, mode & 0o7777)
+    return digest.hexdigest()
+
+
+def extract_members(zip_ref, jobs, workers=1):
+    """Extract (info, dst) pairs, files on a pool of workers threads.
+
+    Each worker reads the archive through its own ZipFile handle, so members
+    are inflated concurrently; the largest go first. Directories and symlinks
+    are created up front. Returns the sha256 of each member (None for
+    directories and symlinks), in the order of jobs.
+    """
+    results = [None] * len(jobs)
+    files = []
+    for i, (info, dst) in enumerate(jobs):
+        if info.is_dir() or stat.S_ISLNK(member_mode(info)):
+            extract_member(zip_ref, info, dst)
+        else:
+            files.append(i)
+
+    if workers <= 1 or len(files) <= 1 or not isinstance(zip_ref.filename, str):
+        for i in files:
+            results[i] = extract_member(zip_ref, *jobs[i])
+        return results
+
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def work(i):
+        if not hasattr(local, "zip_ref"):
+            local.zip_ref = zipfile.ZipFile(zip_ref.filename, "r")
+            with handles_lock:
+                handles.append(local.zip_ref)
+        results[i] = extract_member(local.zip_ref, *jobs[i])
+
+    files.sort(key=lambda i: jobs[i][0].compress_size, reverse=True)
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            # list() re-raises the first worker failure
+            list(pool.map(work, files))
+    finally:
+        for handle in handles:
+            handle.close()
+    return results
+
+
+def extract_linux(zip_ref, working_dir, rules=None, workers=1):
+    """Extract only the <version>/Linux/ members of the archive into an empty working_dir.
+
+    Members are streamed straight to their final location with the prefix removed,
+    by workers threads (see extract_members()); the Mac and Windows trees, and
+    members rules drops, are never written to disk.
+    Returns install manifest entries for the written files.
+    """
+    version_folder = zip_ref.namelist()[0].split('/')[0]
+    prefix = f"{version_folder}/Linux/"
+    members = [info for info in zip_ref.infolist()
+               if info.filename.startswith(prefix) and info.filename != prefix]
+    if not members:
+        print(f"Error: Linux folder not found in archive under '{prefix}'.")
+        sys.exit(1)
+    members = [info for info in members if wanted(info.filename[len(prefix):], rules)]
+
+    print(f"Extracting {prefix} to {working_dir}...")
+    jobs = [(info, safe_destination(working_dir, info.filename[len(prefix):])) for info in members]
+    files = {}
+    for (info, dst), sha256 in zip(jobs, extract_members(zip_ref, jobs, workers)):
+        if sha256 is not None:
+            files[info.filename[len(prefix):]] = install_manifest.file_entry(dst, sha256, info.CRC)
+
+    written = sum(entry["size"] for entry in files.values())
+    skipped = sum(info.file_size for info in zip_ref.infolist()) - written
+    print(f"Extracted {len(files)} files ({written} bytes), skipped {skipped} bytes not needed here")
+    return files
+
+
+def move_tree(src_dir, dst_dir, rules=None):
+    """Move the files of src_dir that rules keeps into dst_dir. Returns the moved top-level entries."""
+    if rules is None:
+        items = os.listdir(src_dir)
+        for item in items:
+            shutil.move(os.path.join(src_dir, item), os.path.join(dst_dir, item))
+        return items
+
+    for root, dirs, names in os.walk(src_dir):
+        relative_root = os.path.relpath(root, src_dir).replace(os.sep, "/")
+        relative_root = "" if relative_root == "." else relative_root + "/"
+        for name in dirs + names:
+            relative_path = relative_root + name
+            src = os.path.join(root, name)
+            if name in dirs and not os.path.islink(src):
+                continue
+            if wanted(relative_path, rules):
+                dst = safe_destination(dst_dir, relative_path)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.move(src, dst)
+    return os.listdir(dst_dir)
+
+
+def hash_tree(working_dir, items):
+    """Install manifest entries for files moved into working_dir, hashed by reading them."""
+    files = {}
+    for item in items:
+        top = os.path.join(working_dir, item)
+        paths = [top] if not os.path.isdir(top) else \
+            [os.path.join(root, name) for root, _, names in os.walk(top) for name in names]
+        for path in paths:
+            if os.path.islink(path):
+                continue
+            relative_path = os.path.relpath(path, working_dir).replace(os.sep, "/")
+            files[relative_path] = install_manifest.file_entry(path, *install_manifest.file_digests(path))
+    return files
+
+
+def finish_install(working_dir, staging_dir, files, version, keep, arch):
+    """Write the install manifest into staging_dir, switch to it and drop the download hand-off file."""
+    download_info = install_manifest.read_download_info(working_dir)
+    path = install_manifest.write_manifest(staging_dir, files, download_info, arch)
+    print(f"Wrote {os.path.basename(path)} ({len(files)} files)")
+    with tracing.phase("activate"):
+        install_layout.commit(working_dir, staging_dir, download_info.get("version") or version, keep)
+    info_path = os.path.join(working_dir, install_manifest.DOWNLOAD_INFO_NAME)
+    if os.path.exists(info_path):
+        os.remove(info_path)
+
+
+def prune(working_dir=".", keep=None, arch=None, arch_files=None, workers=None):
+    """Install the Linux server from the downloaded archive (or its extracted folder) in working_dir.
+
+    The files go to a staging directory that replaces the active version in one
+    step (see install_layout.py); keep is the number of previous versions to
+    retain, by default $TERRARIA_KEEP_VERSIONS or 1. With arch, only the files
+    the arch files manifest (arch_files, default arch-files.json next to this
+    script) keeps for that architecture are installed. workers is the number of
+    extraction threads, by default $TERRARIA_EXTRACT_WORKERS or DEFAULT_WORKERS.
+    """
+    if keep is None:
+        keep = install_layout.keep_from_env()
+    if workers is None:
+        workers = workers_from_env()
+    rules = load_arch_rules(arch, arch_files) if arch else None
     zip_filename = os.path.join(working_dir, "terraria-server.zip")
-    extracted_folder_path = None
-    should_remove_zip = False
-    
+
     if os.path.exists(zip_filename):
         print(f"Unzipping {zip_filename}...")
+        staging_dir = None
         try:
-            with zipfile.ZipFile(zip_filename, 'r') as zip_ref:
-                if not zip_ref.namelist():
-                    print("Error: Zip file is empty.")
-                    sys.exit(1)
-                extracted_folder_name = zip_ref.namelist()[0].split('/')[0]
-                zip_ref.extractall(working_dir)
-                extracted_folder_path = os.path.join(working_dir, extracted_folder_name)
-                should_remove_zip = True
-        except zipfile.BadZipFile:
-            print("Error: Bad zip file.")
-            sys.exit(1)
-    else:
-        print(f"{zip_filename} not found. Checking for extracted folder...")
-        if os.path.exists(working_dir):
-            for item in os.listdir(working_dir):
-                item_path = os.path.join(working_dir, item)
-                if os.path.isdir(item_path) and os.path.isdir(os.path.join(item_path, "Linux")):
-                    extracted_folder_path = item_path
-                    break
+            try:
+                with zipfile.ZipFile(zip_filename, 'r') as zip_ref:
+                    if not zip_ref.namelist():
+                        print("Error: Zip file is empty.")
+                        sys.exit(1)
+                    version = zip_ref.namelist()[0].split('/')[0]
+                    staging_dir = install_layout.new_staging(working_dir)
+                    with tracing.phase("extract", workers=workers) as phase:
+                        files = extract_linux(zip_ref, staging_dir, rules, workers)
+                        phase.bytes = sum(entry["size"] for entry in files.values())
+            except zipfile.BadZipFile as e:
+                print(f"Error: Bad zip file: {e}")
+                sys.exit(1)
+        except BaseException:
+            if staging_dir:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        print("Cleaning up...")
+        os.remove(zip_filename)
+        finish_install(working_dir, staging_dir, files, version, keep, arch)
+        print("Pruning complete.")
+        return
+
+    print(f"{zip_filename} not found. Checking for extracted folder...")
+    extracted_folder_path = None
+    if os.path.exists(working_dir):
+        for item in os.listdir(working_dir):
+            item_path = os.path.join(working_dir, item)
+            if os.path.isdir(item_path) and os.path.isdir(os.path.join(item_path, "Linux")):
+                extracted_folder_path = item_path
+                break
 
     if not extracted_folder_path or not os.path.isdir(extracted_folder_path):
         print(f"Error: Zip file not found and extracted folder not detected.")
@@ -41,29 +295,30 @@ def prune(working_dir="."):
         print(f"Error: Linux folder not found at '{linux_folder}'.")
         sys.exit(1)
 
-    print(f"Moving files from {linux_folder} to {working_dir}...")
-    for item in os.listdir(linux_folder):
-        src = os.path.join(linux_folder, item)
-        dst = os.path.join(working_dir, item)
-        
-        # Remove destination if it exists to ensure overwrite
-        if os.path.exists(dst):
-            if os.path.isdir(dst):
-                shutil.rmtree(dst)
-            else:
-                os.remove(dst)
-        
-        shutil.move(src, dst)
+    staging_dir = install_layout.new_staging(working_dir)
+    print(f"Moving files from {linux_folder} to {staging_dir}...")
+    with tracing.phase("move"):
+        items = move_tree(linux_folder, staging_dir, rules)
 
     print("Cleaning up...")
     # Remove the version folder (which now contains Mac, Windows, and empty Linux)
     shutil.rmtree(extracted_folder_path)
-    
-    # Remove the zip file
-    if should_remove_zip:
-        os.remove(zip_filename)
+    finish_install(working_dir, staging_dir, hash_tree(staging_dir, items),
+                   os.path.basename(os.path.normpath(extracted_folder_path)), keep, arch)
     print("Pruning complete.")
 
 if __name__ == "__main__":
-    target_dir = sys.argv[1] if len(sys.argv) > 1 else "."
-    prune(target_dir)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Install the Linux server files from the downloaded archive.")
+    parser.add_argument("directory", nargs="?", default=".", help="directory holding terraria-server.zip")
+    parser.add_argument("--arch", default=None,
+                        help="install only the files this architecture runs, e.g. amd64 or arm64 (default: all)")
+    parser.add_argument("--arch-files", default=None,
+                        help=f"keep/drop patterns per architecture (default: {ARCH_FILES_NAME} next to this script)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help=f"extraction threads (default: {DEFAULT_WORKERS}, or $TERRARIA_EXTRACT_WORKERS)")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="write phase timings to FILE, JSON lines or OpenMetrics for .prom "
+                             "(default: $TERRARIA_TRACE, unset disables tracing)")
+    args = parser.parse_args()
+    tracing.setup(args.trace)
+    prune(args.directory, arch=args.arch, arch_files=args.arch_files, workers=args.workers)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Resumable, parallel HTTP download engine used by download_server.py.
+
+The file is split into fixed-size byte ranges that are fetched over several
+pooled connections at once and written with os.pwrite into a preallocated
+"<output>.part" file. Completed ranges are recorded in a "<output>.part.json"
+sidecar, so an interrupted download picks up where it stopped instead of
+starting over. When the server does not honor Range requests the engine falls
+back to a single stream read with large readinto() buffers.
+
+The sha256 of the file is computed while it is being written, so callers get
+a digest without reading the download back.
+"""
+
+import collections
+import hashlib
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+import fileutil
+import http_pool
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+BUFFER_SIZE = 1024 * 1024
+CHUNK_RETRIES = 3
+TIMEOUT = 60
+PROGRESS_INTERVAL = 2.0
+# Out-of-order range data kept in memory for hashing; anything beyond is re-read from the page cache
+MAX_PENDING_HASH_BYTES = 64 * 1024 * 1024
+
+DownloadResult = collections.namedtuple('DownloadResult', ['size', 'sha256'])
+
+
+class Progress:
+    """Thread-safe byte counter that prints progress and throughput lines."""
+
+    def __init__(self, total, already_done=0, interval=PROGRESS_INTERVAL, out=None):
+        self.total = total
+        self.done = already_done
+        self.transferred = 0
+        self.interval = interval
+        self.out = out or sys.stdout
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.done += n
+            self.transferred += n
+            now = time.monotonic()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def throughput(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return self.transferred / elapsed
+
+    def report(self):
+        rate = self.throughput() / (1024 * 1024)
+        done_mb = self.done / (1024 * 1024)
+        if self.total:
+            percent = 100 * self.done / self.total
+            total_mb = self.total / (1024 * 1024)
+            print(f"  {done_mb:.1f}/{total_mb:.1f} MiB ({percent:.0f}%) at {rate:.1f} MiB/s", file=self.out, flush=True)
+        else:
+            print(f"  {done_mb:.1f} MiB at {rate:.1f} MiB/s", file=self.out, flush=True)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.throughput() / (1024 * 1024)
+        print(f"Downloaded {self.transferred / (1024 * 1024):.1f} MiB in {elapsed:.1f}s ({rate:.1f} MiB/s)",
+              file=self.out, flush=True)
+
+
+class SequentialHasher:
+    """sha256 of a file that is written in out-of-order pieces.
+
+    Pieces at the current hash position are hashed immediately; later ones are
+    held in memory up to a cap. Pieces that were not fed (resumed ranges, pieces
+    over the cap) are read back with os.pread when finish() reaches them.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_HASH_BYTES):
+        self._digest = hashlib.sha256()
+        self._next = 0
+        self._pending = {}
+        self._pending_bytes = 0
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+
+    def feed(self, offset, data):
+        with self._lock:
+            if offset == self._next:
+                self._digest.update(data)
+                self._next += len(data)
+                self._drain()
+            elif offset > self._next and self._pending_bytes + len(data) <= self._max_pending:
+                self._pending[offset] = bytes(data)
+                self._pending_bytes += len(data)
+
+    def _drain(self):
+        while self._next in self._pending:
+            data = self._pending.pop(self._next)
+            self._pending_bytes -= len(data)
+            self._digest.update(data)
+            self._next += len(data)
+
+    def finish(self, fd, size):
+        """Hash whatever was not fed, reading it from fd, and return the hex digest."""
+        with self._lock:
+            while self._next < size:
+                self._drain()
+                if self._next >= size:
+                    break
+                following = min((o for o in self._pending if o > self._next), default=size)
+                data = os.pread(fd, min(following - self._next, BUFFER_SIZE), self._next)
+                if not data:
+                    raise OSError(f"unexpected end of file at {self._next}")
+                self._digest.update(data)
+                self._next += len(data)
+            return self._digest.hexdigest()
+
+
+def parse_content_range(value):
+    """Return the total size from a 'bytes start-end/total' header, or None."""
+    if not value or '/' not in value:
+        return None
+    total = value.rsplit('/', 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def _load_state(state_path):
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _stream_into(response, fd, offset, progress, hasher, limit=None):
+    """Copy a response body into fd at offset with pwrite. Returns bytes written."""
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    written = 0
+    while limit is None or written < limit:
+        want = BUFFER_SIZE if limit is None else min(BUFFER_SIZE, limit - written)
+        n = response.readinto(view[:want])
+        if not n:
+            break
+        os.pwrite(fd, view[:n], offset + written)
+        hasher.feed(offset + written, view[:n])
+        written += n
+        progress.add(n)
+    return written
+
+
+def _fetch_range(url, fd, start, end, progress, hasher):
+    """Fetch bytes start..end (inclusive) into fd, retrying from where a failure left off."""
+    position = start
+    for attempt in range(CHUNK_RETRIES + 1):
+        try:
+            headers = {'Range': f'bytes={position}-{end}'}
+            with http_pool.request(url, headers=headers, timeout=TIMEOUT) as response:
+                if response.status != 206:
+                    raise urllib.error.URLError(f"server ignored range request (status {response.status})")
+                position += _stream_into(response, fd, position, progress, hasher, limit=end - position + 1)
+            if position > end:
+                return
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            if attempt == CHUNK_RETRIES:
+                raise
+            print(f"  range {start}-{end} interrupted at {position} ({e}), retrying...", flush=True)
+    raise urllib.error.URLError(f"range {start}-{end} ended early at {position}")
+
+
+def _single_stream(response, output_path, total):
+    """Fallback for servers without range support: one stream, large buffers."""
+    part_path = output_path + '.part'
+    progress = Progress(total)
+    hasher = SequentialHasher()
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if total:
+            fileutil.preallocate(fd, total)
+        written = _stream_into(response, fd, 0, progress, hasher)
+        os.ftruncate(fd, written)
+        sha256 = hasher.finish(fd, written)
+    finally:
+        os.close(fd)
+    if total and written != total:
+        raise urllib.error.URLError(f"download truncated: got {written} of {total} bytes")
+    os.replace(part_path, output_path)
+    progress.summary()
+    return DownloadResult(written, sha256)
+
+
+def fetch(url, output_path, connections=DEFAULT_CONNECTIONS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Download url to output_path.
+
+    Uses parallel range requests when the server supports them, resuming from
+    a previous interrupted attempt if its sidecar state still matches the remote
+    file. Returns a DownloadResult with the size and sha256 of the file.
+    """
+    part_path = output_path + '.part'
+    state_path = output_path + '.part.json'
+
+    # A one-byte range request tells us the size and whether ranges are honored.
+    # If they are not, the response is the full body and is used as is.
+    response = http_pool.request(url, headers={'Range': 'bytes=0-0'}, timeout=TIMEOUT)
+    total = parse_content_range(response.getheader('Content-Range'))
+    if response.status != 206 or total is None:
+        print("Server does not support range requests, downloading in a single stream")
+        length = response.getheader('Content-Length')
+        with response:
+            return _single_stream(response, output_path, int(length) if length and length.isdigit() else None)
+    response.read()
+    # Use the final URL after redirects so each range goes straight to the file
+    url = response.url
+
+    validator = response.getheader('ETag') or response.getheader('Last-Modified')
+    state = _load_state(state_path)
+    resumable = (state is not None and os.path.exists(part_path)
+                 and state.get('size') == total and state.get('validator') == validator
+                 and state.get('chunk_size') == chunk_size)
+    if not resumable:
+        state = {'size': total, 'validator': validator, 'chunk_size': chunk_size, 'done': []}
+
+    chunks = [(i, i * chunk_size, min((i + 1) * chunk_size, total) - 1)
+              for i in range((total + chunk_size - 1) // chunk_size)]
+    done = set(state['done'])
+    pending = [c for c in chunks if c[0] not in done]
+    already = sum(end - start + 1 for i, start, end in chunks if i in done)
+    if resumable and done:
+        print(f"Resuming download: {already} of {total} bytes already present")
+
+    progress = Progress(total, already_done=already)
+    hasher = SequentialHasher()
+    state_lock = threading.Lock()
+    flags = os.O_RDWR | os.O_CREAT | (0 if resumable else os.O_TRUNC)
+    fd = os.open(part_path, flags, 0o644)
+    try:
+        if not resumable:
+            fileutil.preallocate(fd, total)
+            fileutil.write_json_atomic(state_path, state, prefix='.part-state-')
+
+        def work(chunk):
+            index, start, end = chunk
+            _fetch_range(url, fd, start, end, progress, hasher)
+            with state_lock:
+                state['done'].append(index)
+                fileutil.write_json_atomic(state_path, state, prefix='.part-state-')
+
+        workers = max(1, min(connections, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # list() re-raises the first worker failure
+            list(pool.map(http_pool.in_context(work), pending))
+        os.fsync(fd)
+        sha256 = hasher.finish(fd, total)
+    finally:
+        os.close(fd)
+
+    os.replace(part_path, output_path)
+    os.remove(state_path)
+    progress.summary()
+    return DownloadResult(total, sha256)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Extract selected members of a remote zip archive using HTTP Range requests.
+
+Only the end of the archive (end of central directory record and central
+directory) and the local header + data ranges of the wanted members are
+downloaded. Members are grouped into contiguous spans that are fetched in
+parallel and inflated straight to disk while being read, so nothing but the
+wanted payload crosses the network and nothing is buffered whole in memory.
+
+Used by download_server.py --linux-only to fetch just the <version>/Linux/
+tree of the multi-platform server zip. Members are written under their full
+archive path, which prune_unused_files.py then moves into place.
+"""
+
+import io
+import os
+import stat
+import struct
+import sys
+import urllib.error
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import fileutil
+import http_pool
+import range_download
+
+TAIL_SIZE = 64 * 1024 + 22
+MAX_SPAN_SIZE = 4 * 1024 * 1024
+READ_SIZE = 256 * 1024
+TIMEOUT = 60
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+EOCD = struct.Struct("<4s4H2LH")
+EOCD_SIGNATURE = b"PK\x05\x06"
+EOCD64_LOCATOR = struct.Struct("<4sLQL")
+EOCD64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+EOCD64 = struct.Struct("<4sQ2H2L4Q")
+
+
+class RangesNotSupported(Exception):
+    """The server answered a Range request with the whole body."""
+
+
+class _TailFile(io.RawIOBase):
+    """Seekable view of a remote file of which only the bytes [start, size) are known.
+
+    Lets zipfile.ZipFile parse the central directory without the rest of the archive.
+    """
+
+    def __init__(self, data, size):
+        self._data = data
+        self._size = size
+        self._start = size - len(data)
+        self._pos = 0
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = self._size + offset
+        return self._pos
+
+    def read(self, n=-1):
+        if self._pos < self._start:
+            raise OSError(f"offset {self._pos} is outside the fetched tail of the archive")
+        end = self._size if n is None or n < 0 else min(self._size, self._pos + n)
+        data = self._data[self._pos - self._start:end - self._start]
+        self._pos += len(data)
+        return data
+
+
+def _get_range(url, start, end):
+    """Return (body, total size, final url) for bytes start..end inclusive."""
+    with http_pool.request(url, headers={"Range": f"bytes={start}-{end}"}, timeout=TIMEOUT) as response:
+        total = range_download.parse_content_range(response.getheader("Content-Range"))
+        if response.status != 206 or total is None:
+            raise RangesNotSupported(url)
+        return response.read(), total, response.url
+
+
+class RemoteArchive:
+    """Central directory of a remote archive plus the tail bytes fetched to read it."""
+
+    def __init__(self, url, size, infolist, cd_offset, tail, tail_start):
+        self.url = url
+        self.size = size
+        self.infolist = infolist
+        self.cd_offset = cd_offset
+        self.tail = tail
+        self.tail_start = tail_start
+
+
+def read_central_directory(url):
+    """Fetch the archive tail and parse the central directory. Returns a RemoteArchive."""
+    # A suffix range would be simpler, but the size is needed first to support
+    # servers that only accept explicit ranges.
+    _, size, url = _get_range(url, 0, 0)
+    tail_start = max(0, size - TAIL_SIZE)
+    tail, _, _ = _get_range(url, tail_start, size - 1)
+
+    eocd_pos = tail.rfind(EOCD_SIGNATURE)
+    if eocd_pos < 0 or len(tail) - eocd_pos < EOCD.size:
+        raise zipfile.BadZipFile("End of central directory record not found")
+    _, _, _, _, _, cd_size, cd_offset, _ = EOCD.unpack_from(tail, eocd_pos)
+
+    locator_pos = eocd_pos - EOCD64_LOCATOR.size
+    if locator_pos >= 0 and tail[locator_pos:locator_pos + 4] == EOCD64_LOCATOR_SIGNATURE:
+        _, _, eocd64_offset, _ = EOCD64_LOCATOR.unpack_from(tail, locator_pos)
+        if eocd64_offset < tail_start:
+            record, _, _ = _get_range(url, eocd64_offset, tail_start - 1)
+            tail = record + tail
+            tail_start = eocd64_offset
+        fields = EOCD64.unpack_from(tail, eocd64_offset - tail_start)
+        cd_size, cd_offset = fields[8], fields[9]
+
+    if cd_offset < tail_start:
+        head, _, _ = _get_range(url, cd_offset, tail_start - 1)
+        tail = head + tail
+        tail_start = cd_offset
+
+    with zipfile.ZipFile(_TailFile(tail, size)) as zf:
+        return RemoteArchive(url, size, zf.infolist(), cd_offset, tail, tail_start)
+
+
+def plan_spans(infolist, wanted, cd_offset, max_span_size=MAX_SPAN_SIZE):
+    """Group wanted members into contiguous byte spans.
+
+    Each member's local record runs from its header offset to the next member's
+    header offset (or the central directory), which also covers any data
+    descriptor. Returns a list of (start, end_exclusive, [ZipInfo, ...]).
+    """
+    offsets = sorted({info.header_offset for info in infolist}) + [cd_offset]
+    next_offset = dict(zip(offsets, offsets[1:]))
+
+    spans = []
+    for info in sorted(wanted, key=lambda i: i.header_offset):
+        end = next_offset[info.header_offset]
+        if spans and spans[-1][1] == info.header_offset and end - spans[-1][0] <= max_span_size:
+            spans[-1][1] = end
+            spans[-1][2].append(info)
+        else:
+            spans.append([info.header_offset, end, [info]])
+    return [tuple(span) for span in spans]
+
+
+class _SpanReader:
+    """Sequential reader over a ranged response that tracks the archive offset."""
+
+    def __init__(self, response, start):
+        self.response = response
+        self.position = start
+
+    def read_exact(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.response.read(n - len(data))
+            if not chunk:
+                raise zipfile.BadZipFile(f"archive data ended early at offset {self.position + len(data)}")
+            data += chunk
+        self.position += n
+        return bytes(data)
+
+    def skip_to(self, offset):
+        while self.position < offset:
+            self.read_exact(min(READ_SIZE, offset - self.position))
+
+
+def _inflate_member(reader, info, dst):
+    """Read one local record from reader and write the member to dst."""
+    reader.skip_to(info.header_offset)
+    header = LOCAL_HEADER.unpack(reader.read_exact(LOCAL_HEADER.size))
+    if header[0] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"bad local header for {info.filename}")
+    name_length, extra_length = header[9], header[10]
+    reader.read_exact(name_length + extra_length)
+
+    if info.compress_type == zipfile.ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-15)
+    elif info.compress_type == zipfile.ZIP_STORED:
+        decompressor = None
+    else:
+        raise zipfile.BadZipFile(f"unsupported compression {info.compress_type} for {info.filename}")
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    crc = 0
+    remaining = info.compress_size
+    with open(dst, "wb") as out:
+        while remaining > 0:
+            chunk = reader.read_exact(min(READ_SIZE, remaining))
+            remaining -= len(chunk)
+            data = decompressor.decompress(chunk) if decompressor else chunk
+            crc = zlib.crc32(data, crc)
+            out.write(data)
+        if decompressor:
+            data = decompressor.flush()
+            crc = zlib.crc32(data, crc)
+            out.write(data)
+        # On disk before install_layout.commit() renames the tree into place
+        fileutil.sync_file(out)
+    if crc != info.CRC:
+        raise zipfile.BadZipFile(f"CRC mismatch for {info.filename}")
+
+    mode = (info.external_attr >> 16) & 0o7777
+    if mode:
+        os.chmod(dst, mode)
+    return info.file_size
+
+
+def _extract_span(reader, members, dest_dir):
+    for info in members:
+        _inflate_member(reader, info, os.path.join(dest_dir, os.path.normpath(info.filename)))
+
+
+def _fetch_span(archive, span, dest_dir, progress):
+    start, end, members = span
+    if start >= archive.tail_start:
+        # Already downloaded along with the central directory
+        reader = _SpanReader(io.BytesIO(archive.tail[start - archive.tail_start:]), start)
+        _extract_span(reader, members, dest_dir)
+        return
+    headers = {"Range": f"bytes={start}-{end - 1}"}
+    with http_pool.request(archive.url, headers=headers, timeout=TIMEOUT) as response:
+        if response.status != 206:
+            raise RangesNotSupported(archive.url)
+        reader = _SpanReader(response, start)
+        _extract_span(reader, members, dest_dir)
+        progress.add(reader.position - start)
+
+
+def extract_remote(url, dest_dir, predicate, connections=range_download.DEFAULT_CONNECTIONS,
+                   max_span_size=MAX_SPAN_SIZE, archive=None):
+    """Extract the members of the remote archive for which predicate(name) is true.
+
+    Members are written under dest_dir with their full archive path. Pass the
+    RemoteArchive from read_central_directory() as archive if it was already
+    read. Raises RangesNotSupported when the server does not honor Range
+    requests. Returns (members written, bytes fetched, archive size).
+    """
+    archive = archive or read_central_directory(url)
+
+    wanted = []
+    for info in archive.infolist:
+        if not predicate(info.filename):
+            continue
+        normalized = os.path.normpath(info.filename)
+        if os.path.isabs(normalized) or normalized.startswith(".."):
+            raise ValueError(f"Refusing to extract unsafe path '{info.filename}'")
+        if info.is_dir():
+            os.makedirs(os.path.join(dest_dir, normalized), exist_ok=True)
+        elif stat.S_ISLNK(info.external_attr >> 16):
+            raise zipfile.BadZipFile(f"symlink members are not supported: {info.filename}")
+        else:
+            wanted.append(info)
+
+    spans = plan_spans(archive.infolist, wanted, archive.cd_offset, max_span_size)
+    remote_spans = [span for span in spans if span[0] < archive.tail_start]
+    span_bytes = sum(end - start for start, end, _ in remote_spans)
+    print(f"Fetching {len(wanted)} of {len(archive.infolist)} members: "
+          f"{span_bytes} of {archive.size} bytes in {len(remote_spans)} ranges")
+
+    progress = range_download.Progress(span_bytes)
+    with ThreadPoolExecutor(max_workers=max(1, min(connections, len(spans) or 1))) as pool:
+        list(pool.map(http_pool.in_context(lambda span: _fetch_span(archive, span, dest_dir, progress)), spans))
+
+    progress.summary()
+    return len(wanted), span_bytes + len(archive.tail), archive.size
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python remote_zip.py <url> <prefix> [output directory]")
+        sys.exit(1)
+    prefix = sys.argv[2]
+    try:
+        extract_remote(sys.argv[1], sys.argv[3] if len(sys.argv) > 3 else ".", lambda name: name.startswith(prefix))
+    except (RangesNotSupported, urllib.error.URLError, zipfile.BadZipFile) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
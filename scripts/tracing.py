@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Optional tracing and metrics for the download and version discovery scripts.
+
+Off unless TERRARIA_TRACE names an output file or a script is run with
+--trace FILE. Then every request made through http_pool records its DNS,
+connect, time-to-first-byte and transfer times and the bytes received, the
+scripts time their phases (wiki scrape, names list, probe search, download,
+extraction) and each version probe is counted. Two output formats:
+
+    JSON lines   one object per request, phase and probe, appended as they
+                 happen, and a summary of the counters when the process exits
+    OpenMetrics  counters written when the process exits; samples already in
+                 the file are added to, so scripts run one after another (as
+                 in the Dockerfile) can share one file
+
+TERRARIA_TRACE_FORMAT (jsonl or openmetrics) picks the format; without it,
+files ending in .prom or .om get OpenMetrics and anything else JSON lines.
+
+While tracing is off, phase() hands out a shared no-op context manager and
+the other calls return after checking one global, so the scripts pay a
+function call per phase or request and nothing else.
+"""
+
+import atexit
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+FORMATS = ("jsonl", "openmetrics")
+OPENMETRICS_EXTENSIONS = (".prom", ".om")
+REQUEST_STAGES = ("dns", "connect", "ttfb", "transfer")
+
+HELP = {
+    "terraria_http_requests": "HTTP requests sent, by host, method and status",
+    "terraria_http_connections": "New connections opened, by host",
+    "terraria_http_seconds": "Time spent in HTTP requests, by host and stage",
+    "terraria_http_received_bytes": "Response body bytes read, by host",
+    "terraria_phase_runs": "Script phases run, by phase and result",
+    "terraria_phase_seconds": "Time spent in script phases",
+    "terraria_phase_bytes": "Bytes moved by script phases",
+    "terraria_probes": "Version availability probes, by result",
+    "terraria_http_throughput_bytes_per_second": "Received bytes per second of transfer time, by host",
+    "terraria_phase_throughput_bytes_per_second": "Bytes per second of phase time",
+}
+
+SAMPLE_PATTERN = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)')
+LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+# The active Tracer, or None while tracing is off
+_tracer = None
+
+
+def _round(seconds):
+    return None if seconds is None else round(seconds, 6)
+
+
+def _rate(size, seconds):
+    return round(size / seconds) if size and seconds else None
+
+
+class RequestTiming:
+    """Stage times of one HTTP request, filled in by http_pool as it goes."""
+
+    def __init__(self, method, url, reused):
+        self.method = method
+        self.url = url
+        self.host = urllib.parse.urlsplit(url).hostname or ""
+        self.reused = reused
+        self.dns = None
+        self.connect = None
+        self.ttfb = None
+        self.transfer = None
+        self.bytes = 0
+        self.status = None
+        self.started = self._mark = time.perf_counter()
+
+    def lap(self):
+        """Seconds since the previous lap (or the start)."""
+        now = time.perf_counter()
+        seconds, self._mark = now - self._mark, now
+        return seconds
+
+
+class Phase:
+    """Times one phase of a script. Set bytes to report its throughput."""
+
+    def __init__(self, tracer, name, labels):
+        self._tracer = tracer
+        self.name = name
+        self.labels = labels
+        self.bytes = 0
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._tracer.phase_done(self, time.perf_counter() - self._started, exc_type is None)
+        return False
+
+
+class _NoPhase:
+    """Stand-in for Phase while tracing is off; ignores everything."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class Tracer:
+    """Collects counters and writes the trace file."""
+
+    def __init__(self, path, fmt):
+        self.path = path
+        self.format = fmt
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._stream = None
+        if fmt == "jsonl":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._stream = open(path, "a", encoding="utf-8")
+            self.event("start", script=os.path.basename(sys.argv[0] or "python"))
+
+    def event(self, kind, **fields):
+        if self._stream is None:
+            return
+        record = {"ts": round(time.time(), 6), "pid": os.getpid(), "event": kind}
+        record.update(fields)
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._stream.write(line)
+            self._stream.flush()
+
+    def add(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def request_done(self, timing, error=None):
+        status = str(timing.status) if timing.status is not None else "error"
+        self.add("terraria_http_requests_total", 1, host=timing.host, method=timing.method, status=status)
+        if timing.connect is not None:
+            self.add("terraria_http_connections_total", 1, host=timing.host)
+        for stage in REQUEST_STAGES:
+            seconds = getattr(timing, stage)
+            if seconds is not None:
+                self.add("terraria_http_seconds_total", seconds, host=timing.host, stage=stage)
+        self.add("terraria_http_received_bytes_total", timing.bytes, host=timing.host)
+        fields = {stage: _round(getattr(timing, stage)) for stage in REQUEST_STAGES}
+        fields.update(total=_round(time.perf_counter() - timing.started), bytes=timing.bytes,
+                      throughput=_rate(timing.bytes, timing.transfer))
+        self.event("request", method=timing.method, url=timing.url, status=timing.status,
+                   reused=timing.reused, error=str(error) if error is not None else None, **fields)
+
+    def phase_done(self, phase, seconds, ok):
+        labels = dict(phase.labels, phase=phase.name)
+        self.add("terraria_phase_runs_total", 1, result="ok" if ok else "error", **labels)
+        self.add("terraria_phase_seconds_total", seconds, **labels)
+        self.add("terraria_phase_bytes_total", phase.bytes, **labels)
+        self.event("phase", name=phase.name, ok=ok, seconds=_round(seconds), bytes=phase.bytes,
+                   throughput=_rate(phase.bytes, seconds), **phase.labels)
+
+    def probe(self, version, result):
+        result = {True: "available", False: "absent"}.get(result, "unknown")
+        self.add("terraria_probes_total", 1, result=result)
+        self.event("probe", version=version, result=result)
+
+    def close(self):
+        if self._stream is not None:
+            self.event("summary", counters=[{"name": name, "labels": dict(labels), "value": value}
+                                            for (name, labels), value in sorted(self.counters.items())])
+            self._stream.close()
+            self._stream = None
+        else:
+            write_openmetrics(self.path, self.counters)
+
+
+def enabled():
+    return _tracer is not None
+
+
+def setup(path=None, fmt=None):
+    """Turn tracing on if path, or else TERRARIA_TRACE, names an output file.
+
+    The file is finished when the process exits (or finish() is called).
+    Returns True if tracing is on.
+    """
+    global _tracer
+    if _tracer is not None:
+        return True
+    path = path or os.environ.get("TERRARIA_TRACE")
+    if not path:
+        return False
+    fmt = fmt or os.environ.get("TERRARIA_TRACE_FORMAT") or (
+        "openmetrics" if path.endswith(OPENMETRICS_EXTENSIONS) else "jsonl")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown trace format '{fmt}', expected one of {', '.join(FORMATS)}")
+    _tracer = Tracer(path, fmt)
+    atexit.register(finish)
+    return True
+
+
+def finish():
+    """Write out and turn off tracing. Does nothing while it is off."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+
+
+def phase(name, **labels):
+    """Context manager timing a phase of a script, e.g. with phase("download") as p: ...; p.bytes = n"""
+    if _tracer is None:
+        return _NO_PHASE
+    return Phase(_tracer, name, labels)
+
+
+def probe(version, result):
+    """Count a version probe whose answer was result (True, False or None)."""
+    if _tracer is not None:
+        _tracer.probe(version, result)
+
+
+def start_request(method, url, reused):
+    """Return a RequestTiming for http_pool to fill in, or None while tracing is off."""
+    if _tracer is None:
+        return None
+    return RequestTiming(method, url, reused)
+
+
+def end_request(timing, status=None, error=None):
+    """Record a request once its response is closed, or once it failed with error."""
+    tracer = _tracer
+    if timing is None or tracer is None:
+        return
+    if error is None:
+        timing.transfer = timing.lap()
+        timing.status = status
+    tracer.request_done(timing, error)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _unescape(value):
+    return re.sub(r'\\(.)', lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+def _format_sample(name, labels, value):
+    label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels)
+    value = float(value)
+    number = str(int(value)) if value.is_integer() else repr(round(value, 6))
+    return f"{name}{{{label_text}}} {number}" if labels else f"{name} {number}"
+
+
+def read_openmetrics(path):
+    """Counter samples of an OpenMetrics file as {(name, labels): value}; empty if there is none."""
+    samples = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return samples
+    for line in lines:
+        match = SAMPLE_PATTERN.fullmatch(line)
+        if not match or not match.group(1).endswith("_total"):
+            continue
+        labels = tuple(sorted((key, _unescape(val)) for key, val in LABEL_PATTERN.findall(match.group(2) or "")))
+        try:
+            samples[(match.group(1), labels)] = float(match.group(3))
+        except ValueError:
+            continue
+    return samples
+
+
+def _throughput(samples, bytes_name, seconds_name, **match):
+    """Gauge samples of bytes_name divided by the matching seconds_name samples."""
+    gauges = {}
+    for (name, labels), size in samples.items():
+        if name != bytes_name or not size:
+            continue
+        seconds = samples.get((seconds_name, tuple(sorted({**dict(labels), **match}.items()))))
+        if seconds:
+            gauges[labels] = size / seconds
+    return gauges
+
+
+def write_openmetrics(path, counters):
+    """Add counters to the samples already in path and rewrite it atomically."""
+    samples = read_openmetrics(path)
+    for key, value in counters.items():
+        samples[key] = samples.get(key, 0) + value
+
+    lines = []
+    for name in sorted({name for name, _ in samples}):
+        family = name.removesuffix("_total")
+        if family in HELP:
+            lines.append(f"# HELP {family} {HELP[family]}")
+        lines.append(f"# TYPE {family} counter")
+        lines.extend(_format_sample(name, labels, value)
+                     for (sample, labels), value in sorted(samples.items()) if sample == name)
+    gauges = {
+        "terraria_http_throughput_bytes_per_second": _throughput(
+            samples, "terraria_http_received_bytes_total", "terraria_http_seconds_total", stage="transfer"),
+        "terraria_phase_throughput_bytes_per_second": _throughput(
+            samples, "terraria_phase_bytes_total", "terraria_phase_seconds_total"),
+    }
+    for family, values in gauges.items():
+        if values:
+            lines.append(f"# HELP {family} {HELP[family]}")
+            lines.append(f"# TYPE {family} gauge")
+            lines.extend(_format_sample(family, labels, value) for labels, value in sorted(values.items()))
+    lines.append("# EOF")
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".trace-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Incremental upgrade of an installed Terraria server.
+
+    python3 upgrade.py [version] [directory] [--archive PATH] [--linux-only] [--keep N]
+
+The installed files are described by install-manifest.json (see
+install_manifest.py). The Linux members of the new archive are compared with
+it by size and CRC32, both read from the archive's central directory, and
+only the members that differ are extracted. Files listed in the manifest that
+are no longer in the archive are left out of the new version; files the
+manifest does not know about (worlds, server-config.conf, ...) are left alone.
+Without a manifest the files on disk are compared instead. An install pruned
+for one architecture (prune_unused_files.py --arch) stays pruned for it.
+
+The new version is assembled in a staging directory (see install_layout.py):
+changed members are extracted into it and unchanged files are hard-linked from
+the active version. It then replaces the active version in one step, so an
+interrupted upgrade leaves the old install as it was, and the previous version
+is kept for rollback. Stop the server before upgrading.
+
+With --linux-only, only the central directory and the changed members are
+downloaded with range requests instead of the whole archive.
+"""
+
+import argparse
+import contextlib
+import os
+import shutil
+import stat
+import sys
+import zipfile
+
+import download_server
+import fileutil
+import install_layout
+import install_manifest
+import mirror
+import prune_unused_files
+import range_download
+import remote_zip
+
+# Downloads and extracted members inside the staging directory, before they are moved into place
+FETCH_NAME = ".fetch"
+
+
+def linux_members(infolist):
+    """Map install-relative paths to the file members of the <version>/Linux/ tree."""
+    members = {}
+    for info in infolist:
+        if not info.is_dir() and download_server.is_linux_member(info.filename):
+            members[info.filename.split("/", 2)[2]] = info
+    return members
+
+
+def plan_upgrade(working_dir, files, members):
+    """Compare the installed files with the archive members.
+
+    files is the {path: entry} map of the install manifest. The recorded CRC32
+    is trusted while a file's size and mtime still match the manifest; other
+    files are read again. Returns (changed, removed, kept): member paths to
+    extract, installed paths that are no longer in the archive, and manifest
+    entries of the files that stay as they are.
+    """
+    changed, kept = [], {}
+    for name, info in sorted(members.items()):
+        path = os.path.join(working_dir, name)
+        try:
+            st = os.lstat(path)
+        except OSError:
+            changed.append(name)
+            continue
+        mode = prune_unused_files.member_mode(info) & 0o7777
+        if not stat.S_ISREG(st.st_mode) or st.st_size != info.file_size \
+                or (mode and stat.S_IMODE(st.st_mode) != mode):
+            changed.append(name)
+            continue
+
+        entry = files.get(name)
+        if not entry or "crc32" not in entry or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+            entry = install_manifest.file_entry(path, *install_manifest.file_digests(path))
+        if entry["crc32"] == info.CRC:
+            kept[name] = entry
+        else:
+            changed.append(name)
+
+    removed = sorted(name for name in files if name not in members)
+    return changed, removed, kept
+
+
+def staged_path(staging_dir, info):
+    return prune_unused_files.safe_destination(staging_dir, info.filename)
+
+
+def stage_from_zip(zip_ref, members, changed, staging_dir, workers=1):
+    """Extract the changed members of a local archive into staging_dir. Returns their manifest entries."""
+    jobs = [(members[name], staged_path(staging_dir, members[name])) for name in changed]
+    staged = {}
+    for name, (info, dst), sha256 in zip(changed, jobs, prune_unused_files.extract_members(zip_ref, jobs, workers)):
+        if sha256 is not None:
+            staged[name] = install_manifest.file_entry(dst, sha256, info.CRC)
+    return staged
+
+
+def stage_from_remote(archive, members, changed, staging_dir, connections):
+    """Fetch the changed members of a remote archive into staging_dir. Returns their manifest entries."""
+    wanted = {members[name].filename for name in changed}
+    if wanted:
+        remote_zip.extract_remote(archive.url, staging_dir, lambda filename: filename in wanted,
+                                  connections=connections, archive=archive)
+    staged = {}
+    for name in changed:
+        dst = staged_path(staging_dir, members[name])
+        staged[name] = install_manifest.file_entry(dst, fileutil.file_sha256(dst), members[name].CRC)
+    return staged
+
+
+def link_or_copy(src, dst):
+    """Hard-link an unchanged file into the new version, copying it across filesystems."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+        fileutil.fsync_path(dst)
+
+
+def upgrade(working_dir=".", version="latest", archive=None, connections=range_download.DEFAULT_CONNECTIONS,
+            cache_dir=None, use_cache=True, linux_only=False, keep=None):
+    """Upgrade the server installed in working_dir to version, writing only changed files.
+
+    archive is a local server zip to upgrade from instead of downloading one.
+    keep is the number of previous versions to retain, by default
+    $TERRARIA_KEEP_VERSIONS or 1. Returns (files written, files removed).
+    """
+    if keep is None:
+        keep = install_layout.keep_from_env()
+    # An install from before versioned trees is upgraded from its flat files
+    base_dir = install_layout.current_dir(working_dir) or working_dir
+    try:
+        manifest = install_manifest.load_manifest(base_dir)
+    except FileNotFoundError:
+        print(f"No {install_manifest.MANIFEST_NAME} in {working_dir}, comparing against the files on disk")
+        manifest = {"files": {}}
+    arch = manifest.get("arch")
+
+    filename = None
+    if archive is None:
+        filename = download_server.archive_filename(version)
+        if filename is None:
+            print("Error: could not determine the archive to download.", file=sys.stderr)
+            sys.exit(1)
+        target_version = download_server.archive_version(filename)
+        if manifest.get("version") == target_version and not install_manifest.verify(base_dir):
+            print(f"Version {target_version} is already installed.")
+            return 0, 0
+
+    staging_dir = install_layout.new_staging(working_dir)
+    fetch_dir = os.path.join(staging_dir, FETCH_NAME)
+    os.makedirs(fetch_dir)
+    try:
+        with contextlib.ExitStack() as stack:
+            remote = None
+            # A local mirror is read from disk, so there is nothing to save with range requests
+            if archive is None and linux_only and mirror.local_dir() is None:
+                try:
+                    remote = remote_zip.read_central_directory(download_server.archive_url(filename))
+                except remote_zip.RangesNotSupported:
+                    print("Server does not support range requests, falling back to a full download")
+
+            if remote is not None:
+                members = linux_members(remote.infolist)
+                archive_info = {"name": filename, "size": remote.size, "sha256": None}
+            else:
+                if archive is None:
+                    download_server.download_server(version, fetch_dir, connections=connections,
+                                                    cache_dir=cache_dir, use_cache=use_cache, filename=filename)
+                    archive = os.path.join(fetch_dir, "terraria-server.zip")
+                    archive_info = install_manifest.read_download_info(fetch_dir).get("archive")
+                else:
+                    archive_info = {"name": os.path.basename(archive), "size": os.path.getsize(archive),
+                                    "sha256": None}
+                zip_ref = stack.enter_context(zipfile.ZipFile(archive, "r"))
+                members = linux_members(zip_ref.infolist())
+
+            if not members:
+                print("Error: Linux folder not found in archive.", file=sys.stderr)
+                sys.exit(1)
+            new_version = next(iter(members.values())).filename.split("/")[0]
+            if arch:
+                rules = prune_unused_files.load_arch_rules(arch)
+                members = {name: info for name, info in members.items() if prune_unused_files.wanted(name, rules)}
+
+            changed, removed, kept = plan_upgrade(base_dir, manifest["files"], members)
+            print(f"Upgrading {manifest.get('version') or 'unknown version'} to {new_version}: "
+                  f"{len(changed)} changed, {len(removed)} removed, {len(kept)} unchanged")
+
+            if remote is not None:
+                staged = stage_from_remote(remote, members, changed, fetch_dir, connections)
+            else:
+                staged = stage_from_zip(zip_ref, members, changed, fetch_dir,
+                                        prune_unused_files.workers_from_env())
+
+        for name in changed:
+            dst = prune_unused_files.safe_destination(staging_dir, name)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.replace(staged_path(fetch_dir, members[name]), dst)
+        for name in kept:
+            link_or_copy(os.path.join(base_dir, name), prune_unused_files.safe_destination(staging_dir, name))
+        shutil.rmtree(fetch_dir)
+        new_manifest = {"version": new_version, "archive": archive_info, "files": {**kept, **staged}}
+        if arch:
+            new_manifest["arch"] = arch
+        fileutil.write_json_atomic(os.path.join(staging_dir, install_manifest.MANIFEST_NAME), new_manifest,
+                                   prefix=".manifest-", sync=True)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    install_layout.commit(working_dir, staging_dir, new_version, keep)
+    print("Upgrade complete.")
+    return len(changed), len(removed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade an installed Terraria server.")
+    parser.add_argument("version", nargs="?", default="latest", help="'latest' or a version such as 1449 or 1.4.4.9")
+    parser.add_argument("directory", nargs="?", default=".", help="server install directory")
+    parser.add_argument("--archive", default=None, help="upgrade from a local server zip instead of downloading")
+    parser.add_argument("-c", "--connections", type=int,
+                        default=int(os.environ.get("TERRARIA_DOWNLOAD_CONNECTIONS", range_download.DEFAULT_CONNECTIONS)),
+                        help="parallel connections for range requests (default: 4, or $TERRARIA_DOWNLOAD_CONNECTIONS)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="artifact cache directory (default: $TERRARIA_ARTIFACT_CACHE, unset disables the cache)")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor update the artifact cache")
+    parser.add_argument("--linux-only", action="store_true",
+                        help="fetch only the central directory and the changed members with range requests")
+    parser.add_argument("--keep", type=int, default=None,
+                        help="previous versions to keep for rollback (default: 1, or $TERRARIA_KEEP_VERSIONS)")
+    args = parser.parse_args()
+    upgrade(args.directory, args.version, archive=args.archive, connections=args.connections,
+            cache_dir=args.cache_dir, use_cache=not args.no_cache, linux_only=args.linux_only, keep=args.keep)
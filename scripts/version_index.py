@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Index of every released Terraria dedicated server version.
+
+Built from the dedicated-servers-names list (see get_latest_filename.py) and
+kept up to date with probes above the newest known release only, so a
+refresh costs one request for the list plus a handful of probes. Stored as a
+258-byte file next to the probe cache (TERRARIA_CACHE_DIR):
+
+    magic "TVX2" | refreshed at (uint32, unix time) | released bitmap | absent bitmap
+
+with one bit per version 1000-1999 in each bitmap. Files in the older "TVX1"
+format, without the absent bitmap, are still read.
+
+    python3 version_index.py refresh [--jobs N]
+    python3 version_index.py list
+    python3 version_index.py latest [PREFIX]     e.g. 1.4.4 for the newest 1.4.4.x
+    python3 version_index.py exists VERSION      exit 0 if released, 3 if known absent, 1 if unknown
+
+A version is only known to be absent when a probe got a 404 for it and it lies
+between the oldest and the newest released entries; anything else that is not
+listed (versions the list does not go back to, gaps nobody probed, versions
+above the newest entry) is unknown. download_server.py uses the index, when
+one exists, to reject pinned versions known to be absent without a network
+round trip.
+"""
+
+import argparse
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+
+import get_latest_filename
+import get_latest_version
+import probe_cache
+
+MAGIC = b"TVX2"
+# Released bitmap only
+MAGIC_V1 = b"TVX1"
+HEADER = struct.Struct(">4sI")
+FIRST_VERSION = 1000
+VERSION_COUNT = 1000
+BITMAP_SIZE = VERSION_COUNT // 8
+# Exit status of `exists` for a version that was never released
+NOT_RELEASED_EXIT = 3
+
+
+def default_index_path():
+    """Return the index file path, honoring the TERRARIA_CACHE_DIR environment variable."""
+    cache_dir = os.environ.get("TERRARIA_CACHE_DIR") or probe_cache.DEFAULT_CACHE_DIR
+    return os.path.join(cache_dir, "version-index.bin")
+
+
+def normalize(version):
+    """'1.4.4.9' or '1449' -> 1449; None if it is not a version the index can hold."""
+    digits = str(version).replace(".", "")
+    if not re.fullmatch(r"\d{4}", digits):
+        return None
+    number = int(digits)
+    return number if FIRST_VERSION <= number < FIRST_VERSION + VERSION_COUNT else None
+
+
+class VersionIndex:
+    """Bitmap backed sets of released versions and of versions probed absent."""
+
+    def __init__(self, path=None):
+        self.path = path or default_index_path()
+        self.bitmap = bytearray(BITMAP_SIZE)
+        self.absent = bytearray(BITMAP_SIZE)
+        self.refreshed_at = 0
+        self.load()
+
+    def load(self):
+        """Load the index file. A missing or corrupt file yields an empty index."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"Warning: ignoring unreadable version index {self.path}: {e}", file=sys.stderr)
+            return
+        if data[:4] == MAGIC and len(data) == HEADER.size + 2 * BITMAP_SIZE:
+            self.absent = bytearray(data[HEADER.size + BITMAP_SIZE:])
+        elif not (data[:4] == MAGIC_V1 and len(data) == HEADER.size + BITMAP_SIZE):
+            print(f"Warning: ignoring corrupt version index {self.path}", file=sys.stderr)
+            return
+        _, self.refreshed_at = HEADER.unpack_from(data)
+        self.bitmap = bytearray(data[HEADER.size:HEADER.size + BITMAP_SIZE])
+
+    def save(self):
+        """Write the index atomically."""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".version-index-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.refreshed_at) + bytes(self.bitmap) + bytes(self.absent))
+        os.replace(tmp_path, self.path)
+
+    def add(self, version):
+        number = normalize(version)
+        if number is None:
+            return False
+        offset = number - FIRST_VERSION
+        self.bitmap[offset // 8] |= 0x80 >> (offset % 8)
+        self.absent[offset // 8] &= ~(0x80 >> (offset % 8)) & 0xFF
+        return True
+
+    def add_absent(self, version):
+        """Record a version a probe found missing, unless it is known to be released."""
+        number = normalize(version)
+        if number is None or version in self:
+            return False
+        offset = number - FIRST_VERSION
+        self.absent[offset // 8] |= 0x80 >> (offset % 8)
+        return True
+
+    def __contains__(self, version):
+        number = normalize(version)
+        if number is None:
+            return False
+        offset = number - FIRST_VERSION
+        return bool(self.bitmap[offset // 8] & (0x80 >> (offset % 8)))
+
+    def versions(self):
+        """Released versions, oldest first."""
+        return [str(FIRST_VERSION + i) for i in range(VERSION_COUNT)
+                if self.bitmap[i // 8] & (0x80 >> (i % 8))]
+
+    def newest(self):
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def exists(self, version):
+        """True if version was released, False if it is known not to be, None if the index cannot tell.
+
+        Only versions probed absent between the oldest and the newest entries
+        count as not released.
+        """
+        if version in self:
+            return True
+        number, versions = normalize(version), self.versions()
+        if number is None or not versions or not int(versions[0]) <= number <= int(versions[-1]):
+            return None
+        offset = number - FIRST_VERSION
+        return False if self.absent[offset // 8] & (0x80 >> (offset % 8)) else None
+
+    def latest(self, prefix=""):
+        """Newest released version whose digits start with prefix ('1.4.4' or '144'), or None."""
+        digits = prefix.replace(".", "")
+        matching = [v for v in self.versions() if v.startswith(digits)]
+        return matching[-1] if matching else None
+
+    def refresh(self, jobs=4):
+        """Add the dedicated-servers-names list, then probe above the newest entry.
+
+        Each released version found leads to probing its next hotfix, minor and
+        major versions until none is released. Returns the newly added versions
+        in ascending order, or None if the list or a probe got no definite
+        answer; what was found is kept either way, but the refresh time is
+        only updated on success.
+        """
+        before = set(self.versions())
+        complete = True
+        filenames = get_latest_filename.get_filenames()
+        if filenames is None:
+            complete = False
+        else:
+            for filename in filenames:
+                match = re.fullmatch(r"terraria-server-(\d+)\.zip", filename)
+                if match:
+                    self.add(match.group(1))
+
+        newest = self.newest()
+        probed = set()
+        frontier = get_latest_version.next_candidates(newest) if newest else []
+        while frontier:
+            probed.update(frontier)
+            results = get_latest_version.probe_versions(frontier, jobs)
+            released = [version for version, available in results.items() if available]
+            if any(available is None for available in results.values()):
+                complete = False
+            for version in released:
+                self.add(version)
+            for version, available in results.items():
+                if available is False:
+                    self.add_absent(version)
+            frontier = [candidate for version in released for candidate in get_latest_version.next_candidates(version)
+                        if candidate not in probed]
+
+        if complete:
+            self.refreshed_at = int(time.time())
+        self.save()
+        added = sorted(set(self.versions()) - before, key=int)
+        return added if complete else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or refresh the index of released server versions.")
+    parser.add_argument("--index-file", default=None,
+                        help="index location (default: version-index.bin in $TERRARIA_CACHE_DIR)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    refresh_parser = subparsers.add_parser("refresh", help="add newly released versions")
+    refresh_parser.add_argument("-j", "--jobs", type=int, default=4, help="probes in flight (default: 4)")
+    subparsers.add_parser("list", help="print every released version")
+    latest_parser = subparsers.add_parser("latest", help="print the newest version, optionally within a series")
+    latest_parser.add_argument("prefix", nargs="?", default="", help="series such as 1.4.4 or 144")
+    exists_parser = subparsers.add_parser("exists", help="exit 0 if VERSION was released, 3 if not")
+    exists_parser.add_argument("version")
+    args = parser.parse_args(argv)
+
+    index = VersionIndex(args.index_file)
+    if args.command == "refresh":
+        added = index.refresh(args.jobs)
+        if added is None:
+            print("Error: could not refresh the version index completely", file=sys.stderr)
+            return 1
+        print(f"Added {len(added)} version(s){': ' + ', '.join(added) if added else ''}; newest {index.newest()}")
+        return 0
+    if args.command == "list":
+        for version in index.versions():
+            print(version)
+        return 0
+    if args.command == "latest":
+        version = index.latest(args.prefix)
+        if version is None:
+            print(f"Error: no released version matches '{args.prefix}'", file=sys.stderr)
+            return 1
+        print(version)
+        return 0
+
+    released = index.exists(args.version)
+    if released is None:
+        print(f"Unknown: the index does not know whether {args.version} was released", file=sys.stderr)
+        return 1
+    print(f"{args.version} {'was' if released else 'was not'} released")
+    return 0 if released else NOT_RELEASED_EXIT
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Pool of pre-generated worlds, so a new world does not wait for world generation.
+
+    python3 world_pool.py fill --spec 2:1,3:2:myseed [--count N] [--cpus N] [--worldpath DIR]
+    python3 world_pool.py status --spec ... [--worldpath DIR]
+
+A spec lists SIZE:DIFFICULTY[:SEED] tuples (size 1-3, difficulty 0-3, as
+autocreate and difficulty; no seed means a random one), separated by
+commas. fill generates worlds until the pool holds --count of each,
+running up to --cpus servers at a time with a lower priority. The pool lives
+in <worldpath>/.pool, one directory per tuple:
+
+    .pool/2-1-random/<id>.wld
+    .pool/3-2-seed-<start of the seed's sha256>/<id>.wld
+
+A world is generated by starting the server with autocreate on a spare port
+and, once it accepts connections (so the world is written), sending it the
+"exit" command. Only one fill runs per pool at a time.
+
+create_server_config.py claims a pooled world when the worldpool variable is
+set and the world it would otherwise autocreate has a matching tuple: the
+file is renamed into place, which is atomic, so two servers never get the
+same world. A claimed world keeps the in-game name it was generated with
+(POOL_WORLD_NAME), so none is claimed when worldname is set to another name.
+When a tuple is below its count, a fill is started in the background.
+"""
+
+import argparse
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import idle_proxy
+
+DEFAULT_WORLDPATH = "/root/.local/share/Terraria/Worlds"
+POOL_DIR_NAME = ".pool"
+LOCK_NAME = ".lock"
+GENERATING_PREFIX = ".generating-"
+POOL_WORLD_NAME = "World"
+# World generation happens before the server opens its port; a large world takes minutes
+GENERATE_TIMEOUT = 1800.0
+# Niceness of the fill process and the servers it starts, below the running game server
+FILL_NICE = 10
+DEFAULT_COUNT = 1
+DEFAULT_CPUS = 1
+
+
+def pool_dir(worldpath):
+    return os.path.join(worldpath, POOL_DIR_NAME)
+
+
+def parse_spec(text):
+    """'2:1,3:2:myseed' -> [(2, 1, ''), (3, 2, 'myseed')]. Raises ValueError."""
+    specs = []
+    for part in text.split(","):
+        fields = part.strip().split(":", 2)
+        if len(fields) < 2 or not all(field.strip().isdigit() for field in fields[:2]):
+            raise ValueError(f"'{part}' is not SIZE:DIFFICULTY[:SEED]")
+        size, difficulty = int(fields[0]), int(fields[1])
+        if not 1 <= size <= 3:
+            raise ValueError(f"'{part}': size must be between 1 and 3")
+        if not 0 <= difficulty <= 3:
+            raise ValueError(f"'{part}': difficulty must be between 0 and 3")
+        spec = (size, difficulty, fields[2] if len(fields) > 2 else "")
+        if spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def tuple_name(size, difficulty, seed):
+    """Directory name of a (size, difficulty, seed) tuple in the pool."""
+    seed_key = "seed-" + hashlib.sha256(seed.encode("utf-8")).hexdigest()[:16] if seed else "random"
+    return f"{int(size)}-{int(difficulty)}-{seed_key}"
+
+
+def pooled_worlds(pool, size, difficulty, seed):
+    """Ready worlds of one tuple, oldest name first."""
+    directory = os.path.join(pool, tuple_name(size, difficulty, seed))
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(os.path.join(directory, name) for name in names if name.endswith(".wld"))
+
+
+def claim(pool, size, difficulty, seed, destination):
+    """Move a pooled world of the tuple to destination. Returns its pool path, or None if there is none.
+
+    The rename either takes a world whole or fails because another claim got it
+    first, in which case the next one is tried.
+    """
+    for path in pooled_worlds(pool, size, difficulty, seed):
+        try:
+            os.rename(path, destination)
+            return path
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def deficits(pool, specs, count):
+    """The tuples to generate to bring every spec up to count worlds."""
+    return [spec for spec in specs for _ in range(max(0, count - len(pooled_worlds(pool, *spec))))]
+
+
+def _free_port():
+    with idle_proxy.listen_socket("127.0.0.1", 0) as sock:
+        return sock.getsockname()[1]
+
+
+def generate_world(pool, spec, command=None, timeout=GENERATE_TIMEOUT):
+    """Generate one world for spec and add it to the pool. Returns its path."""
+    size, difficulty, seed = spec
+    work_dir = tempfile.mkdtemp(dir=pool, prefix=GENERATING_PREFIX)
+    try:
+        world = os.path.join(work_dir, "world.wld")
+        config = os.path.join(work_dir, "server-config.conf")
+        banlist = os.path.join(work_dir, "banlist.txt")
+        open(banlist, "a").close()
+        port = _free_port()
+        # Nobody should join a world being generated, so it gets a throwaway password
+        lines = [f"world={world}", f"autocreate={size}", f"seed={seed}", f"worldname={POOL_WORLD_NAME}",
+                 f"difficulty={difficulty}", "maxplayers=1", f"port={port}", f"password={uuid.uuid4().hex}",
+                 f"worldpath={work_dir}", f"banlist={banlist}", "secure=1", "upnp=0"]
+        with open(config, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        backend = idle_proxy.Backend((command or idle_proxy.server_command()) + ["-config", config], port,
+                                     start_timeout=timeout)
+        try:
+            backend.ensure_running()
+        finally:
+            backend.stop()
+        if not os.path.isfile(world):
+            raise idle_proxy.BackendUnavailable(f"the server did not write {world}")
+
+        directory = os.path.join(pool, tuple_name(*spec))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{uuid.uuid4().hex}.wld")
+        os.rename(world, path)
+        return path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _remove_stale(pool):
+    for name in os.listdir(pool):
+        if name.startswith(GENERATING_PREFIX):
+            shutil.rmtree(os.path.join(pool, name), ignore_errors=True)
+
+
+def fill(pool, specs, count=DEFAULT_COUNT, cpus=DEFAULT_CPUS, command=None, timeout=GENERATE_TIMEOUT):
+    """Generate worlds until every spec has count of them, cpus at a time.
+
+    Worlds claimed while it runs are replaced too. Returns the number of worlds
+    generated, or None if another fill of the pool is already running. Stops
+    early when a whole round of generations fails.
+    """
+    os.makedirs(pool, exist_ok=True)
+    with open(os.path.join(pool, LOCK_NAME), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"Another fill of {pool} is running")
+            return None
+        # Left over by a fill that was killed; nothing else uses them while the lock is held
+        _remove_stale(pool)
+
+        def generate(spec):
+            try:
+                path = generate_world(pool, spec, command, timeout)
+            except (OSError, idle_proxy.BackendUnavailable) as e:
+                print(f"Error: could not generate a {tuple_name(*spec)} world: {e}", file=sys.stderr, flush=True)
+                return None
+            print(f"Generated {path}", flush=True)
+            return path
+
+        generated = 0
+        while True:
+            jobs = deficits(pool, specs, count)
+            if not jobs:
+                return generated
+            print(f"Generating {len(jobs)} world(s), {min(cpus, len(jobs))} at a time", flush=True)
+            with ThreadPoolExecutor(max_workers=max(1, cpus)) as executor:
+                done = sum(1 for path in executor.map(generate, jobs) if path)
+            if not done:
+                return generated
+            generated += done
+
+
+def start_fill(worldpath, spec, count=DEFAULT_COUNT, cpus=DEFAULT_CPUS):
+    """Run a fill of the pool under worldpath in the background if a tuple of spec has fewer than count worlds.
+
+    Returns the fill process, or None when the pool is full.
+    """
+    if not deficits(pool_dir(worldpath), parse_spec(spec), count):
+        return None
+    command = [sys.executable, os.path.abspath(__file__), "fill", "--worldpath", worldpath, "--spec", spec,
+               "--count", str(count), "--cpus", str(cpus)]
+    return subprocess.Popen(command, stdin=subprocess.DEVNULL, start_new_session=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep a pool of pre-generated worlds.")
+    parser.add_argument("command", choices=("fill", "status"))
+    parser.add_argument("--spec", default=os.environ.get("worldpool", ""),
+                        help="SIZE:DIFFICULTY[:SEED] tuples separated by commas (default: $worldpool)")
+    parser.add_argument("--worldpath", default=os.environ.get("worldpath") or DEFAULT_WORLDPATH,
+                        help="directory holding the pool (default: $worldpath)")
+    parser.add_argument("--count", type=int, default=int(os.environ.get("worldpoolcount") or DEFAULT_COUNT),
+                        help=f"worlds to keep per tuple (default: {DEFAULT_COUNT}, or $worldpoolcount)")
+    parser.add_argument("--cpus", type=int, default=int(os.environ.get("worldpoolcpus") or DEFAULT_CPUS),
+                        help=f"worlds generated at a time (default: {DEFAULT_CPUS}, or $worldpoolcpus)")
+    args = parser.parse_args(argv)
+    try:
+        specs = parse_spec(args.spec)
+    except ValueError as e:
+        print(f"Error: invalid world pool spec: {e}", file=sys.stderr)
+        return 1
+    if args.count < 0 or args.cpus < 1:
+        parser.error("--count must not be negative and --cpus must be at least 1")
+
+    pool = pool_dir(args.worldpath)
+    if args.command == "status":
+        for spec in specs:
+            print(f"{tuple_name(*spec)}: {len(pooled_worlds(pool, *spec))}/{args.count}")
+        return 0
+
+    os.nice(FILL_NICE)
+    generated = fill(pool, specs, args.count, args.cpus)
+    if generated is not None:
+        missing = len(deficits(pool, specs, args.count))
+        print(f"Generated {generated} world(s)" + (f", {missing} still missing" if missing else ""))
+        return 1 if missing else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Run several worlds from one server install, one TerrariaServer process each.
+
+    python3 world_supervisor.py [worlds.json] [--instances-dir DIR]
+
+An alternative entry point to init-TerrariaServer-amd64.sh/arm64.sh for
+packing many small worlds into one container. The worlds file (default
+$TERRARIA_WORLDS or worlds.json) lists one definition per world:
+
+    {
+      "defaults": {"maxplayers": 8, "difficulty": 1},
+      "worlds": [
+        {"name": "castle", "port": 7777, "world": "castle.wld", "cpus": "0-1", "nice": 0},
+        {"name": "sandbox", "port": 7778, "worldname": "sandbox", "autocreate": 1, "cpus": [2], "nice": 10}
+      ]
+    }
+
+Each definition takes the settings of create_server_config.py (unset ones
+come from "defaults", then from the environment, then from the Dockerfile
+defaults), plus:
+
+    name    instance name; the config goes to <instances dir>/<name>/
+    port    required, and different for every world
+    cpus    CPU affinity: a list of CPU numbers, a string such as "0-3,6",
+            or "auto" for one CPU per world, handed out in turn
+    nice    scheduling priority, -20 (highest) to 19
+
+A world without world or worldname set uses its name as worldname; the
+world and worldname of the environment belong to the single server setup
+and are never used. Each world gets its own banlist.txt next to its config unless banlist is set.
+Every world's settings are validated before any server starts. A server
+that exits with an error is restarted after 1, 2, 4... up to 60 seconds,
+reset once it has stayed up for a minute; one that exits cleanly stays
+stopped. SIGTERM or SIGINT sends each server the "exit" console command, so
+it saves its world, and kills whatever is still running after STOP_TIMEOUT.
+Server output is printed with a [name] prefix.
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import create_server_config
+import idle_proxy
+
+DEFAULT_WORLDS_FILE = "worlds.json"
+DEFAULT_INSTANCES_DIR = "instances"
+NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*")
+SUPERVISOR_KEYS = ("name", "cpus", "nice")
+
+# Restart delay after the n-th consecutive failure: min(RESTART_CAP, RESTART_BASE * 2 ** (n - 1))
+RESTART_BASE = 1.0
+RESTART_CAP = 60.0
+# A server that ran this long before exiting starts over from RESTART_BASE
+STABLE_AFTER = 60.0
+# Seconds the servers get to save and exit; docker stop waits 10 by default
+STOP_TIMEOUT = 8.0
+POLL_INTERVAL = 0.5
+
+
+class WorldsError(ValueError):
+    """The worlds file is invalid."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def parse_cpus(value, available):
+    """A list of CPU numbers or a string like "0-3,6" -> sorted list, each in available."""
+    if isinstance(value, list):
+        if not all(isinstance(cpu, int) and not isinstance(cpu, bool) for cpu in value):
+            raise ValueError("must list CPU numbers")
+        cpus = set(value)
+    elif isinstance(value, str) and re.fullmatch(r"\d+(-\d+)?(,\d+(-\d+)?)*", value):
+        cpus = set()
+        for part in value.split(","):
+            first, _, last = part.partition("-")
+            cpus.update(range(int(first), int(last or first) + 1))
+    else:
+        raise ValueError('must be a list of CPU numbers, a string such as "0-3,6" or "auto"')
+    if not cpus:
+        raise ValueError("must name at least one CPU")
+    missing = cpus - set(available)
+    if missing:
+        raise ValueError(f"names CPUs this container cannot use: {', '.join(map(str, sorted(missing)))}")
+    return sorted(cpus)
+
+
+class Instance:
+    """One world and the server process running it."""
+
+    def __init__(self, name, config_path, cpus=None, nice=None, command=None):
+        self.name = name
+        self.config_path = config_path
+        self.cpus = cpus
+        self.nice = nice
+        self.command = (command or idle_proxy.server_command()) + ["-config", config_path]
+        self.process = None
+        self.started_at = None
+        self.failures = 0
+        self.next_start = 0.0
+        self.stopped = False
+
+    def launch_command(self):
+        """The command behind taskset and nice, so every thread of the server inherits the affinity and priority.
+
+        A preexec_fn is not safe here: the supervisor already runs output threads when it forks.
+        """
+        prefix = []
+        if self.cpus is not None:
+            prefix += ["taskset", "-c", ",".join(str(cpu) for cpu in self.cpus)]
+        if self.nice is not None:
+            # nice takes an increment; nice is the absolute priority
+            prefix += ["nice", "-n", str(self.nice - os.getpriority(os.PRIO_PROCESS, 0))]
+        return prefix + self.command
+
+    def start(self):
+        self.process = subprocess.Popen(self.launch_command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT)
+        self.started_at = time.monotonic()
+        threading.Thread(target=self._forward_output, args=(self.process,), daemon=True).start()
+        print(f"[{self.name}] started (pid {self.process.pid})", flush=True)
+
+    def _forward_output(self, process):
+        for line in process.stdout:
+            print(f"[{self.name}] {line.decode('utf-8', 'replace').rstrip()}", flush=True)
+
+    def exited(self, now):
+        """Handle the exit of the server: schedule a restart unless it exited cleanly."""
+        code = self.process.returncode
+        ran = now - self.started_at
+        self.process = None
+        if code == 0:
+            self.stopped = True
+            print(f"[{self.name}] exited cleanly, not restarting", flush=True)
+            return
+        if ran >= STABLE_AFTER:
+            self.failures = 0
+        delay = self.schedule_restart(now)
+        print(f"[{self.name}] exited with status {code} after {ran:.1f}s, restarting in {delay:g}s", flush=True)
+
+    def schedule_restart(self, now):
+        """Count a failure and return the delay before the next start."""
+        self.failures += 1
+        delay = min(RESTART_CAP, RESTART_BASE * 2 ** (self.failures - 1))
+        self.next_start = now + delay
+        return delay
+
+    def request_stop(self):
+        """Ask the server to save and exit through its console."""
+        self.stopped = True
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b"exit\n")
+            self.process.stdin.flush()
+        except OSError:
+            pass
+
+
+def load_worlds(path):
+    """Read a worlds file: {"defaults": {...}, "worlds": [...]} or just the list of worlds."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {"worlds": data}
+    if not isinstance(data, dict) or not isinstance(data.get("worlds"), list) or not data["worlds"]:
+        raise WorldsError([f"{path} must hold a non-empty list of worlds"])
+    defaults = data.get("defaults", {})
+    if not isinstance(defaults, dict):
+        raise WorldsError([f"{path}: defaults must be an object"])
+    return defaults, data["worlds"]
+
+
+def _as_setting(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    return str(value)
+
+
+def build_instances(defaults, worlds, instances_dir, environ=None, command=None):
+    """Validate every world and write its config. Returns the Instances; raises WorldsError."""
+    environ = os.environ if environ is None else environ
+    available = sorted(os.sched_getaffinity(0))
+    errors, instances, names, ports = [], [], set(), {}
+    for index, world in enumerate(worlds):
+        if not isinstance(world, dict):
+            errors.append(f"world #{index + 1} must be an object")
+            continue
+        name = world.get("name")
+        label = name if isinstance(name, str) else f"world #{index + 1}"
+        if not isinstance(name, str) or not NAME_PATTERN.fullmatch(name):
+            errors.append(f"{label}: name must be letters, digits, '.', '_' or '-'")
+            continue
+        if name in names:
+            errors.append(f"{name}: name used twice")
+            continue
+        names.add(name)
+
+        unknown = sorted(set(world) - set(create_server_config.SETTINGS) - set(SUPERVISOR_KEYS) - {"port"})
+        unknown += sorted(set(defaults) - set(create_server_config.SETTINGS))
+        if unknown:
+            errors.append(f"{name}: unknown setting(s) {', '.join(dict.fromkeys(unknown))}")
+            continue
+        if "port" not in world:
+            errors.append(f"{name}: port is required")
+            continue
+
+        settings = {key: value for key, value in environ.items()
+                    if key in create_server_config.SETTINGS and key not in ("world", "worldname")}
+        settings.update({key: _as_setting(value) for key, value in defaults.items()})
+        settings.update({key: _as_setting(value) for key, value in world.items() if key not in SUPERVISOR_KEYS})
+        if not world.get("world") and not world.get("worldname"):
+            settings.pop("world", None)
+            settings["worldname"] = name
+        instance_dir = os.path.join(instances_dir, name)
+        if "banlist" not in world and "banlist" not in defaults:
+            settings["banlist"] = os.path.abspath(os.path.join(instance_dir, create_server_config.DEFAULT_BANLIST))
+        try:
+            validated = create_server_config.load_settings(settings)
+        except create_server_config.ConfigError as e:
+            errors.extend(f"{name}: {error}" for error in e.errors)
+            continue
+        if validated["port"] in ports:
+            errors.append(f"{name}: port {validated['port']} is already used by {ports[validated['port']]}")
+            continue
+        ports[validated["port"]] = name
+
+        cpus = world.get("cpus")
+        try:
+            if cpus == "auto":
+                cpus = [available[len(instances) % len(available)]]
+            elif cpus is not None:
+                cpus = parse_cpus(cpus, available)
+        except ValueError as e:
+            errors.append(f"{name}: cpus {e}")
+            continue
+        nice = world.get("nice")
+        if nice is not None and (not isinstance(nice, int) or isinstance(nice, bool) or not -20 <= nice <= 19):
+            errors.append(f"{name}: nice must be a whole number between -20 and 19")
+            continue
+        instances.append((name, instance_dir, settings, cpus, nice))
+
+    if errors:
+        raise WorldsError(errors)
+
+    result = []
+    for name, instance_dir, settings, cpus, nice in instances:
+        os.makedirs(instance_dir, exist_ok=True)
+        if os.path.isabs(settings["banlist"]):
+            open(settings["banlist"], "a").close()
+        config_path = os.path.abspath(os.path.join(instance_dir, create_server_config.CONFIG_NAME))
+        print(f"[{name}] port {settings['port']}" + (f", cpus {cpus}" if cpus else "") +
+              (f", nice {nice}" if nice is not None else ""))
+        create_server_config.create_config(config_path, settings)
+        result.append(Instance(name, config_path, cpus, nice, command))
+    return result
+
+
+class Supervisor:
+    """Starts the instances, restarts failed ones and stops them all on request."""
+
+    def __init__(self, instances, stop_timeout=STOP_TIMEOUT):
+        self.instances = instances
+        self.stop_timeout = stop_timeout
+        self.stopping = threading.Event()
+
+    def poll(self, now=None):
+        """Reap exited servers and start the ones that are due. Returns False once none is left to run."""
+        now = time.monotonic() if now is None else now
+        for instance in self.instances:
+            if instance.process is not None and instance.process.poll() is not None:
+                instance.exited(now)
+            if instance.process is None and not instance.stopped and now >= instance.next_start:
+                try:
+                    instance.start()
+                except OSError as e:
+                    delay = instance.schedule_restart(now)
+                    print(f"[{instance.name}] could not start: {e}, retrying in {delay:g}s", file=sys.stderr, flush=True)
+        return any(not instance.stopped or instance.process is not None for instance in self.instances)
+
+    def run(self):
+        while not self.stopping.is_set():
+            if not self.poll():
+                return
+            self.stopping.wait(POLL_INTERVAL)
+        self.stop()
+
+    def stop(self):
+        """Ask every server to exit, then kill the ones still running after stop_timeout."""
+        print("Stopping servers...", flush=True)
+        for instance in self.instances:
+            instance.request_stop()
+        deadline = time.monotonic() + self.stop_timeout
+        for instance in self.instances:
+            if instance.process is None:
+                continue
+            try:
+                instance.process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                print(f"[{instance.name}] did not exit in time, killing it", file=sys.stderr, flush=True)
+                instance.process.kill()
+                instance.process.wait()
+            instance.process = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several Terraria worlds from one server install.")
+    parser.add_argument("worlds_file", nargs="?", default=os.environ.get("TERRARIA_WORLDS", DEFAULT_WORLDS_FILE),
+                        help=f"world definitions (default: $TERRARIA_WORLDS or {DEFAULT_WORLDS_FILE})")
+    parser.add_argument("--instances-dir", default=DEFAULT_INSTANCES_DIR,
+                        help=f"directory for the per-world configs (default: {DEFAULT_INSTANCES_DIR})")
+    parser.add_argument("--stop-timeout", type=float, default=STOP_TIMEOUT,
+                        help=f"seconds the servers get to save and exit when stopping (default: {STOP_TIMEOUT:g})")
+    args = parser.parse_args(argv)
+
+    try:
+        defaults, worlds = load_worlds(args.worlds_file)
+        instances = build_instances(defaults, worlds, args.instances_dir)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error: cannot read {args.worlds_file}: {e}", file=sys.stderr)
+        return 1
+    except WorldsError as e:
+        for error in e.errors:
+            print(f"Error: {error}", file=sys.stderr)
+        return 1
+
+    supervisor = Supervisor(instances, args.stop_timeout)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: supervisor.stopping.set())
+    supervisor.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for version discovery, download and pruning.
+
+Runs the scripts against a local stand-in for terraria.org (fake_terraria.py)
+and reports, per scenario, wall time, requests answered by the stand-in, body
+bytes it sent, connections opened and peak RSS. Each run happens in a fresh
+interpreter so the RSS figure belongs to that scenario alone.
+
+    python3 tests/benchmark.py --latency 50 --bandwidth 20 -o results.json
+
+Latency is in milliseconds and bandwidth in MiB/s per connection. Results are
+written as JSON (to stdout without --output) so runs can be compared over time.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+for path in (script_dir, tests_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import fake_terraria
+import http_pool
+
+DEFAULT_VERSIONS = ['1436', '1449', '1450', '1451', '1452']
+
+
+def _find(strategy, jobs_option=False):
+    def run(work_dir, options):
+        import get_latest_version
+        stats = {}
+        jobs = options['jobs'] if jobs_option else 1
+        version = get_latest_version.find_highest_version(jobs=jobs, strategy=strategy, stats=stats)
+        return {'version': version, 'probes': stats['probes']}
+    return run
+
+
+def _download(work_dir, options):
+    import download_server
+    download_server.download_server('latest', work_dir, connections=options['connections'], use_cache=False)
+    return os.path.getsize(os.path.join(work_dir, 'terraria-server.zip'))
+
+
+def _download_linux_only(work_dir, options):
+    import download_server
+    download_server.download_server('latest', work_dir, connections=options['connections'], use_cache=False,
+                                    linux_only=True)
+    return sum(len(names) for _, _, names in os.walk(work_dir))
+
+
+def _prune(work_dir, options):
+    import prune_unused_files
+    prune_unused_files.prune(work_dir)
+    return sum(len(names) for _, _, names in os.walk(work_dir))
+
+
+# name -> (function run in the child, whether the work directory starts with the latest zip)
+SCENARIOS = {
+    'find_highest_version': (_find('linear'), False),
+    'find_highest_version_parallel': (_find('linear', jobs_option=True), False),
+    'find_highest_version_gallop': (_find('gallop'), False),
+    'find_highest_version_api': (_find('api'), False),
+    'find_highest_version_agree': (_find('agree'), False),
+    'download_server': (_download, False),
+    'download_server_linux_only': (_download_linux_only, False),
+    'prune': (_prune, True),
+}
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB.
+
+    ru_maxrss is kept across exec, so a spawned child would report the parent's
+    peak if it was higher; VmHWM belongs to the new address space.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _child(name, base_url, work_dir, options, conn):
+    """Run one scenario in this (fresh) process and send its measurements back."""
+    if not options['verbose']:
+        sys.stdout = open(os.devnull, 'w')
+    fake_terraria.route_to(base_url)
+    try:
+        started = time.perf_counter()
+        result = SCENARIOS[name][0](work_dir, options)
+        wall_time = time.perf_counter() - started
+        connections = http_pool.get_pool().connections_opened
+        http_pool.close_all()
+        conn.send({
+            'wall_time': wall_time,
+            'result': result,
+            'connections': connections,
+            'peak_rss_kb': peak_rss_kb(),
+        })
+    except BaseException:
+        conn.send({'error': traceback.format_exc()})
+
+
+def run_scenario(fake, name, options):
+    """Run a scenario once in a spawned interpreter. Returns its measurements."""
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as work_dir:
+        if SCENARIOS[name][1]:
+            with open(os.path.join(work_dir, 'terraria-server.zip'), 'wb') as f:
+                f.write(fake.archive(fake.versions[-1]))
+        fake.reset_counters()
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_child, args=(name, fake.base_url, work_dir, options, sender))
+        process.start()
+        sender.close()
+        try:
+            measurement = receiver.recv()
+        except EOFError:
+            measurement = {'error': 'benchmark process exited without reporting'}
+        process.join()
+
+    if 'error' in measurement:
+        raise RuntimeError(f"Scenario {name} failed:\n{measurement['error']}")
+    counters = fake.counters()
+    measurement.update(requests=counters['requests'], bytes=counters['bytes'], requests_by_kind=counters['by_kind'])
+    return measurement
+
+
+def run_benchmarks(scenarios, repeat=1, jobs=8, connections=4, verbose=False, **server_options):
+    """Run scenarios against a fresh stand-in server. Returns the JSON-ready report."""
+    options = {'jobs': jobs, 'connections': connections, 'verbose': verbose}
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': dict(options, repeat=repeat),
+        'server': {},
+        'scenarios': {},
+    }
+    with fake_terraria.FakeTerraria(**server_options) as fake:
+        # Generate every archive up front so it is not timed as server latency
+        for version in fake.versions:
+            fake.archive(version)
+        report['server'] = {
+            'versions': fake.versions, 'wiki_version': fake.wiki_version, 'latency': fake.latency,
+            'bandwidth': fake.bandwidth, 'head_405': fake.head_405, 'ranges': fake.ranges,
+            'archive_size': len(fake.archive(fake.versions[-1])),
+        }
+        for name in scenarios:
+            runs = [run_scenario(fake, name, options) for _ in range(repeat)]
+            times = [run['wall_time'] for run in runs]
+            report['scenarios'][name] = {
+                'wall_time_min': min(times),
+                'wall_time_median': statistics.median(times),
+                'runs': runs,
+            }
+            print(f"{name:32} {statistics.median(times):8.3f}s {runs[-1]['requests']:6} requests "
+                  f"{runs[-1]['bytes']:12} bytes {runs[-1]['peak_rss_kb']:8} KiB RSS", file=sys.stderr)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scripts against a simulated terraria.org.")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"scenarios to run, from {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--versions', default=','.join(DEFAULT_VERSIONS),
+                        help="comma separated available versions (default: %(default)s)")
+    parser.add_argument('--wiki-version', default='1449', help="version linked from the wiki page")
+    parser.add_argument('--latency', type=float, default=0, help="added latency per response in milliseconds")
+    parser.add_argument('--bandwidth', type=float, default=None, help="MiB/s per connection (default: unlimited)")
+    parser.add_argument('--head-405', action='store_true', help="answer HEAD requests with 405")
+    parser.add_argument('--no-ranges', action='store_true', help="ignore Range requests")
+    parser.add_argument('--archive-mb', type=float, default=16, help="size of the generated server zips")
+    parser.add_argument('-j', '--jobs', type=int, default=8, help="jobs for the parallel version search")
+    parser.add_argument('-c', '--connections', type=int, default=4, help="download connections")
+    parser.add_argument('-r', '--repeat', type=int, default=1, help="runs per scenario")
+    parser.add_argument('-o', '--output', default=None, help="write the JSON report here instead of stdout")
+    parser.add_argument('-v', '--verbose', action='store_true', help="show the scripts' own output")
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario '{name}'")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmarks(
+        args.scenarios or list(SCENARIOS), repeat=args.repeat, jobs=args.jobs, connections=args.connections,
+        verbose=args.verbose, versions=args.versions.split(','), wiki_version=args.wiki_version,
+        latency=args.latency / 1000, bandwidth=args.bandwidth * 1024 * 1024 if args.bandwidth else None,
+        head_405=args.head_405, ranges=not args.no_ranges, archive_size=int(args.archive_mb * 1024 * 1024))
+    with (open(args.output, 'w') if args.output else contextlib.nullcontext(sys.stdout)) as out:
+        json.dump(report, out, indent=2)
+        out.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the terraria.org endpoints the scripts talk to.
+
+Serves, on one loopback HTTP server:
+
+    /wiki/Server                                     Fandom page linking the wiki version
+    /api/get/dedicated-servers-names                 JSON list of archive names, newest first
+    /api/download/pc-dedicated-server/<filename>     generated server zips (404 if unavailable)
+
+Latency, bandwidth, HEAD handling and Range support are configurable, and the
+server counts the requests it answered and the body bytes it sent. route_to()
+points http_pool at it, so the scripts run unchanged against it.
+"""
+
+import io
+import json
+import random
+import re
+import socket
+import threading
+import time
+import zipfile
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import http_pool
+
+REAL_ORIGINS = ("https://terraria.org", "https://terraria.fandom.com")
+ARCHIVE_PATH = re.compile(r"^/api/download/pc-dedicated-server/terraria-server-(\d{4})\.zip$")
+WRITE_SIZE = 64 * 1024
+WIKI_LAST_MODIFIED = "Tue, 01 Oct 2024 12:00:00 GMT"
+
+
+def build_archive(version, size):
+    """Return a server zip of about size bytes laid out like the official one.
+
+    Member data is random so it does not compress; about a third of it is in the
+    Linux tree, like the real archive.
+    """
+    rng = random.Random(int(version))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"{version}/", b"")
+        for platform in ("Linux", "Mac", "Windows"):
+            files = 8
+            for i in range(files):
+                info = zipfile.ZipInfo(f"{version}/{platform}/file{i}.dll")
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o100644 << 16
+                zf.writestr(info, rng.randbytes(max(1, size // 3 // files)))
+        info = zipfile.ZipInfo(f"{version}/Linux/TerrariaServer.bin.x86_64")
+        info.external_attr = 0o100755 << 16
+        zf.writestr(info, b"\x7fELF")
+    return buffer.getvalue()
+
+
+class FakeTerraria:
+    """Threaded HTTP server impersonating terraria.org and the Fandom wiki.
+
+    versions: available versions ('1449', ...). wiki_version: version linked
+    from the wiki page (default: the lowest). latency: seconds added before each
+    response. bandwidth: body bytes per second per connection, None for
+    unlimited. head_405: answer HEAD with 405 like some CDNs. ranges: honor Range
+    requests. archive_size: approximate size of each generated zip.
+    counters() also reports the most requests that were being answered at once.
+    wiki_padding: bytes of page content around the download links. The wiki
+    page carries an ETag and Last-Modified and answers matching conditional
+    requests with 304.
+    """
+
+    def __init__(self, versions, wiki_version=None, latency=0.0, bandwidth=None, head_405=False,
+                 ranges=True, archive_size=4 * 1024 * 1024, wiki_padding=300 * 1024):
+        self.versions = sorted(versions)
+        self.wiki_version = wiki_version or self.versions[0]
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.head_405 = head_405
+        self.ranges = ranges
+        self.archive_size = archive_size
+        self.wiki_padding = wiki_padding
+        self.lock = threading.Lock()
+        self._archives = {}
+        self.reset_counters()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self.requests_by_kind = {}
+            self.in_flight = 0
+            self.peak_in_flight = 0
+
+    def counters(self):
+        with self.lock:
+            return {"requests": self.requests, "bytes": self.bytes_sent, "by_kind": dict(self.requests_by_kind),
+                    "peak_in_flight": self.peak_in_flight}
+
+    def archive(self, version):
+        with self.lock:
+            if version not in self._archives:
+                self._archives[version] = build_archive(version, self.archive_size)
+            return self._archives[version]
+
+    def wiki_page(self):
+        """Server page with the download links between about 300 KB of other content, like the real one."""
+        links = "".join(
+            f'<tr><td><a href="https://terraria.org/api/download/pc-dedicated-server/terraria-server-{v}.zip">'
+            f'{".".join(v)}</a></td></tr>\n'
+            for v in self.versions if int(v) <= int(self.wiki_version))
+        filler = '<p class="filler">' + "lorem ipsum " * 40 + "</p>\n"
+        before = filler * (self.wiki_padding // 4 // len(filler))
+        after = filler * (self.wiki_padding * 3 // 4 // len(filler))
+        return f"<html><body>{before}<table>{links}</table>{after}</body></html>".encode("utf-8")
+
+    def names(self):
+        return json.dumps([f"terraria-server-{v}.zip" for v in reversed(self.versions)]).encode("utf-8")
+
+    # Counters are updated before the data goes out, so a client that got its
+    # response always sees it counted
+    def _count_request(self, kind):
+        with self.lock:
+            self.requests += 1
+            self.requests_by_kind[kind] = self.requests_by_kind.get(kind, 0) + 1
+
+    def _count_bytes(self, n):
+        with self.lock:
+            self.bytes_sent += n
+
+    def _enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; without this, Nagle's
+                # algorithm and delayed ACKs add ~40 ms to every small response
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def respond(self, head):
+                fake._enter()
+                try:
+                    self.route(head)
+                finally:
+                    fake._leave()
+
+            def route(self, head):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                path = self.path.split("?")[0]
+                match = ARCHIVE_PATH.match(path)
+                if path == "/wiki/Server":
+                    page = fake.wiki_page()
+                    etag = f'"{zlib.crc32(page):08x}"'
+                    if self.headers.get("If-None-Match") == etag \
+                            or self.headers.get("If-Modified-Since") == WIKI_LAST_MODIFIED:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_body("wiki", None, b"", "text/html", head)
+                        return
+                    self.send_response(200)
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", WIKI_LAST_MODIFIED)
+                    self.send_body("wiki", None, page, "text/html", head)
+                elif path == "/api/get/dedicated-servers-names":
+                    self.send_body("names", 200, fake.names(), "application/json", head)
+                elif match and head and fake.head_405:
+                    self.send_body("head", 405, b"", "text/plain", head)
+                elif match and match.group(1) in fake.versions:
+                    self.send_archive(fake.archive(match.group(1)), head)
+                else:
+                    self.send_body("probe" if head else "missing", 404, b"Not found", "text/plain", head)
+
+            def send_archive(self, data, head):
+                range_header = self.headers.get("Range")
+                if fake.ranges and range_header and not head:
+                    start, end = range_header.split("=", 1)[1].split("-")
+                    start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                    body = memoryview(data)[start:end + 1]
+                    kind = "range"
+                else:
+                    self.send_response(200)
+                    body = memoryview(data)
+                    kind = "probe" if head else "archive"
+                if fake.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", f'"{len(data)}"')
+                self.finish_body(kind, body, "application/zip", head)
+
+            def send_body(self, kind, status, body, content_type, head):
+                if status is not None:
+                    self.send_response(status)
+                self.finish_body(kind, body, content_type, head)
+
+            def finish_body(self, kind, body, content_type, head):
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                fake._count_request(kind)
+                self.end_headers()
+                if not head:
+                    try:
+                        self.write_paced(body)
+                    except (BrokenPipeError, ConnectionResetError):
+                        self.close_connection = True
+
+            def write_paced(self, body):
+                started = time.monotonic()
+                sent = 0
+                while sent < len(body):
+                    chunk = body[sent:sent + WRITE_SIZE]
+                    fake._count_bytes(len(chunk))
+                    try:
+                        self.wfile.write(chunk)
+                    except OSError:
+                        fake._count_bytes(-len(chunk))
+                        raise
+                    sent += len(chunk)
+                    if fake.bandwidth:
+                        ahead = sent / fake.bandwidth - (time.monotonic() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+
+        return Handler
+
+
+def route_to(base_url):
+    """Send every http_pool request for terraria.org or the wiki to base_url instead."""
+    original = http_pool.request
+
+    def request(url, *args, **kwargs):
+        for origin in REAL_ORIGINS:
+            if url.startswith(origin + "/"):
+                url = base_url + url[len(origin):]
+                break
+        return original(url, *args, **kwargs)
+
+    http_pool.request = request
+    return original
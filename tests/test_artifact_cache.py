@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Unit tests for artifact_cache.py.
+"""
+
+import unittest
+import sys
+import os
+import hashlib
+import tempfile
+
+# Add scripts directory to path to import the scripts
+script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import artifact_cache
+
+
+class TestArtifactCache(unittest.TestCase):
+    """Test storing, fetching and evicting cached archives."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        self.work_dir = os.path.join(self.tmp.name, 'work')
+        os.makedirs(self.work_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_file(self, name, content):
+        path = os.path.join(self.work_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_miss(self):
+        """An unknown key is a miss."""
+        cache = artifact_cache.ArtifactCache(self.cache_dir)
+        self.assertIsNone(cache.fetch('terraria-server-1449.zip', os.path.join(self.work_dir, 'out.zip')))
+
+    def test_store_and_fetch(self):
+        """A stored archive is placed at the destination with its content intact."""
+        cache = artifact_cache.ArtifactCache(self.cache_dir)
+        source = self.make_file('download.zip', b'zip-bytes')
+        sha256 = cache.store('terraria-server-1449.zip', source)
+        self.assertEqual(sha256, hashlib.sha256(b'zip-bytes').hexdigest())
+
+        dest = os.path.join(self.work_dir, 'terraria-server.zip')
+        entry = cache.fetch('terraria-server-1449.zip', dest)
+        self.assertEqual(entry['sha256'], sha256)
+        with open(dest, 'rb') as f:
+            self.assertEqual(f.read(), b'zip-bytes')
+
+    def test_same_content_stored_once(self):
+        """Two keys with identical content share one blob."""
+        cache = artifact_cache.ArtifactCache(self.cache_dir)
+        cache.store('a.zip', self.make_file('a', b'same'))
+        cache.store('b.zip', self.make_file('b', b'same'))
+        blobs = [f for _, _, files in os.walk(cache.objects_dir) for f in files]
+        self.assertEqual(len(blobs), 1)
+
+    def test_missing_blob_is_a_miss(self):
+        """An index entry whose blob was removed is dropped."""
+        cache = artifact_cache.ArtifactCache(self.cache_dir)
+        sha256 = cache.store('a.zip', self.make_file('a', b'content'))
+        os.remove(cache._object_path(sha256))
+        self.assertIsNone(cache.lookup('a.zip'))
+
+    def test_lru_eviction(self):
+        """The least recently used archive is evicted when the size cap is exceeded."""
+        cache = artifact_cache.ArtifactCache(self.cache_dir, max_bytes=20)
+        cache.store('old.zip', self.make_file('old', b'o' * 10))
+        cache.store('used.zip', self.make_file('used', b'u' * 10))
+        cache.fetch('old.zip', os.path.join(self.work_dir, 'x.zip'))  # refresh old.zip
+        cache.store('new.zip', self.make_file('new', b'n' * 10))
+
+        self.assertIsNotNone(cache.lookup('old.zip'))
+        self.assertIsNone(cache.lookup('used.zip'))
+        self.assertIsNotNone(cache.lookup('new.zip'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Unit tests for async_api.py, run against the simulated terraria.org.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import asyncio
+import hashlib
+import tempfile
+import threading
+import time
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+for path in (script_dir, tests_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import async_api
+import get_latest_filename
+import get_latest_version
+import http_pool
+import fake_terraria
+
+
+class AsyncTestCase(unittest.TestCase):
+    fake_options = {}
+
+    def setUp(self):
+        self.fake = fake_terraria.FakeTerraria(['1449', '1450', '1451'], archive_size=256 * 1024,
+                                               wiki_padding=16 * 1024, **self.fake_options).start()
+        self.original = fake_terraria.route_to(self.fake.base_url)
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+
+    def tearDown(self):
+        self.stdout.stop()
+        http_pool.request = self.original
+        http_pool.close_all()
+        self.fake.stop()
+
+
+class TestAsyncApi(AsyncTestCase):
+    """The coroutines give the same answers as the sync functions."""
+
+    def test_same_results_as_sync(self):
+        async def gather():
+            return await asyncio.gather(
+                async_api.get_latest_filename(),
+                async_api.get_base_version(),
+                async_api.is_version_available('1450'),
+                async_api.is_version_available('1452'),
+                async_api.find_highest_version(),
+                async_api.find_highest_version(jobs=8, strategy='gallop'),
+            )
+
+        expected = [
+            get_latest_filename.get_latest_filename(),
+            get_latest_version.get_base_version(),
+            get_latest_version.is_version_available('1450'),
+            get_latest_version.is_version_available('1452'),
+            get_latest_version.find_highest_version(),
+            get_latest_version.find_highest_version(jobs=8, strategy='gallop'),
+        ]
+        self.assertEqual(asyncio.run(gather()), expected)
+        self.assertEqual(expected[-1], '1451')
+
+    def test_download(self):
+        """download_server writes the same archive as the sync version."""
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(async_api.download_server('1450', tmp, use_cache=False))
+            with open(os.path.join(tmp, 'terraria-server.zip'), 'rb') as f:
+                data = f.read()
+        self.assertEqual(hashlib.sha256(data).digest(), hashlib.sha256(self.fake.archive('1450')).digest())
+
+    def test_errors_propagate(self):
+        """Exceptions of the sync function reach the caller unchanged."""
+        with self.assertRaises(TypeError):
+            asyncio.run(async_api.download_server(1450))
+
+    def test_limiter_caps_requests_in_flight(self):
+        """Concurrent probes of several calls share one limiter."""
+        self.fake.latency = 0.02
+        limiter = threading.BoundedSemaphore(2)
+
+        async def search():
+            return await asyncio.gather(*(async_api.find_highest_version(jobs=8, limiter=limiter) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(search()), ['1451'] * 3)
+        self.assertEqual(self.fake.counters()['peak_in_flight'], 2)
+
+    def test_set_concurrency(self):
+        original = async_api.shared_limiter
+        try:
+            async_api.set_concurrency(3)
+            self.assertIsNot(async_api.shared_limiter, original)
+            with self.assertRaises(ValueError):
+                async_api.set_concurrency(0)
+        finally:
+            async_api.shared_limiter = original
+
+
+class TestAsyncInterruption(AsyncTestCase):
+    """Deadlines and cancellation interrupt requests in progress."""
+
+    fake_options = {'latency': 1.0}
+
+    def test_deadline(self):
+        started = time.monotonic()
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(async_api.find_highest_version(timeout=0.2))
+        self.assertLess(time.monotonic() - started, 0.9)
+        # The wiki request was interrupted before it was answered and nothing followed
+        self.assertEqual(self.fake.counters()['requests'], 0)
+
+    def test_cancel(self):
+        async def cancel_soon():
+            task = asyncio.ensure_future(async_api.is_version_available('1450'))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await task
+
+        started = time.monotonic()
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(cancel_soon())
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_waiting_for_limiter_is_cancelled(self):
+        """A call waiting for a limiter slot gives up at its deadline."""
+        limiter = threading.BoundedSemaphore(1)
+        limiter.acquire()
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(async_api.get_latest_filename(timeout=0.1, limiter=limiter))
+        finally:
+            limiter.release()
+        self.assertEqual(self.fake.counters()['requests'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the benchmark harness and its terraria.org stand-in.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import json
+import runpy
+import tempfile
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+for path in (script_dir, tests_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import http_pool
+import get_latest_filename
+import get_latest_version
+import benchmark
+import fake_terraria
+
+
+class TestFakeTerraria(unittest.TestCase):
+    """Test the stand-in server through the real scripts."""
+
+    def setUp(self):
+        self.fake = fake_terraria.FakeTerraria(['1449', '1450'], archive_size=64 * 1024).start()
+        self.original = fake_terraria.route_to(self.fake.base_url)
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+
+    def tearDown(self):
+        self.stdout.stop()
+        http_pool.request = self.original
+        http_pool.close_all()
+        self.fake.stop()
+
+    def test_endpoints(self):
+        """Wiki page, names API and availability probes are answered."""
+        self.assertEqual(get_latest_version.get_base_version(), '1449')
+        self.assertEqual(get_latest_filename.get_latest_filename(), 'terraria-server-1450.zip')
+        self.assertTrue(get_latest_version.is_version_available('1450'))
+        self.assertFalse(get_latest_version.is_version_available('1451'))
+        self.assertEqual(self.fake.counters()['by_kind'], {'wiki': 1, 'names': 1, 'probe': 2})
+
+    def test_wiki_revalidated(self):
+        """A second scrape with a probe cache costs a 304 without a body."""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = get_latest_version.probe_cache.ProbeCache(os.path.join(tmp, 'cache.json'))
+            self.assertEqual(get_latest_version.get_base_version(cache), '1449')
+            first = self.fake.counters()['bytes']
+            self.assertEqual(get_latest_version.get_base_version(cache), '1449')
+        self.assertEqual(self.fake.counters()['by_kind'], {'wiki': 2})
+        self.assertEqual(self.fake.counters()['bytes'], first)
+
+    def test_check_only(self):
+        """--check-only costs the wiki and a probe per candidate, and exits 3 when nothing is new."""
+        for last, expected, status, probes in (('1450', '1450', get_latest_version.NOTHING_NEW_EXIT, 3),
+                                               ('1449', '1450', 0, 2)):
+            with self.subTest(last=last):
+                sys.stdout.seek(0)
+                sys.stdout.truncate()
+                self.fake.reset_counters()
+                with patch('sys.argv', ['get_latest_version.py', '--no-cache', '--check-only', last]):
+                    with self.assertRaises(SystemExit) as raised:
+                        runpy.run_path(get_latest_version.__file__, run_name='__main__')
+                self.assertEqual(raised.exception.code, status)
+                self.assertEqual(sys.stdout.getvalue().splitlines()[-1], expected)
+                self.assertEqual(self.fake.counters()['by_kind'], {'wiki': 1, 'probe': probes})
+
+    def test_head_405(self):
+        """With HEAD refused, availability falls back to GET."""
+        self.fake.head_405 = True
+        self.assertTrue(get_latest_version.is_version_available('1450'))
+        self.assertEqual(self.fake.counters()['by_kind'], {'head': 1, 'archive': 1})
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test a full benchmark run with small archives."""
+
+    def test_report(self):
+        """Every scenario reports its measurements and finds the newest version."""
+        with patch('sys.stderr', new_callable=io.StringIO):
+            report = benchmark.run_benchmarks(list(benchmark.SCENARIOS), versions=['1449', '1450', '1451'],
+                                              wiki_version='1449', archive_size=256 * 1024)
+        json.dumps(report)
+        scenarios = report['scenarios']
+        self.assertEqual(set(scenarios), set(benchmark.SCENARIOS))
+        for name, scenario in scenarios.items():
+            run = scenario['runs'][0]
+            self.assertGreater(run['wall_time'], 0)
+            self.assertGreater(run['peak_rss_kb'], 0)
+        for name in ('find_highest_version', 'find_highest_version_parallel', 'find_highest_version_gallop',
+                     'find_highest_version_api'):
+            self.assertEqual(scenarios[name]['runs'][0]['result']['version'], '1451')
+        # The API lists 1451 but the wiki links 1449, so the agreement strategy still searches
+        self.assertEqual(scenarios['find_highest_version_agree']['runs'][0]['result']['version'], '1451')
+        self.assertEqual(scenarios['find_highest_version']['runs'][0]['result']['probes'], 6)
+        self.assertEqual(scenarios['find_highest_version_api']['runs'][0]['result']['probes'], 3)
+        self.assertEqual(scenarios['prune']['runs'][0]['requests'], 0)
+        full = scenarios['download_server']['runs'][0]['bytes']
+        linux_only = scenarios['download_server_linux_only']['runs'][0]['bytes']
+        self.assertGreaterEqual(full, report['server']['archive_size'])
+        self.assertLess(linux_only, full)
+
+    def test_output_file(self):
+        """main() writes the JSON report to --output."""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            with patch('sys.stderr', new_callable=io.StringIO):
+                benchmark.main(['prune', '--archive-mb', '0.1', '-o', output])
+            with open(output) as f:
+                report = json.load(f)
+        self.assertEqual(list(report['scenarios']), ['prune'])
+
+    def test_unknown_scenario(self):
+        with patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                benchmark.parse_args(['nope'])
+
+
+if __name__ == '__main__':
+    unittest.main()
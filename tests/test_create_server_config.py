@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Unit tests for create_server_config.py.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import tempfile
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import create_server_config
+
+WORLDS = '/root/.local/share/Terraria/Worlds'
+
+
+def config_lines(environ, exists=False):
+    settings = create_server_config.load_settings(environ)
+    lines, _ = create_server_config.render(settings, world_exists=lambda path: exists)
+    return lines
+
+
+class TestWorldResolution(unittest.TestCase):
+    """world, worldpath and worldname resolve as create-server-config.sh did."""
+
+    def test_existing_world_loaded(self):
+        lines = config_lines({'world': 'somewhere/world1.wld', 'worldpath': '/data'}, exists=True)
+        self.assertEqual(lines[0], 'world=/data/world1.wld')
+        self.assertFalse(any(line.startswith('autocreate=') for line in lines))
+        self.assertIn('worldpath=/data', lines)
+
+    def test_missing_world_created(self):
+        lines = config_lines({'world': 'world1.wld', 'worldpath': '', 'autocreate': '2', 'seed': 'abc'})
+        self.assertEqual(lines[:5], [f'world={WORLDS}/world1.wld', 'autocreate=2', 'seed=abc',
+                                     'worldname=world1', 'difficulty=1'])
+
+    def test_worldname_kept(self):
+        lines = config_lines({'world': 'world1.wld', 'worldname': 'My World'})
+        self.assertIn('worldname=My World', lines)
+
+    def test_no_world(self):
+        lines = config_lines({'worldpath': '/data', 'worldname': 'fresh'})
+        self.assertEqual(lines[:5], ['world=/data/fresh.wld', 'autocreate=1', 'seed=',
+                                     'worldname=fresh', 'difficulty=1'])
+
+    def test_defaults(self):
+        lines = config_lines({})
+        self.assertEqual(lines[5:], ['maxplayers=16', 'port=7777', 'password=', 'motd=Welcome!',
+                                     f'worldpath={create_server_config.TERRARIA_DIR}/Worlds',
+                                     'banlist=banlist.txt', 'secure=1', 'language=en/US', 'upnp=1',
+                                     'npcstream=1', 'priority=1'])
+
+
+class TestValidation(unittest.TestCase):
+    def test_every_error_reported(self):
+        with self.assertRaises(create_server_config.ConfigError) as context:
+            create_server_config.load_settings({'maxplayers': 'abc', 'port': '70000', 'secure': '2',
+                                                'motd': 'a\nport=1', 'language': 'english'})
+        self.assertEqual([error.split()[0] for error in context.exception.errors],
+                         ['maxplayers', 'port', 'motd', 'secure', 'language'])
+        self.assertIn("got 'abc'", context.exception.errors[0])
+
+    def test_valid_values_normalized(self):
+        settings = create_server_config.load_settings({'maxplayers': ' 8', 'language': 'zh/Hans'})
+        self.assertEqual(settings['maxplayers'], '8')
+        self.assertEqual(settings['language'], 'zh/Hans')
+
+    def test_empty_means_default(self):
+        settings = create_server_config.load_settings({'priority': '', 'npcstream': ' ', 'language': '',
+                                                       'motd': ''})
+        self.assertEqual(settings['priority'], '1')
+        self.assertEqual(settings['npcstream'], '1')
+        self.assertEqual(settings['language'], 'en/US')
+        self.assertEqual(settings['motd'], '')
+
+
+class TestWrite(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, create_server_config.CONFIG_NAME)
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+        self.stderr = patch('sys.stderr', new_callable=io.StringIO)
+        self.stderr.start()
+
+    def tearDown(self):
+        self.stderr.stop()
+        self.stdout.stop()
+        self.tmp.cleanup()
+
+    def test_unchanged_settings_not_rewritten(self):
+        environ = {'worldname': 'w', 'worldpath': self.tmp.name}
+        self.assertTrue(create_server_config.create_config(self.path, environ))
+        os.utime(self.path, (0, 0))
+        self.assertFalse(create_server_config.create_config(self.path, environ))
+        self.assertEqual(os.stat(self.path).st_mtime, 0)
+        self.assertTrue(create_server_config.create_config(self.path, dict(environ, maxplayers='4')))
+        with open(self.path) as f:
+            content = f.read()
+        self.assertIn('maxplayers=4\n', content)
+        self.assertTrue(content.startswith(create_server_config.DIGEST_PREFIX))
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['banlist.txt', 'server-config.conf'])
+
+    def test_created_world_switches_to_loading(self):
+        """Once the server has created the world, the next start loads it."""
+        environ = {'world': 'w.wld', 'worldpath': self.tmp.name}
+        create_server_config.create_config(self.path, environ)
+        open(os.path.join(self.tmp.name, 'w.wld'), 'w').close()
+        self.assertTrue(create_server_config.create_config(self.path, environ))
+        with open(self.path) as f:
+            self.assertNotIn('autocreate=', f.read())
+
+    def test_invalid_settings_leave_file(self):
+        with patch.dict(os.environ, {'worldname': 'w'}):
+            self.assertEqual(create_server_config.main(['-o', self.path]), 0)
+        with open(self.path) as f:
+            before = f.read()
+        with patch.dict(os.environ, {'maxplayers': 'abc'}):
+            self.assertEqual(create_server_config.main(['-o', self.path]), 1)
+        self.assertIn('Error: maxplayers must be a whole number', sys.stderr.getvalue())
+        with open(self.path) as f:
+            self.assertEqual(f.read(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Checks of the Dockerfile's build arguments, without running docker.
+
+Docker scopes an ARG to the stage that declares it (a global ARG, before the
+first FROM, only provides the default for stages that redeclare it); stages
+built FROM another one inherit its ENV but not its ARGs. The tests below
+expand the RUN instructions the way docker would and check that build
+arguments reach the scripts.
+"""
+
+import unittest
+import os
+import re
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+DOCKERFILE = os.path.join(tests_dir, '..', 'Dockerfile')
+VARIABLE_PATTERN = re.compile(r'\$\{(\w+)\}|\$(\w+)')
+
+
+def instructions(path=DOCKERFILE):
+    """(INSTRUCTION, arguments) pairs, with continuation lines joined and comments dropped."""
+    result, current = [], ''
+    with open(path) as f:
+        for line in f:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            if stripped.endswith('\\'):
+                current += stripped[:-1] + ' '
+                continue
+            current += stripped
+            keyword, _, arguments = current.partition(' ')
+            result.append((keyword.upper(), arguments.strip()))
+            current = ''
+    return result
+
+
+def parse_assignments(arguments):
+    """NAME=value pairs of an ARG or ENV instruction; an ARG without a value maps to None."""
+    pairs = {}
+    for name, assignment, value in re.findall(r'(\w+)(=("[^"]*"|\'[^\']*\'|\S*))?', arguments):
+        pairs[name] = value[1:-1] if value[:1] in ('"', "'") else value if assignment else None
+    return pairs
+
+
+def stages(build_args=None):
+    """{stage name: [(expanded RUN arguments, its environment)]}, resolving ARG and ENV scoping like docker.
+
+    ARG values are part of the environment of RUN, like ENV values.
+    """
+    build_args = build_args or {}
+    global_args, result, env_of = {}, {}, {}
+    name = None
+    for keyword, arguments in instructions():
+        if keyword == 'FROM':
+            parts = arguments.split()
+            base = parts[0]
+            name = parts[2] if len(parts) > 2 and parts[1].upper() == 'AS' else base
+            env = dict(env_of.get(base, {}))
+            args = {}
+            env_of[name] = env
+            result[name] = []
+        elif name is None:
+            if keyword == 'ARG':
+                for arg, default in parse_assignments(arguments).items():
+                    global_args[arg] = build_args.get(arg, default or '')
+        elif keyword == 'ARG':
+            for arg, default in parse_assignments(arguments).items():
+                if arg in build_args:
+                    args[arg] = build_args[arg]
+                elif default is not None:
+                    args[arg] = default
+                else:
+                    args[arg] = global_args.get(arg, '')
+        elif keyword == 'ENV':
+            values = {**env, **args}
+            for variable, value in parse_assignments(arguments).items():
+                env[variable] = VARIABLE_PATTERN.sub(lambda m: values.get(m.group(1) or m.group(2), ''), value or '')
+        elif keyword == 'RUN':
+            values = {**env, **args}
+            result[name].append((VARIABLE_PATTERN.sub(lambda m: values.get(m.group(1) or m.group(2), ''), arguments),
+                                 values))
+    return result
+
+
+def download_runs(build_args=None):
+    """{stage name: (the RUN running download_server.py with whitespace collapsed, its environment)}."""
+    return {name: (' '.join(run.split()), environment) for name, runs in stages(build_args).items()
+            for run, environment in runs if 'python3 download_server.py' in run}
+
+
+class TestBuildArgs(unittest.TestCase):
+    def test_download_args_reach_every_download(self):
+        runs = download_runs({'DOWNLOAD_ARGS': '--linux-only'})
+        self.assertEqual(sorted(runs), ['base', 'files-arm64'])
+        for name, (run, _) in runs.items():
+            self.assertIn('download_server.py --linux-only latest', run, name)
+
+    def test_mirror_in_download_environment(self):
+        mirror = 'http://mirror.internal/terraria/'
+        for name, (_, environment) in download_runs({'TERRARIA_MIRROR': mirror}).items():
+            self.assertEqual(environment.get('TERRARIA_MIRROR'), mirror, name)
+
+    def test_defaults(self):
+        for name, (run, environment) in download_runs().items():
+            self.assertIn('download_server.py latest', run, name)
+            self.assertEqual(environment.get('TERRARIA_MIRROR'), '', name)
+        run, _ = download_runs({'VERSION': '1449'})['base']
+        self.assertIn('download_server.py 1449', run)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Unit tests for fileutil.py.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import hashlib
+import json
+import tempfile
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import fileutil
+
+
+class TestFileUtil(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_file_sha256(self):
+        path = os.path.join(self.tmp.name, 'data')
+        data = os.urandom(3 * fileutil.HASH_BUFFER_SIZE // 2)
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.assertEqual(fileutil.file_sha256(path), hashlib.sha256(data).hexdigest())
+
+    def test_preallocate(self):
+        path = os.path.join(self.tmp.name, 'data')
+        with open(path, 'wb') as f:
+            fileutil.preallocate(f.fileno(), 4096)
+            fileutil.preallocate(f.fileno(), 0)
+        self.assertEqual(os.path.getsize(path), 4096)
+        with open(path, 'wb') as f, patch('os.posix_fallocate', side_effect=OSError('unsupported')):
+            fileutil.preallocate(f.fileno(), 100)
+        self.assertEqual(os.path.getsize(path), 100)
+
+    def test_write_json_atomic(self):
+        path = os.path.join(self.tmp.name, 'index.json')
+        fileutil.write_json_atomic(path, {'b': 1, 'a': [2]})
+        with open(path) as f:
+            self.assertEqual(json.load(f), {'a': [2], 'b': 1})
+        with self.assertRaises(TypeError):
+            fileutil.write_json_atomic(path, {'a': object()})
+        # The old file is kept and the temporary one removed
+        self.assertEqual(os.listdir(self.tmp.name), ['index.json'])
+        with open(path) as f:
+            self.assertEqual(json.load(f), {'a': [2], 'b': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
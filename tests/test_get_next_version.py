@@ -10,6 +10,8 @@ import io
 import urllib.error
 from urllib.error import HTTPError, URLError
 import os
+import tempfile
+import zlib
 
 # Add scripts directory to path to import the script
 script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
@@ -25,6 +27,8 @@ spec.loader.exec_module(get_latest_version)
 
 # Alias for backward compatibility with test code
 get_next_version = get_latest_version
+probe_cache = get_latest_version.probe_cache
+http_pool = get_latest_version.http_pool
 
 
 class TestVersionConversion(unittest.TestCase):
@@ -79,41 +83,49 @@ class TestVersionConversion(unittest.TestCase):
 class TestVersionAvailability(unittest.TestCase):
     """Test is_version_available function with mocked HTTP requests."""
 
-    @patch('urllib.request.urlopen')
-    def test_head_request_success(self, mock_urlopen):
+    def setUp(self):
+        # Transient failures are retried; skip the real backoff
+        self.backoff = patch.object(http_pool, 'BACKOFF_BASE', 0)
+        self.backoff.start()
+
+    def tearDown(self):
+        self.backoff.stop()
+
+    @patch('http_pool.request')
+    def test_head_request_success(self, mock_request):
         """Test successful HEAD request."""
-        mock_urlopen.return_value = MagicMock()
+        mock_request.return_value = MagicMock()
         result = get_next_version.is_version_available('1450')
         self.assertTrue(result)
-        mock_urlopen.assert_called_once()
+        mock_request.assert_called_once()
 
-    @patch('urllib.request.urlopen')
-    def test_head_request_404_not_found(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_head_request_404_not_found(self, mock_request):
         """Test HEAD request returns 404 (version not available)."""
-        mock_urlopen.side_effect = HTTPError(
+        mock_request.side_effect = HTTPError(
             url='http://example.com', code=404, msg='Not Found',
             hdrs={}, fp=None
         )
         result = get_next_version.is_version_available('9999')
         self.assertFalse(result)
 
-    @patch('urllib.request.urlopen')
-    def test_head_request_405_fallback_to_get_success(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_head_request_405_fallback_to_get_success(self, mock_request):
         """Test HEAD returns 405, fallback to GET succeeds."""
         # First call (HEAD) raises 405, second call (GET) succeeds
-        mock_urlopen.side_effect = [
+        mock_request.side_effect = [
             HTTPError(url='http://example.com', code=405, msg='Method Not Allowed',
                      hdrs={}, fp=None),
             MagicMock()  # GET succeeds
         ]
         result = get_next_version.is_version_available('1450')
         self.assertTrue(result)
-        self.assertEqual(mock_urlopen.call_count, 2)
+        self.assertEqual(mock_request.call_count, 2)
 
-    @patch('urllib.request.urlopen')
-    def test_head_request_405_fallback_to_get_fails(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_head_request_405_fallback_to_get_fails(self, mock_request):
         """Test HEAD returns 405, fallback to GET fails."""
-        mock_urlopen.side_effect = [
+        mock_request.side_effect = [
             HTTPError(url='http://example.com', code=405, msg='Method Not Allowed',
                      hdrs={}, fp=None),
             HTTPError(url='http://example.com', code=404, msg='Not Found',
@@ -122,43 +134,115 @@ class TestVersionAvailability(unittest.TestCase):
         result = get_next_version.is_version_available('9999')
         self.assertFalse(result)
 
-    @patch('urllib.request.urlopen')
-    def test_head_request_500_server_error(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_head_request_500_server_error(self, mock_request):
         """Test HEAD request returns 500 error."""
-        mock_urlopen.side_effect = HTTPError(
+        mock_request.side_effect = HTTPError(
             url='http://example.com', code=500, msg='Server Error',
             hdrs={}, fp=None
         )
         result = get_next_version.is_version_available('1450')
         self.assertFalse(result)
 
-    @patch('urllib.request.urlopen')
-    def test_network_error(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_network_error(self, mock_request):
         """Test network error (URLError)."""
-        mock_urlopen.side_effect = URLError('Connection refused')
+        mock_request.side_effect = URLError('Connection refused')
         result = get_next_version.is_version_available('1450')
         self.assertFalse(result)
 
-    @patch('urllib.request.urlopen')
-    def test_timeout_error(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_timeout_error(self, mock_request):
         """Test timeout error."""
-        mock_urlopen.side_effect = TimeoutError('Request timeout')
+        mock_request.side_effect = TimeoutError('Request timeout')
         result = get_next_version.is_version_available('1450')
         self.assertFalse(result)
 
-    @patch('urllib.request.urlopen')
-    def test_generic_exception(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_generic_exception(self, mock_request):
         """Test generic exception handling."""
-        mock_urlopen.side_effect = Exception('Unexpected error')
+        mock_request.side_effect = Exception('Unexpected error')
         result = get_next_version.is_version_available('1450')
         self.assertFalse(result)
 
 
+class TestTransientFailures(unittest.TestCase):
+    """Test retries and the available / absent / unknown answers of probes."""
+
+    def setUp(self):
+        self.backoff = patch.object(http_pool, 'BACKOFF_BASE', 0.001)
+        self.backoff.start()
+
+    def tearDown(self):
+        self.backoff.stop()
+
+    @patch('http_pool.request')
+    def test_transient_error_retried(self, mock_request):
+        mock_request.side_effect = [HTTPError('url', 503, 'Unavailable', {}, None), URLError('reset'), MagicMock()]
+        self.assertIs(get_next_version.is_version_available('1450'), True)
+        self.assertEqual(mock_request.call_count, 3)
+
+    @patch('http_pool.request')
+    def test_unknown_after_retries(self, mock_request):
+        """Transient failures that persist give None, not False."""
+        mock_request.side_effect = HTTPError('url', 500, 'Server Error', {}, None)
+        self.assertIsNone(get_next_version.is_version_available('1450'))
+        self.assertEqual(mock_request.call_count, http_pool.RETRY_ATTEMPTS)
+
+    @patch('http_pool.request')
+    def test_absent_not_retried(self, mock_request):
+        for code in (404, 410):
+            with self.subTest(code=code):
+                mock_request.reset_mock()
+                mock_request.side_effect = HTTPError('url', code, 'Gone', {}, None)
+                self.assertIs(get_next_version.is_version_available('1460'), False)
+                self.assertEqual(mock_request.call_count, 1)
+
+    @patch('http_pool.request')
+    def test_other_status_is_unknown(self, mock_request):
+        """A status that is neither transient nor a miss (e.g. 403) is not an answer."""
+        mock_request.side_effect = HTTPError('url', 403, 'Forbidden', {}, None)
+        self.assertIsNone(get_next_version.is_version_available('1460'))
+        self.assertEqual(mock_request.call_count, 1)
+
+    def test_search_gives_up_on_unknown(self):
+        """An unanswered probe makes the search fail instead of reporting an older version."""
+        with tempfile.TemporaryDirectory() as tmp:
+            for jobs in (1, 8):
+                with self.subTest(jobs=jobs):
+                    cache = probe_cache.ProbeCache(os.path.join(tmp, f'cache-{jobs}.json'))
+                    with patch.object(get_next_version, 'get_base_version', return_value='1452'), \
+                         patch.object(get_next_version, 'is_version_available',
+                                      side_effect=lambda v: None if v == '1453' else False), \
+                         patch('sys.stdout', new_callable=io.StringIO), \
+                         patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                        self.assertIsNone(get_next_version.find_highest_version(jobs=jobs, cache=cache))
+                    self.assertIn('could not tell whether 1453 is available', stderr.getvalue())
+                    self.assertIsNone(cache.lookup('1453'))
+                    self.assertIs(cache.lookup('1500'), False)
+
+    @patch('http_pool.request')
+    def test_filename_lookup_retried(self, mock_request):
+        response = MagicMock()
+        response.read.return_value = b'["terraria-server-1453.zip"]'
+        response.__enter__.return_value = response
+        mock_request.side_effect = [URLError('timed out'), response]
+        self.assertEqual(get_next_version.get_latest_filename.get_latest_filename(), 'terraria-server-1453.zip')
+
+
 class TestGetBaseVersion(unittest.TestCase):
     """Test get_base_version function with mocked HTTP requests."""
 
-    @patch('urllib.request.urlopen')
-    def test_successful_scrape(self, mock_urlopen):
+    def setUp(self):
+        # Transient failures are retried; skip the real backoff
+        self.backoff = patch.object(http_pool, 'BACKOFF_BASE', 0)
+        self.backoff.start()
+
+    def tearDown(self):
+        self.backoff.stop()
+
+    @patch('http_pool.request')
+    def test_successful_scrape(self, mock_request):
         """Test successfully scraping base version from wiki."""
         html_content = '''
         <html>
@@ -169,13 +253,13 @@ class TestGetBaseVersion(unittest.TestCase):
         mock_response.read.return_value = html_content.encode('utf-8')
         mock_response.__enter__.return_value = mock_response
         mock_response.__exit__.return_value = None
-        mock_urlopen.return_value = mock_response
+        mock_request.return_value = mock_response
 
         result = get_next_version.get_base_version()
         self.assertEqual(result, '1450')
 
-    @patch('urllib.request.urlopen')
-    def test_multiple_urls_gets_last(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_multiple_urls_gets_last(self, mock_request):
         """Test that when multiple URLs exist, we get the last one."""
         html_content = '''
         <html>
@@ -188,36 +272,36 @@ class TestGetBaseVersion(unittest.TestCase):
         mock_response.read.return_value = html_content.encode('utf-8')
         mock_response.__enter__.return_value = mock_response
         mock_response.__exit__.return_value = None
-        mock_urlopen.return_value = mock_response
+        mock_request.return_value = mock_response
 
         result = get_next_version.get_base_version()
         self.assertEqual(result, '1452')
 
-    @patch('urllib.request.urlopen')
-    def test_no_matching_urls(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_no_matching_urls(self, mock_request):
         """Test when HTML has no matching download URLs."""
         html_content = '<html><body>No downloads here</body></html>'
         mock_response = MagicMock()
         mock_response.read.return_value = html_content.encode('utf-8')
         mock_response.__enter__.return_value = mock_response
         mock_response.__exit__.return_value = None
-        mock_urlopen.return_value = mock_response
+        mock_request.return_value = mock_response
 
         result = get_next_version.get_base_version()
         self.assertIsNone(result)
 
-    @patch('urllib.request.urlopen')
-    def test_network_error_returns_none(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_network_error_returns_none(self, mock_request):
         """Test that network error returns None."""
-        mock_urlopen.side_effect = URLError('Connection failed')
+        mock_request.side_effect = URLError('Connection failed')
 
         result = get_next_version.get_base_version()
         self.assertIsNone(result)
 
-    @patch('urllib.request.urlopen')
-    def test_http_error_returns_none(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_http_error_returns_none(self, mock_request):
         """Test that HTTP error returns None."""
-        mock_urlopen.side_effect = HTTPError(
+        mock_request.side_effect = HTTPError(
             url='http://example.com', code=404, msg='Not Found',
             hdrs={}, fp=None
         )
@@ -225,19 +309,103 @@ class TestGetBaseVersion(unittest.TestCase):
         result = get_next_version.get_base_version()
         self.assertIsNone(result)
 
-    @patch('urllib.request.urlopen')
-    def test_empty_html(self, mock_urlopen):
+    @patch('http_pool.request')
+    def test_empty_html(self, mock_request):
         """Test with empty HTML response."""
         mock_response = MagicMock()
         mock_response.read.return_value = b''
         mock_response.__enter__.return_value = mock_response
         mock_response.__exit__.return_value = None
-        mock_urlopen.return_value = mock_response
+        mock_request.return_value = mock_response
 
         result = get_next_version.get_base_version()
         self.assertIsNone(result)
 
 
+class StreamResponse:
+    """Minimal streamed response: read(size) from a byte string, counting what was read."""
+
+    def __init__(self, data, status=200, headers=None):
+        self.stream = io.BytesIO(data)
+        self.status = status
+        self.headers = headers or {}
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+def wiki_link(version):
+    return f'<a href="https://terraria.org/api/download/pc-dedicated-server/terraria-server-{version}.zip">x</a>'
+
+
+class TestStreamingScraper(unittest.TestCase):
+    """Test the chunked, bounded scan of the wiki page and conditional requests."""
+
+    def test_match_split_across_chunks(self):
+        """A URL is found wherever the chunk boundary falls inside it."""
+        page = ('<p>' + 'x' * 50 + wiki_link('1449') + 'y' * 50 + '</p>').encode()
+        for chunk_size in range(1, 120, 7):
+            with self.subTest(chunk_size=chunk_size):
+                url = get_next_version.scan_download_urls(StreamResponse(page), chunk_size=chunk_size)
+                self.assertTrue(url.endswith('terraria-server-1449.zip'))
+
+    def test_last_match_wins(self):
+        page = (wiki_link('1448') + 'x' * 5000 + wiki_link('1449') + 'x' * 5000 + wiki_link('1450')).encode()
+        url = get_next_version.scan_download_urls(StreamResponse(page), chunk_size=1000)
+        self.assertTrue(url.endswith('terraria-server-1450.zip'))
+
+    def test_stops_after_versions_section(self):
+        """Reading stops once stop_after bytes pass without another link."""
+        page = ('x' * 10000 + wiki_link('1449') + 'x' * 1000000).encode()
+        response = StreamResponse(page)
+        url = get_next_version.scan_download_urls(response, chunk_size=4096, stop_after=16384)
+        self.assertTrue(url.endswith('terraria-server-1449.zip'))
+        self.assertLess(response.bytes_read, 10000 + 16384 + 2 * 4096)
+
+    def test_byte_cap(self):
+        """Pages without links are not read past max_bytes."""
+        response = StreamResponse(b'x' * 1000000)
+        with patch('sys.stderr', new_callable=io.StringIO):
+            url = get_next_version.scan_download_urls(response, chunk_size=4096, max_bytes=65536)
+        self.assertIsNone(url)
+        self.assertLessEqual(response.bytes_read, 65536)
+
+    def test_gzip_body(self):
+        """A gzip encoded page is decompressed while it is scanned."""
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        page = compressor.compress(('x' * 3000 + wiki_link('1451')).encode()) + compressor.flush()
+        response = StreamResponse(page, headers={'Content-Encoding': 'gzip'})
+        with patch('http_pool.request', return_value=response) as mock_request:
+            self.assertEqual(get_next_version.get_base_version(), '1451')
+        self.assertEqual(mock_request.call_args.kwargs['headers']['Accept-Encoding'], 'gzip')
+
+    def test_not_modified_reuses_cached_version(self):
+        """Validators from the last scrape are sent, and a 304 reuses the stored version."""
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = probe_cache.ProbeCache(os.path.join(tmp, 'cache.json'))
+            page = wiki_link('1449').encode()
+            headers = {'ETag': '"abc"', 'Last-Modified': 'Tue, 01 Oct 2024 12:00:00 GMT'}
+            with patch('http_pool.request', return_value=StreamResponse(page, headers=headers)) as mock_request:
+                self.assertEqual(get_next_version.get_base_version(cache), '1449')
+            self.assertNotIn('If-None-Match', mock_request.call_args.kwargs['headers'])
+
+            with patch('http_pool.request', return_value=StreamResponse(b'', status=304)) as mock_request:
+                self.assertEqual(get_next_version.get_base_version(cache), '1449')
+            sent = mock_request.call_args.kwargs['headers']
+            self.assertEqual(sent['If-None-Match'], '"abc"')
+            self.assertEqual(sent['If-Modified-Since'], 'Tue, 01 Oct 2024 12:00:00 GMT')
+            self.assertEqual(cache.base_version_validators()['etag'], '"abc"')
+
+
 class TestFindHighestVersion(unittest.TestCase):
     """Test find_highest_version function (main logic)."""
 
@@ -447,5 +615,195 @@ class TestEdgeCases(unittest.TestCase):
         self.assertIn('Finding highest hotfix version', output)
 
 
+class TestParallelSearch(unittest.TestCase):
+    """Test that concurrent probing returns the same answer as the sequential walk."""
+
+    SCENARIOS = [
+        ('1452', {'1453', '1454'}),
+        ('1452', {'1460', '1461', '1470'}),
+        ('1452', {'1500', '1510', '1520', '1521', '1600'}),
+        ('1452', {'1500', '1600', '1700', '1710', '1711', '1712'}),
+        ('1452', set()),
+        ('1998', {'1999'}),
+        ('1452', {'1453', '1455'}),  # gap: sequential walk stops at 1453
+    ]
+
+    def run_search(self, base, available, jobs):
+        with patch.object(get_next_version, 'get_base_version', return_value=base), \
+             patch.object(get_next_version, 'is_version_available',
+                          side_effect=lambda v: v in available) as mock_available, \
+             patch('sys.stdout', new_callable=io.StringIO) as output:
+            result = get_next_version.find_highest_version(jobs=jobs)
+        return result, mock_available.call_count, output.getvalue()
+
+    def test_same_result_as_sequential(self):
+        """Parallel mode finds the same version as the sequential walk."""
+        for base, available in self.SCENARIOS:
+            with self.subTest(base=base, available=sorted(available)):
+                sequential, _, _ = self.run_search(base, available, jobs=1)
+                parallel, _, _ = self.run_search(base, available, jobs=8)
+                self.assertEqual(sequential, parallel)
+
+    def test_same_output_as_sequential(self):
+        """Parallel mode prints the same progress lines as the sequential walk."""
+        _, _, sequential = self.run_search('1452', {'1500', '1510', '1511'}, jobs=1)
+        _, _, parallel = self.run_search('1452', {'1500', '1510', '1511'}, jobs=4)
+        self.assertEqual(sequential, parallel)
+
+    def test_probes_frontier_up_front(self):
+        """With no new release, only the frontier above the base is probed."""
+        _, calls, _ = self.run_search('1452', set(), jobs=4)
+        # 5 majors (1.5-1.9) + 4 minors (1.4.6-1.4.9) + 7 hotfixes (1.4.5.3-1.4.5.9)
+        self.assertEqual(calls, 16)
+
+    def test_parse_args_jobs(self):
+        """The --jobs flag sets the concurrency limit."""
+        self.assertEqual(get_next_version.parse_args([]).jobs, 1)
+        self.assertEqual(get_next_version.parse_args(['--jobs', '6']).jobs, 6)
+        with patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                get_next_version.parse_args(['--jobs', '0'])
+
+
+class TestSearchStrategies(unittest.TestCase):
+    """Test the galloping, API-seeded and agreement search strategies."""
+
+    SCENARIOS = TestParallelSearch.SCENARIOS + [
+        ('1440', {'1441', '1442', '1443', '1444', '1445', '1446', '1447'}),
+        ('1400', {f'14{m}0' for m in range(1, 10)}),
+    ]
+
+    def run_search(self, strategy, base, available, api=None, jobs=1):
+        stats = {}
+        with patch.object(get_next_version, 'get_base_version', return_value=base) as mock_base, \
+             patch.object(get_next_version, 'get_api_version', return_value=api), \
+             patch.object(get_next_version, 'is_version_available',
+                          side_effect=lambda v: v in available) as mock_available, \
+             patch('sys.stdout', new_callable=io.StringIO):
+            result = get_next_version.find_highest_version(jobs=jobs, strategy=strategy, stats=stats)
+        probed = [c.args[0] for c in mock_available.call_args_list]
+        return result, stats, probed, mock_base.called
+
+    def test_gallop_digit(self):
+        """gallop() finds the end of every possible run of available digits."""
+        for lo in range(10):
+            for highest in range(lo, 10):
+                with self.subTest(lo=lo, highest=highest):
+                    self.assertEqual(get_next_version.gallop(lo, lambda d: d <= highest), highest)
+
+    def test_same_result_as_linear(self):
+        """Every strategy finds the same version as the linear walk."""
+        for base, available in self.SCENARIOS:
+            expected, _, _, _ = self.run_search('linear', base, available)
+            for strategy in ('gallop', 'api'):
+                for jobs in (1, 8):
+                    with self.subTest(strategy=strategy, base=base, available=sorted(available), jobs=jobs):
+                        result, _, _, _ = self.run_search(strategy, base, available, api=base, jobs=jobs)
+                        self.assertEqual(result, expected)
+
+    def test_gallop_probe_counts(self):
+        """Galloping matches the linear walk for single hotfix bumps and wins on big jumps."""
+        _, linear, _, _ = self.run_search('linear', '1452', {'1453'})
+        _, gallop, _, _ = self.run_search('gallop', '1452', {'1453'})
+        self.assertEqual((linear['probes'], gallop['probes']), (4, 4))
+        _, linear, _, _ = self.run_search('linear', *self.SCENARIOS[-2])
+        _, gallop, _, _ = self.run_search('gallop', *self.SCENARIOS[-2])
+        self.assertEqual((linear['probes'], gallop['probes']), (10, 8))
+        # After a major bump, 1.M.0.0 is not probed again for the minor and hotfix steps
+        _, linear, _, _ = self.run_search('linear', '1452', {'1500'})
+        _, gallop, _, _ = self.run_search('gallop', '1452', {'1500'})
+        self.assertEqual((linear['probes'], gallop['probes']), (6, 4))
+
+    def test_api_seed_skips_scrape(self):
+        """The API strategy starts from the API version and only probes above it."""
+        result, stats, probed, scraped = self.run_search('api', '1440', {'1452', '1453'}, api='1452')
+        self.assertEqual(result, '1453')
+        self.assertFalse(scraped)
+        self.assertTrue(all(int(v) > 1452 for v in probed))
+        self.assertEqual(stats['probes'], len(probed))
+
+    def test_api_failure_falls_back_to_scrape(self):
+        result, _, _, scraped = self.run_search('api', '1452', {'1453'}, api=None)
+        self.assertEqual(result, '1453')
+        self.assertTrue(scraped)
+
+    def test_agree_stops_early(self):
+        """No probes are made when the API and the wiki name the same version."""
+        result, stats, probed, _ = self.run_search('agree', '1452', {'1453'}, api='1452')
+        self.assertEqual(result, '1452')
+        self.assertEqual((stats['probes'], probed), (0, []))
+
+    def test_agree_searches_from_higher_on_disagreement(self):
+        result, _, probed, _ = self.run_search('agree', '1449', {'1452', '1453'}, api='1452')
+        self.assertEqual(result, '1453')
+        self.assertTrue(all(int(v) > 1452 for v in probed))
+
+    def test_stats_count_cache_answers(self):
+        """Cached answers are counted apart from requests."""
+        cache = MagicMock()
+        cache.get_base_version.return_value = '1452'
+        cache.highest_hit.return_value = None
+        cache.lookup.side_effect = lambda v: False if v == '1500' else None
+        stats = {}
+        with patch.object(get_next_version, 'is_version_available', return_value=False), \
+             patch('sys.stdout', new_callable=io.StringIO):
+            get_next_version.find_highest_version(cache=cache, strategy='gallop', stats=stats)
+        self.assertEqual(stats, {'strategy': 'gallop', 'probes': 2, 'cached': 1})
+
+    def test_parse_args_strategy(self):
+        self.assertEqual(get_next_version.parse_args([]).strategy, 'linear')
+        self.assertEqual(get_next_version.parse_args(['--strategy', 'api']).strategy, 'api')
+        with patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                get_next_version.parse_args(['--strategy', 'bogus'])
+
+
+class TestCheckOnly(unittest.TestCase):
+    """Test the cheap "anything newer?" check (--check-only)."""
+
+    def run_check(self, last, available, wiki='1449', unanswered=()):
+        def probe(version):
+            if version in unanswered:
+                return None
+            return version in available
+
+        with patch.object(get_next_version, 'get_base_version', return_value=wiki), \
+             patch.object(get_next_version, 'is_version_available', side_effect=probe) as mock_probe, \
+             patch('sys.stdout', new_callable=io.StringIO), \
+             patch('sys.stderr', new_callable=io.StringIO):
+            result = get_next_version.check_for_update(last)
+        return result, sorted(c.args[0] for c in mock_probe.call_args_list)
+
+    def test_next_candidates(self):
+        self.assertEqual(get_next_version.next_candidates('1452'), ['1453', '1460', '1500'])
+        self.assertEqual(get_next_version.next_candidates('1499'), ['1500'])
+        self.assertEqual(get_next_version.next_candidates('1999'), [])
+
+    def test_nothing_new(self):
+        """Each candidate is probed once and the last version comes back."""
+        self.assertEqual(self.run_check('1452', set()), ('1452', ['1453', '1460', '1500']))
+
+    def test_new_release(self):
+        for available in ({'1453'}, {'1460'}, {'1500'}):
+            with self.subTest(available=available):
+                result, _ = self.run_check('1452', available)
+                self.assertEqual(result, available.pop())
+
+    def test_wiki_ahead(self):
+        """A wiki link above the last version counts as a release."""
+        self.assertEqual(self.run_check('1449', set(), wiki='1452')[0], '1452')
+
+    def test_unanswered_probe(self):
+        """Without an answer for every candidate, the check cannot say nothing is new."""
+        self.assertIsNone(self.run_check('1452', set(), unanswered={'1460'})[0])
+        self.assertEqual(self.run_check('1452', {'1453'}, unanswered={'1460'})[0], '1453')
+
+    def test_parse_args_check_only(self):
+        self.assertEqual(get_next_version.parse_args(['--check-only', '1452']).check_only, '1452')
+        with patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                get_next_version.parse_args(['--check-only', '1.4.5.2'])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Unit tests for http_pool.py against a local keep-alive HTTP server.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import socket
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add scripts directory to path to import the scripts
+script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import http_pool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+    user_agents = []
+    failures_left = 0
+    slow_left = 0
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, code, body=b'', headers=None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def handle_request(self):
+        Handler.connections.add(self.client_address)
+        Handler.user_agents.append(self.headers.get('User-Agent'))
+        if self.path == '/ok':
+            self.send_body(200, b'hello')
+        elif self.path == '/redirect':
+            self.send_body(302, b'moved', {'Location': '/ok'})
+        elif self.path == '/no-head' and self.command == 'HEAD':
+            self.send_body(405)
+        elif self.path == '/big':
+            self.send_body(200, b'x' * (1024 * 1024))
+        elif self.path == '/flaky':
+            if Handler.failures_left > 0:
+                Handler.failures_left -= 1
+                self.send_body(503, b'busy', {'Retry-After': '0'})
+            else:
+                self.send_body(200, b'hello')
+        elif self.path == '/slow-once':
+            if Handler.slow_left > 0:
+                Handler.slow_left -= 1
+                time.sleep(1)
+            self.send_body(200, b'hello')
+        else:
+            self.send_body(404, b'missing')
+
+    do_GET = handle_request
+    do_HEAD = handle_request
+
+
+class QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Connections dropped on purpose by the client are expected here
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Test connection reuse, redirects and error mapping."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = QuietServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.connections = set()
+        Handler.user_agents = []
+        self.pool = http_pool.ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close_all()
+
+    def test_get_reads_body(self):
+        """A GET returns the body and status."""
+        with self.pool.request(f'{self.base}/ok') as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.read(), b'hello')
+
+    def test_connection_reused(self):
+        """Sequential requests, including HEADs, share one connection."""
+        for _ in range(3):
+            with self.pool.request(f'{self.base}/ok') as response:
+                response.read()
+            self.pool.request(f'{self.base}/ok', method='HEAD').close()
+        self.assertEqual(self.pool.connections_opened, 1)
+        self.assertEqual(len(Handler.connections), 1)
+
+    def test_user_agent_sent(self):
+        """The shared User-Agent is sent by default."""
+        self.pool.request(f'{self.base}/ok', method='HEAD').close()
+        self.assertEqual(Handler.user_agents, [http_pool.USER_AGENT])
+
+    def test_redirect_followed(self):
+        """Redirects are followed on the same connection."""
+        with self.pool.request(f'{self.base}/redirect') as response:
+            self.assertEqual(response.read(), b'hello')
+            self.assertTrue(response.url.endswith('/ok'))
+        self.assertEqual(self.pool.connections_opened, 1)
+
+    def test_http_error(self):
+        """4xx responses raise urllib.error.HTTPError with the status code."""
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.pool.request(f'{self.base}/missing', method='HEAD')
+        self.assertEqual(ctx.exception.code, 404)
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            self.pool.request(f'{self.base}/no-head', method='HEAD')
+        self.assertEqual(ctx.exception.code, 405)
+        # Error responses leave the connection reusable
+        self.pool.request(f'{self.base}/ok', method='HEAD').close()
+        self.assertEqual(self.pool.connections_opened, 1)
+
+    def test_unread_large_body_not_reused(self):
+        """A connection with a large unread body is closed rather than pooled."""
+        self.pool.request(f'{self.base}/big').close()
+        self.pool.request(f'{self.base}/ok', method='HEAD').close()
+        self.assertEqual(self.pool.connections_opened, 2)
+
+    def test_stale_connection_retried(self):
+        """A pooled connection closed by the server is replaced transparently."""
+        self.pool.request(f'{self.base}/ok', method='HEAD').close()
+        for conns in self.pool._idle.values():
+            for conn in conns:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+        with self.pool.request(f'{self.base}/ok') as response:
+            self.assertEqual(response.read(), b'hello')
+
+    def test_connection_refused(self):
+        """An unreachable server raises urllib.error.URLError."""
+        with self.assertRaises(urllib.error.URLError):
+            self.pool.request('http://127.0.0.1:1/ok', retries=0)
+
+
+    def test_scope_slots_released(self):
+        """Each request holds a limiter slot until its response is closed, errors included."""
+        limiter = threading.BoundedSemaphore(1)
+        with http_pool.use_scope(http_pool.CallScope(limiter=limiter)):
+            with self.pool.request(f'{self.base}/redirect') as response:
+                self.assertFalse(limiter.acquire(blocking=False))
+                response.read()
+            with self.assertRaises(urllib.error.HTTPError):
+                self.pool.request(f'{self.base}/missing')
+            self.pool.request(f'{self.base}/ok', method='HEAD').close()
+        self.assertTrue(limiter.acquire(blocking=False))
+
+    def test_scope_cancelled(self):
+        """Requests under a cancelled or expired scope fail with RequestCancelled."""
+        scope = http_pool.CallScope()
+        scope.cancel()
+        with http_pool.use_scope(scope):
+            with self.assertRaises(http_pool.RequestCancelled):
+                self.pool.request(f'{self.base}/ok')
+        scope = http_pool.CallScope(deadline=time.monotonic() - 1)
+        with http_pool.use_scope(scope):
+            with self.assertRaises(http_pool.RequestCancelled):
+                self.pool.request(f'{self.base}/ok')
+        self.assertTrue(scope.expired)
+        self.assertEqual(Handler.user_agents, [])
+
+class TestRetries(unittest.TestCase):
+    """Test retries with backoff and hedged requests."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = QuietServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.user_agents = []
+        self.backoff = patch.object(http_pool, 'BACKOFF_BASE', 0.001)
+        self.backoff.start()
+
+    def tearDown(self):
+        self.backoff.stop()
+        http_pool.close_all()
+
+    def test_transient_status_retried(self):
+        """A 503 is retried until the server answers."""
+        Handler.failures_left = 2
+        with http_pool.request_with_retries(f'{self.base}/flaky') as response:
+            self.assertEqual(response.read(), b'hello')
+        self.assertEqual(len(Handler.user_agents), 3)
+
+    def test_attempts_bounded(self):
+        Handler.failures_left = 5
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            http_pool.request_with_retries(f'{self.base}/flaky', attempts=2)
+        self.assertEqual(ctx.exception.code, 503)
+        self.assertEqual(len(Handler.user_agents), 2)
+        Handler.failures_left = 0
+
+    def test_not_found_not_retried(self):
+        """A 404 is an answer, not a failure."""
+        with self.assertRaises(urllib.error.HTTPError):
+            http_pool.request_with_retries(f'{self.base}/missing')
+        self.assertEqual(len(Handler.user_agents), 1)
+
+    def test_backoff_delay(self):
+        """Delays are jittered below an exponentially growing cap, and Retry-After is honored."""
+        for attempt in range(6):
+            delay = http_pool.backoff_delay(attempt)
+            self.assertLessEqual(delay, min(http_pool.BACKOFF_CAP, http_pool.BACKOFF_BASE * 2 ** attempt))
+        error = urllib.error.HTTPError('url', 429, 'Too Many Requests', {'Retry-After': '3'}, None)
+        self.assertEqual(http_pool.backoff_delay(0, error), 3)
+        error = urllib.error.HTTPError('url', 429, 'Too Many Requests', {'Retry-After': '3600'}, None)
+        self.assertEqual(http_pool.backoff_delay(0, error), http_pool.MAX_RETRY_AFTER)
+
+    def test_hedged_request(self):
+        """A request slower than the hedge delay is duplicated and the faster answer used."""
+        Handler.slow_left = 1
+        tracker = http_pool.LatencyTracker()
+        started = time.monotonic()
+        with patch.object(http_pool, 'HEDGE_DEFAULT_DELAY', 0.05):
+            with http_pool.request_with_retries(f'{self.base}/slow-once', hedge=tracker) as response:
+                self.assertEqual(response.read(), b'hello')
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual(len(Handler.user_agents), 2)
+
+    def test_hedge_delay_percentile(self):
+        tracker = http_pool.LatencyTracker()
+        self.assertEqual(tracker.hedge_delay(), http_pool.HEDGE_DEFAULT_DELAY)
+        for ms in range(1, 51):
+            tracker.record(ms / 100)
+        self.assertAlmostEqual(tracker.hedge_delay(), 0.48)
+
+
+if __name__ == '__main__':
+    unittest.main()
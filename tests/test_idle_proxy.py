@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Unit tests for idle_proxy.py, with a dummy TCP echo server as the backend.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import socket
+import tempfile
+import threading
+import time
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import idle_proxy
+
+# Echoes every connection on the port given as its argument, and exits on the
+# "exit" console command like the real server, after SLOW_EXIT seconds of "saving"
+ECHO_SERVER = '''
+import os, socket, sys, threading, time
+def echo(conn):
+    with conn:
+        while data := conn.recv(65536):
+            conn.sendall(data)
+def serve(listener):
+    while True:
+        threading.Thread(target=echo, args=(listener.accept()[0],), daemon=True).start()
+listener = socket.create_server(("127.0.0.1", int(sys.argv[1])))
+threading.Thread(target=serve, args=(listener,), daemon=True).start()
+for line in sys.stdin:
+    if line.strip() == "exit":
+        time.sleep(float(os.environ.get("SLOW_EXIT", "0")))
+        break
+'''
+
+
+def free_port():
+    with socket.create_server(('127.0.0.1', 0)) as sock:
+        return sock.getsockname()[1]
+
+
+def process_state(pid):
+    """Single letter state of a process from /proc, e.g. 'T' when stopped."""
+    with open(f'/proc/{pid}/stat') as f:
+        return f.read().rsplit(')', 1)[1].split()[0]
+
+
+class IdleProxyTestCase(unittest.TestCase):
+    idle_action = 'suspend'
+    command_prefix = []
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        server_path = os.path.join(self.tmp.name, 'echo_server.py')
+        with open(server_path, 'w') as f:
+            f.write(ECHO_SERVER)
+        port = free_port()
+        self.backend = idle_proxy.Backend(self.command_prefix + [sys.executable, server_path, str(port)], port,
+                                          start_timeout=10, stop_timeout=5)
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+        self.stderr = patch('sys.stderr', new_callable=io.StringIO)
+        self.stderr.start()
+        self.proxy = idle_proxy.IdleProxy(self.backend, 0, listen_host='127.0.0.1', idle_timeout=0.3,
+                                          idle_action=self.idle_action)
+        self.thread = threading.Thread(target=self.proxy.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.proxy.shutdown()
+        self.thread.join(10)
+        self.stderr.stop()
+        self.stdout.stop()
+        self.tmp.cleanup()
+
+    def round_trip(self, payload=b'hello'):
+        with socket.create_connection(self.proxy.address, timeout=10) as sock:
+            sock.sendall(payload)
+            received = b''
+            while len(received) < len(payload):
+                data = sock.recv(65536)
+                if not data:
+                    break
+                received += data
+        return received
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'timed out')
+            time.sleep(0.05)
+
+
+class TestLazyStart(IdleProxyTestCase):
+    def test_started_on_first_connection(self):
+        time.sleep(0.5)
+        self.assertIsNone(self.backend.process)
+        self.assertEqual(self.round_trip(), b'hello')
+        payload = os.urandom(256 * 1024)
+        self.assertEqual(self.round_trip(payload), payload)
+        self.assertEqual(self.backend.starts, 1)
+
+    def test_concurrent_connections_start_once(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.round_trip())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [b'hello'] * 5)
+        self.assertEqual(self.backend.starts, 1)
+
+    def test_stopped_on_shutdown(self):
+        self.round_trip()
+        process = self.backend.process
+        self.proxy.shutdown()
+        self.thread.join(10)
+        self.assertEqual(process.returncode, 0)
+
+
+class TestSuspend(IdleProxyTestCase):
+    def test_suspended_when_idle_and_resumed(self):
+        with socket.create_connection(self.proxy.address, timeout=10) as sock:
+            sock.sendall(b'x')
+            self.assertEqual(sock.recv(1), b'x')
+            # Not idle while a connection is open
+            time.sleep(1)
+            self.assertFalse(self.backend.suspended)
+        self.wait_for(lambda: self.backend.suspended)
+        pid = self.backend.process.pid
+        self.assertEqual(process_state(pid), 'T')
+        self.assertEqual(self.round_trip(), b'hello')
+        self.assertEqual(self.backend.process.pid, pid)
+        self.assertEqual(self.backend.starts, 1)
+
+
+class TestStop(IdleProxyTestCase):
+    idle_action = 'stop'
+
+    def test_stopped_when_idle_and_restarted(self):
+        self.assertEqual(self.round_trip(), b'hello')
+        first = self.backend.process
+        self.wait_for(lambda: self.backend.process is None)
+        self.assertEqual(first.returncode, 0)
+        self.assertEqual(self.round_trip(), b'hello')
+        self.assertEqual(self.backend.starts, 2)
+
+    def test_accepting_while_stopping(self):
+        """A slow stop does not hold up accept; the new connection waits for it and restarts the server."""
+        with patch.dict(os.environ, {'SLOW_EXIT': '2'}):
+            self.assertEqual(self.round_trip(), b'hello')
+            self.wait_for(lambda: 'stopping the server' in sys.stdout.getvalue())
+            with socket.create_connection(self.proxy.address, timeout=10) as sock:
+                started = time.monotonic()
+                self.wait_for(lambda: self.proxy.active == 1, timeout=1)
+                self.assertLess(time.monotonic() - started, 1)
+                sock.sendall(b'x')
+                self.assertEqual(sock.recv(1), b'x')
+                # Stopped once, however many idle checks ran during the stop
+                self.assertEqual(sys.stdout.getvalue().count('stopping the server'), 1)
+        self.assertEqual(self.backend.starts, 2)
+
+    def test_connection_before_stop_cancels_it(self):
+        """A connection accepted between the idle check and the stop keeps the server running."""
+        self.proxy.idle_timeout = 600
+        self.assertEqual(self.round_trip(), b'hello')
+        process = self.backend.process
+        self.wait_for(lambda: self.proxy.active == 0)
+        with self.backend._lock:
+            self.proxy.check_idle(now=time.monotonic() + 1000)
+            stopper = self.proxy._idle_stop
+            sock = socket.create_connection(self.proxy.address, timeout=10)
+            self.wait_for(lambda: self.proxy.active == 1)
+        with sock:
+            stopper.join(10)
+            sock.sendall(b'x')
+            self.assertEqual(sock.recv(1), b'x')
+        self.assertIs(self.backend.process, process)
+        self.assertIsNone(process.poll())
+        self.assertEqual(self.backend.starts, 1)
+        self.assertIn('keeping the server running', sys.stdout.getvalue())
+
+
+class TestBackendFailure(IdleProxyTestCase):
+    command_prefix = [sys.executable, '-c', 'import sys; sys.exit(4)', '--']
+
+    def test_connection_dropped(self):
+        # Closed with the greeting unread, so the client may see a reset
+        try:
+            received = self.round_trip()
+        except ConnectionResetError:
+            received = b''
+        self.assertEqual(received, b'')
+        self.assertIn('exited with status 4', sys.stderr.getvalue())
+
+
+class TestCommandLine(unittest.TestCase):
+    def test_arguments_checked(self):
+        with patch('sys.stderr', new_callable=io.StringIO):
+            for argv in (['--listen-port', '7777'], ['--listen-port', '7777', '--server-port', '7777', '--', 'x']):
+                with self.assertRaises(SystemExit):
+                    idle_proxy.main(argv)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Unit tests for install_layout.py.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import json
+import tempfile
+
+# Add scripts directory to path to import the scripts
+script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import install_layout
+
+
+class LayoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work_dir = self.tmp.name
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+
+    def tearDown(self):
+        self.stdout.stop()
+        self.tmp.cleanup()
+
+    def install(self, version, files, keep=1):
+        """Stage files ({relative path: content}) and commit them as version."""
+        staging_dir = install_layout.new_staging(self.work_dir)
+        for name, content in files.items():
+            path = os.path.join(staging_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        return install_layout.commit(self.work_dir, staging_dir, version, keep)
+
+    def read(self, name):
+        with open(os.path.join(self.work_dir, name)) as f:
+            return f.read()
+
+
+class TestSwitch(LayoutTestCase):
+    """Committing a staged tree switches the install to it."""
+
+    def test_first_install(self):
+        self.install('1449', {'TerrariaServer.exe': 'v1', 'lib64/libsteam_api.so': 'steam'})
+        self.assertEqual(install_layout.current_name(self.work_dir), '1449')
+        self.assertEqual(self.read('TerrariaServer.exe'), 'v1')
+        self.assertEqual(self.read('lib64/libsteam_api.so'), 'steam')
+        self.assertTrue(os.path.islink(os.path.join(self.work_dir, 'lib64')))
+
+    def test_entries_added_and_removed(self):
+        """Links follow the entries of the active version; other files are left alone."""
+        self.install('1449', {'TerrariaServer.exe': 'v1', 'lib64/libsteam_api.so': 'steam'})
+        with open(os.path.join(self.work_dir, 'serverconfig.txt'), 'w') as f:
+            f.write('config')
+        self.install('1450', {'TerrariaServer.exe': 'v2', 'System.dll': 'system'})
+        self.assertEqual(self.read('TerrariaServer.exe'), 'v2')
+        self.assertEqual(self.read('System.dll'), 'system')
+        self.assertFalse(os.path.lexists(os.path.join(self.work_dir, 'lib64')))
+        self.assertEqual(self.read('serverconfig.txt'), 'config')
+
+    def test_same_version_reinstalled(self):
+        """Installing a version again does not touch the tree it replaces."""
+        self.install('1449', {'TerrariaServer.exe': 'v1'})
+        self.assertEqual(self.install('1449', {'TerrariaServer.exe': 'v1 again'}), '1449.1')
+        self.assertEqual(self.read('TerrariaServer.exe'), 'v1 again')
+        self.assertEqual(install_layout.installed_versions(self.work_dir), ['1449.1', '1449'])
+
+    def test_durable_without_global_sync(self):
+        """Only the staged tree is flushed: its directories and the versions directory, never os.sync()."""
+        synced = []
+        real_fsync_path = install_layout.fileutil.fsync_path
+        with patch('os.sync', side_effect=AssertionError('os.sync called')), \
+                patch.object(install_layout.fileutil, 'fsync_path',
+                             side_effect=lambda path: synced.append(path) or real_fsync_path(path)):
+            self.install('1449', {'TerrariaServer.exe': 'v1', 'lib64/libsteam_api.so': 'steam'})
+        base = install_layout.versions_dir(self.work_dir)
+        # The staging directory and its lib64, deepest first
+        staged = [path for path in synced if install_layout.STAGING_PREFIX in path]
+        self.assertEqual([os.path.basename(path) for path in staged][0], 'lib64')
+        self.assertEqual(len(staged), 2)
+        self.assertIn(base, synced)
+
+    def test_stale_staging_removed(self):
+        """Staging directories of interrupted installs are cleaned up by the next one."""
+        stale = install_layout.new_staging(self.work_dir)
+        self.install('1449', {'TerrariaServer.exe': 'v1'})
+        self.assertFalse(os.path.exists(stale))
+
+    def test_flat_install_migrated(self):
+        """Server files of a flat install are replaced by links, other files stay."""
+        os.makedirs(os.path.join(self.work_dir, 'lib64'))
+        for name, content in (('lib64/libsteam_api.so', 'old'), ('Old.dll', 'old'),
+                              ('TerrariaServer.exe', 'old'), ('Worlds.txt', 'mine')):
+            with open(os.path.join(self.work_dir, name), 'w') as f:
+                f.write(content)
+        with open(os.path.join(self.work_dir, install_layout.MANIFEST_NAME), 'w') as f:
+            json.dump({'files': {'lib64/libsteam_api.so': {}, 'Old.dll': {}, 'TerrariaServer.exe': {}}}, f)
+
+        self.install('1450', {'TerrariaServer.exe': 'v2', install_layout.MANIFEST_NAME: '{}'})
+        self.assertEqual(self.read('TerrariaServer.exe'), 'v2')
+        self.assertFalse(os.path.lexists(os.path.join(self.work_dir, 'lib64')))
+        self.assertFalse(os.path.lexists(os.path.join(self.work_dir, 'Old.dll')))
+        self.assertEqual(self.read('Worlds.txt'), 'mine')
+        self.assertTrue(os.path.islink(os.path.join(self.work_dir, install_layout.MANIFEST_NAME)))
+
+
+class TestRetention(LayoutTestCase):
+    """Previous versions are kept for rollback up to the retention count."""
+
+    def test_keep_count(self):
+        for version in ('1447', '1448', '1449', '1450'):
+            self.install(version, {'TerrariaServer.exe': version}, keep=2)
+        self.assertEqual(install_layout.installed_versions(self.work_dir), ['1450', '1449', '1448'])
+
+    def test_keep_none(self):
+        self.install('1449', {'TerrariaServer.exe': 'v1'}, keep=0)
+        self.install('1450', {'TerrariaServer.exe': 'v2'}, keep=0)
+        self.assertEqual(install_layout.installed_versions(self.work_dir), ['1450'])
+
+    def test_keep_from_env(self):
+        with patch.dict(os.environ, {'TERRARIA_KEEP_VERSIONS': '3'}):
+            self.assertEqual(install_layout.keep_from_env(), 3)
+        with patch.dict(os.environ, clear=True):
+            self.assertEqual(install_layout.keep_from_env(), install_layout.DEFAULT_KEEP)
+
+    def test_rollback_and_forward(self):
+        """Rolling back twice returns to the version rolled back from."""
+        self.install('1449', {'TerrariaServer.exe': 'v1'})
+        self.install('1450', {'TerrariaServer.exe': 'v2'})
+        self.assertEqual(install_layout.rollback(self.work_dir), '1449')
+        self.assertEqual(self.read('TerrariaServer.exe'), 'v1')
+        self.assertEqual(install_layout.rollback(self.work_dir), '1450')
+        self.assertEqual(self.read('TerrariaServer.exe'), 'v2')
+
+    def test_cli(self):
+        self.assertEqual(install_layout.main(['rollback', self.work_dir]), 1)
+        self.install('1449', {'TerrariaServer.exe': 'v1'})
+        self.install('1450', {'TerrariaServer.exe': 'v2'})
+        self.assertEqual(install_layout.main(['rollback', self.work_dir]), 0)
+        self.assertEqual(install_layout.main(['list', self.work_dir]), 0)
+        self.assertIn('* 1449\n  1450', sys.stdout.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
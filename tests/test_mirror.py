@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Unit tests for mirror.py, run against the simulated terraria.org.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import functools
+import hashlib
+import json
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+for path in (script_dir, tests_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import download_server
+import get_latest_filename
+import get_latest_version
+import http_pool
+import mirror
+import fake_terraria
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class MirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake = fake_terraria.FakeTerraria(['1449', '1450', '1451'], archive_size=64 * 1024).start()
+        self.original = fake_terraria.route_to(self.fake.base_url)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mirror_dir = os.path.join(self.tmp.name, 'mirror')
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+        self.stderr = patch('sys.stderr', new_callable=io.StringIO)
+        self.stderr.start()
+
+    def tearDown(self):
+        self.stderr.stop()
+        self.stdout.stop()
+        http_pool.request = self.original
+        http_pool.close_all()
+        self.fake.stop()
+        self.tmp.cleanup()
+
+    def load_index(self):
+        with open(os.path.join(self.mirror_dir, mirror.INDEX_NAME)) as f:
+            return json.load(f)
+
+
+class TestMirrorCommand(MirrorTestCase):
+    """Filling a mirror directory from terraria.org."""
+
+    def test_parse_versions(self):
+        self.assertEqual(mirror.parse_versions(['1.4.4.9', '1450-1452', '1451', 'latest']),
+                         ['1449', '1450', '1451', '1452', 'latest'])
+        for spec in ('abc', '1452-1450', '99'):
+            with self.assertRaises(ValueError):
+                mirror.parse_versions([spec])
+
+    def test_range_mirrored(self):
+        """Published versions are downloaded with their digest, unpublished ones skipped."""
+        mirrored, missing, failed = mirror.mirror(self.mirror_dir, mirror.parse_versions(['1449-1452']), jobs=4)
+        self.assertEqual((sorted(mirrored), missing, failed), (['1449', '1450', '1451'], ['1452'], []))
+        index = self.load_index()
+        self.assertEqual(sorted(index['versions']), ['1449', '1450', '1451'])
+        with open(os.path.join(self.mirror_dir, 'terraria-server-1450.zip'), 'rb') as f:
+            data = f.read()
+        self.assertEqual(data, self.fake.archive('1450'))
+        self.assertEqual(index['versions']['1450']['sha256'], hashlib.sha256(data).hexdigest())
+
+    def test_refresh_skips_mirrored(self):
+        """Versions already in the index are not downloaded again."""
+        mirror.mirror(self.mirror_dir, ['1449', '1450'])
+        sent = self.fake.counters()['bytes']
+        mirrored, _, _ = mirror.mirror(self.mirror_dir, ['1449', '1450', 'latest'])
+        self.assertEqual(sorted(mirrored), ['1449', '1450', '1451'])
+        self.assertLess(self.fake.counters()['bytes'] - sent, 2 * len(self.fake.archive('1451')))
+
+    def test_cli(self):
+        self.assertEqual(mirror.main([self.mirror_dir, '1451']), 0)
+        self.assertIn('Mirrored 1 version(s)', sys.stdout.getvalue())
+        self.assertEqual(mirror.main([self.mirror_dir, 'x']), 1)
+
+
+class TestLocalMirror(MirrorTestCase):
+    """With TERRARIA_MIRROR set to a directory, nothing goes to the network."""
+
+    def setUp(self):
+        super().setUp()
+        mirror.mirror(self.mirror_dir, ['1449', '1450'])
+        self.env = patch.dict(os.environ, {'TERRARIA_MIRROR': self.mirror_dir})
+        self.env.start()
+        self.requests = self.fake.counters()['requests']
+
+    def tearDown(self):
+        self.env.stop()
+        super().tearDown()
+
+    def test_discovery(self):
+        self.assertEqual(get_latest_filename.get_latest_filename(), 'terraria-server-1450.zip')
+        self.assertEqual(get_latest_version.get_base_version(), '1450')
+        self.assertTrue(get_latest_version.is_version_available('1449'))
+        self.assertFalse(get_latest_version.is_version_available('1451'))
+        self.assertEqual(get_latest_version.find_highest_version(jobs=4), '1450')
+        self.assertEqual(self.fake.counters()['requests'], self.requests)
+
+    def test_download(self):
+        out_dir = os.path.join(self.tmp.name, 'out')
+        os.makedirs(out_dir)
+        download_server.download_server('latest', out_dir, use_cache=False)
+        with open(os.path.join(out_dir, 'terraria-server.zip'), 'rb') as f:
+            self.assertEqual(f.read(), self.fake.archive('1450'))
+        with open(os.path.join(out_dir, 'download-info.json')) as f:
+            info = json.load(f)
+        self.assertEqual(info['archive']['sha256'], self.load_index()['versions']['1450']['sha256'])
+        self.assertEqual(self.fake.counters()['requests'], self.requests)
+
+    def test_missing_version(self):
+        with self.assertRaises(FileNotFoundError):
+            download_server.download_server('1451', self.tmp.name, use_cache=False)
+
+    def test_missing_version_command(self):
+        """The build gets an error message and a failed step, not a traceback."""
+        with patch('sys.stdout', new_callable=io.StringIO), patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            self.assertEqual(download_server.main(['1451', self.tmp.name, '--no-cache']), 1)
+        self.assertIn('Error: terraria-server-1451.zip is not in the mirror', stderr.getvalue())
+
+
+class TestHttpMirror(MirrorTestCase):
+    """A mirror directory served over HTTP stands in for terraria.org."""
+
+    def setUp(self):
+        super().setUp()
+        mirror.mirror(self.mirror_dir, ['1449', '1450'])
+        handler = functools.partial(QuietHandler, directory=self.mirror_dir)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{self.server.server_address[1]}/'
+        self.env = patch.dict(os.environ, {'TERRARIA_MIRROR': url})
+        self.env.start()
+        self.requests = self.fake.counters()['requests']
+
+    def tearDown(self):
+        self.env.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_discovery_and_download(self):
+        self.assertEqual(get_latest_version.find_highest_version(), '1450')
+        self.assertFalse(get_latest_version.is_version_available('1451'))
+        download_server.download_server('1449', self.tmp.name, use_cache=False)
+        with open(os.path.join(self.tmp.name, 'terraria-server.zip'), 'rb') as f:
+            self.assertEqual(f.read(), self.fake.archive('1449'))
+        self.assertEqual(self.fake.counters()['requests'], self.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Unit tests for probe_cache.py and its use in get_latest_version.py.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import json
+import tempfile
+
+# Add scripts directory to path to import the scripts
+script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import probe_cache
+import get_latest_version
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestProbeCache(unittest.TestCase):
+    """Test ProbeCache storage, expiry and eviction."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache', 'probe-cache.json')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_cache(self, **kwargs):
+        kwargs.setdefault('hit_ttl', 1000)
+        kwargs.setdefault('miss_ttl', 10)
+        return probe_cache.ProbeCache(self.path, clock=self.clock, **kwargs)
+
+    def test_empty_when_file_missing(self):
+        """A missing cache file gives an empty cache."""
+        cache = self.make_cache()
+        self.assertIsNone(cache.lookup('1450'))
+        self.assertIsNone(cache.highest_hit())
+        self.assertIsNone(cache.get_base_version())
+
+    def test_round_trip(self):
+        """Recorded results survive a save/load cycle."""
+        cache = self.make_cache()
+        cache.record('1450', True)
+        cache.record('1500', False)
+        cache.set_base_version('1449')
+        cache.save()
+
+        reloaded = self.make_cache()
+        self.assertTrue(reloaded.lookup('1450'))
+        self.assertFalse(reloaded.lookup('1500'))
+        self.assertEqual(reloaded.get_base_version(), '1449')
+
+    def test_separate_ttls(self):
+        """Misses expire before hits."""
+        cache = self.make_cache()
+        cache.record('1450', True)
+        cache.record('1500', False)
+        self.clock.now += 11
+        self.assertTrue(cache.lookup('1450'))
+        self.assertIsNone(cache.lookup('1500'))
+        self.clock.now += 1000
+        self.assertIsNone(cache.lookup('1450'))
+
+    def test_highest_hit(self):
+        """highest_hit ignores misses."""
+        cache = self.make_cache()
+        cache.record('1449', True)
+        cache.record('1450', True)
+        cache.record('1500', False)
+        self.assertEqual(cache.highest_hit(), '1450')
+
+    def test_eviction_keeps_most_recent(self):
+        """The least recently checked entries are evicted above max_entries."""
+        cache = self.make_cache(max_entries=2)
+        for version in ('1450', '1451', '1452'):
+            cache.record(version, True)
+            self.clock.now += 1
+        cache.save()
+        with open(self.path) as f:
+            self.assertEqual(sorted(json.load(f)['probes']), ['1451', '1452'])
+
+    def test_base_version_validators(self):
+        """Page validators survive expiry and are kept when the same value is stored again."""
+        cache = self.make_cache()
+        self.assertIsNone(cache.base_version_validators())
+        cache.set_base_version('1449', etag='"abc"', last_modified='Tue, 01 Oct 2024 12:00:00 GMT')
+        cache.save()
+        self.clock.now += 2000
+        reloaded = self.make_cache()
+        self.assertIsNone(reloaded.get_base_version())
+        self.assertEqual(reloaded.base_version_validators(),
+                         {'value': '1449', 'etag': '"abc"', 'last_modified': 'Tue, 01 Oct 2024 12:00:00 GMT'})
+        reloaded.set_base_version('1449')
+        self.assertEqual(reloaded.get_base_version(), '1449')
+        self.assertEqual(reloaded.base_version_validators()['etag'], '"abc"')
+        reloaded.set_base_version('1450')
+        self.assertIsNone(reloaded.base_version_validators()['etag'])
+
+    def test_corrupt_file_ignored(self):
+        """A corrupt cache file is treated as empty."""
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{not json')
+        with patch('sys.stderr', new_callable=io.StringIO):
+            cache = self.make_cache()
+        self.assertIsNone(cache.lookup('1450'))
+
+
+class TestCachedSearch(unittest.TestCase):
+    """Test find_highest_version with a probe cache."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'probe-cache.json')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def search(self, available, base='1449', jobs=1):
+        cache = probe_cache.ProbeCache(self.path, hit_ttl=1000, miss_ttl=10, clock=self.clock)
+        with patch.object(get_latest_version, 'get_base_version', return_value=base) as mock_base, \
+             patch.object(get_latest_version, 'is_version_available',
+                          side_effect=lambda v: v in available) as mock_available, \
+             patch('sys.stdout', new_callable=io.StringIO):
+            result = get_latest_version.find_highest_version(jobs=jobs, cache=cache)
+        return result, mock_base.call_count, [c.args[0] for c in mock_available.call_args_list]
+
+    def test_warm_run_skips_scrape_and_known_results(self):
+        """A warm run reuses the base version and every fresh result."""
+        available = {'1450', '1451'}
+        cold, scrapes, cold_probes = self.search(available)
+        self.assertEqual(cold, '1451')
+        self.assertEqual(scrapes, 1)
+        self.assertTrue(cold_probes)
+
+        warm, scrapes, warm_probes = self.search(available)
+        self.assertEqual(warm, '1451')
+        self.assertEqual(scrapes, 0)
+        self.assertEqual(warm_probes, [])
+
+    def test_only_probes_above_highest_hit(self):
+        """Once misses expire, only versions above the highest confirmed one are probed."""
+        self.search({'1450', '1451'})
+        self.clock.now += 11  # misses expired, hits still fresh
+        result, _, probes = self.search({'1450', '1451', '1452'})
+        self.assertEqual(result, '1452')
+        self.assertTrue(all(int(v) > 1451 for v in probes))
+
+    def test_parallel_mode_uses_cache(self):
+        """Concurrent prefetching skips cached versions too."""
+        self.search({'1450'}, jobs=4)
+        _, _, probes = self.search({'1450'}, jobs=4)
+        self.assertEqual(probes, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
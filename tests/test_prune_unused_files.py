@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Unit tests for prune_unused_files.py.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import hashlib
+import random
+import stat
+import tempfile
+import zipfile
+
+# Add scripts directory to path to import the scripts
+script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import prune_unused_files
+import install_layout
+import install_manifest
+
+LINUX_FILES = {
+    'TerrariaServer.bin.x86_64': (b'\x7fELF-server', 0o755),
+    'TerrariaServer.exe': (b'MZ-server', 0o644),
+    'System.dll': (b'system', 0o644),
+    'lib64/libsteam_api.so': (b'steam', 0o755),
+    'Content/Images/Item_1.xnb': (b'item' * 100, 0o644),
+}
+
+
+def build_server_zip(path, version='1449', linux_files=LINUX_FILES):
+    """Write an archive laid out like the official dedicated server zip."""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f'{version}/', b'')
+        for name, (content, mode) in linux_files.items():
+            info = zipfile.ZipInfo(f'{version}/Linux/{name}')
+            info.external_attr = (stat.S_IFREG | mode) << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, content)
+        zf.writestr(f'{version}/Windows/TerrariaServer.exe', b'windows' * 1000)
+        zf.writestr(f'{version}/Mac/Terraria Server.app/Contents/MacOS/TerrariaServer', b'mac' * 1000)
+
+
+class PruneTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work_dir = self.tmp.name
+        self.zip_path = os.path.join(self.work_dir, 'terraria-server.zip')
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+
+    def tearDown(self):
+        self.stdout.stop()
+        self.tmp.cleanup()
+
+    def read(self, name):
+        with open(os.path.join(self.work_dir, name), 'rb') as f:
+            return f.read()
+
+
+class TestSelectiveExtraction(PruneTestCase):
+    """Test that only the Linux tree is extracted from the archive."""
+
+    def test_linux_files_installed(self):
+        """Linux members land in the working directory with the prefix removed."""
+        build_server_zip(self.zip_path)
+        prune_unused_files.prune(self.work_dir)
+        for name, (content, _) in LINUX_FILES.items():
+            self.assertEqual(self.read(name), content)
+
+    def test_other_platforms_not_written(self):
+        """The version folder, Mac and Windows trees and the zip are gone."""
+        build_server_zip(self.zip_path)
+        prune_unused_files.prune(self.work_dir)
+        entries = set(os.listdir(self.work_dir))
+        self.assertNotIn('1449', entries)
+        self.assertNotIn('terraria-server.zip', entries)
+        self.assertEqual(entries, {'TerrariaServer.bin.x86_64', 'TerrariaServer.exe', 'System.dll',
+                                   'lib64', 'Content', 'install-manifest.json', install_layout.VERSIONS_DIR})
+
+    def test_installed_as_version(self):
+        """The files live in a version tree and the top-level entries link to the active one."""
+        build_server_zip(self.zip_path)
+        prune_unused_files.prune(self.work_dir)
+        self.assertEqual(install_layout.current_name(self.work_dir), '1449')
+        self.assertEqual(os.readlink(os.path.join(self.work_dir, 'lib64')),
+                         os.path.join(install_layout.VERSIONS_DIR, 'current', 'lib64'))
+        self.assertEqual(os.listdir(install_layout.versions_dir(self.work_dir)).count('1449'), 1)
+
+    def test_file_modes_kept(self):
+        """Executable bits from the archive are preserved."""
+        build_server_zip(self.zip_path)
+        prune_unused_files.prune(self.work_dir)
+        mode = os.stat(os.path.join(self.work_dir, 'TerrariaServer.bin.x86_64')).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o755)
+
+    def test_existing_entries_replaced(self):
+        """Existing top-level entries are replaced, not merged."""
+        os.makedirs(os.path.join(self.work_dir, 'lib64'))
+        with open(os.path.join(self.work_dir, 'lib64', 'stale.so'), 'w') as f:
+            f.write('old')
+        with open(os.path.join(self.work_dir, 'System.dll'), 'w') as f:
+            f.write('old')
+        build_server_zip(self.zip_path)
+        prune_unused_files.prune(self.work_dir)
+        self.assertEqual(os.listdir(os.path.join(self.work_dir, 'lib64')), ['libsteam_api.so'])
+        self.assertEqual(self.read('System.dll'), b'system')
+
+    def test_unsafe_member_rejected(self):
+        """Members escaping the working directory are refused."""
+        with self.assertRaises(ValueError):
+            prune_unused_files.safe_destination(self.work_dir, '../outside')
+
+    def test_missing_linux_folder_exits(self):
+        """An archive without a Linux tree is an error."""
+        with zipfile.ZipFile(self.zip_path, 'w') as zf:
+            zf.writestr('1449/Windows/TerrariaServer.exe', b'windows')
+        with self.assertRaises(SystemExit):
+            prune_unused_files.prune(self.work_dir)
+
+    def test_bad_zip_exits(self):
+        """A corrupt archive is an error."""
+        with open(self.zip_path, 'wb') as f:
+            f.write(b'not a zip')
+        with self.assertRaises(SystemExit):
+            prune_unused_files.prune(self.work_dir)
+
+    def test_extracted_folder_fallback(self):
+        """Without a zip, an already extracted version folder is used."""
+        linux = os.path.join(self.work_dir, '1449', 'Linux')
+        os.makedirs(linux)
+        with open(os.path.join(linux, 'TerrariaServer.exe'), 'wb') as f:
+            f.write(b'MZ')
+        prune_unused_files.prune(self.work_dir)
+        self.assertEqual(self.read('TerrariaServer.exe'), b'MZ')
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, '1449')))
+
+
+class TestArchPruning(PruneTestCase):
+    """Test installing only the files one architecture runs."""
+
+    ARM64_FILES = {'TerrariaServer.exe', 'Content/Images/Item_1.xnb'}
+
+    def test_arm64_drops_bundled_runtime(self):
+        """The shipped arm64 rules leave out the x86_64 binaries and the bundled mono libraries."""
+        build_server_zip(self.zip_path)
+        prune_unused_files.prune(self.work_dir, arch='arm64')
+        manifest = install_manifest.load_manifest(self.work_dir)
+        self.assertEqual(set(manifest['files']), self.ARM64_FILES)
+        self.assertEqual(manifest['arch'], 'arm64')
+        tree = install_layout.current_dir(self.work_dir)
+        self.assertEqual(set(os.listdir(tree)), {'TerrariaServer.exe', 'Content', 'install-manifest.json'})
+        self.assertFalse(os.path.lexists(os.path.join(self.work_dir, 'lib64')))
+        self.assertEqual(install_manifest.verify(self.work_dir, full=True), [])
+
+    def test_amd64_keeps_everything(self):
+        build_server_zip(self.zip_path)
+        prune_unused_files.prune(self.work_dir, arch='amd64')
+        self.assertEqual(set(install_manifest.load_manifest(self.work_dir)['files']), set(LINUX_FILES))
+
+    def test_extracted_folder_pruned(self):
+        """The rules also apply to a tree fetched with --linux-only."""
+        for name, (content, _) in LINUX_FILES.items():
+            path = os.path.join(self.work_dir, '1449', 'Linux', name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+        prune_unused_files.prune(self.work_dir, arch='arm64')
+        self.assertEqual(set(install_manifest.load_manifest(self.work_dir)['files']), self.ARM64_FILES)
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, '1449')))
+
+    def test_custom_rules(self):
+        """keep limits the install to matching paths, drop wins over keep."""
+        rules_path = os.path.join(self.work_dir, 'rules.json')
+        with open(rules_path, 'w') as f:
+            f.write('{"tiny": {"keep": ["TerrariaServer*", "Content"], "drop": ["*.x86_64"]}}')
+        build_server_zip(self.zip_path)
+        prune_unused_files.prune(self.work_dir, arch='tiny', arch_files=rules_path)
+        self.assertEqual(set(install_manifest.load_manifest(self.work_dir)['files']), self.ARM64_FILES)
+
+    def test_unknown_arch_exits(self):
+        build_server_zip(self.zip_path)
+        with self.assertRaises(SystemExit):
+            prune_unused_files.prune(self.work_dir, arch='riscv64')
+        self.assertTrue(os.path.exists(self.zip_path))
+
+    def test_wanted(self):
+        rules = {'drop': ['lib64', 'System*']}
+        self.assertFalse(prune_unused_files.wanted('lib64/libsteam_api.so', rules))
+        self.assertFalse(prune_unused_files.wanted('lib64/', rules))
+        self.assertFalse(prune_unused_files.wanted('System.Core.dll', rules))
+        self.assertTrue(prune_unused_files.wanted('Content/System.xnb', rules))
+        self.assertTrue(prune_unused_files.wanted('anything', None))
+
+
+class TestParallelExtraction(PruneTestCase):
+    """Test that extraction on several threads writes the same install."""
+
+    def build_large_zip(self):
+        rng = random.Random(1449)
+        linux_files = {f'Content/Images/Item_{i}.xnb': (rng.randbytes(rng.randrange(1, 64 * 1024)), 0o644)
+                       for i in range(40)}
+        linux_files.update(LINUX_FILES)
+        build_server_zip(self.zip_path, linux_files=linux_files)
+        return linux_files
+
+    def install(self, workers):
+        prune_unused_files.prune(self.work_dir, workers=workers)
+        tree = install_layout.current_dir(self.work_dir)
+        contents = {}
+        for root, _, names in os.walk(tree):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    contents[os.path.relpath(path, tree)] = (f.read(), stat.S_IMODE(os.stat(path).st_mode))
+        return contents
+
+    def test_byte_identical(self):
+        """Files, modes and manifest digests match a single-threaded extraction."""
+        linux_files = self.build_large_zip()
+        sequential = self.install(1)
+        sequential_manifest = install_manifest.load_manifest(self.work_dir)
+        self.build_large_zip()
+        parallel = self.install(4)
+        parallel_manifest = install_manifest.load_manifest(self.work_dir)
+
+        del sequential['install-manifest.json'], parallel['install-manifest.json']
+        self.assertEqual(parallel, sequential)
+        self.assertEqual(set(parallel), set(linux_files))
+        strip = lambda manifest: {name: (entry['size'], entry['sha256'], entry['crc32'])
+                                  for name, entry in manifest['files'].items()}
+        self.assertEqual(strip(parallel_manifest), strip(sequential_manifest))
+
+    def test_crc_mismatch_rejected(self):
+        """A member whose data does not match its CRC32 fails the install."""
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_STORED) as zf:
+            zf.writestr('1449/Linux/TerrariaServer.exe', b'MZ-server-payload')
+            zf.writestr('1449/Linux/System.dll', b'system')
+        with open(self.zip_path, 'rb') as f:
+            data = f.read()
+        with open(self.zip_path, 'wb') as f:
+            f.write(data.replace(b'MZ-server-payload', b'MZ-server-PAYLOAD'))
+        with self.assertRaises(SystemExit):
+            prune_unused_files.prune(self.work_dir, workers=2)
+        self.assertIn('Bad CRC-32', sys.stdout.getvalue())
+        self.assertIsNone(install_layout.current_name(self.work_dir))
+        self.assertEqual(os.listdir(install_layout.versions_dir(self.work_dir)), [])
+
+    def test_workers_from_env(self):
+        with patch.dict(os.environ, {'TERRARIA_EXTRACT_WORKERS': '3'}):
+            self.assertEqual(prune_unused_files.workers_from_env(), 3)
+        with patch.dict(os.environ, clear=True):
+            self.assertEqual(prune_unused_files.workers_from_env(), prune_unused_files.DEFAULT_WORKERS)
+
+
+class TestInstallManifest(PruneTestCase):
+    """Test the manifest written by prune and the verify command."""
+
+    def install(self):
+        build_server_zip(self.zip_path)
+        install_manifest.write_download_info(self.work_dir, '1449', 'terraria-server-1449.zip', 123, 'abc')
+        prune_unused_files.prune(self.work_dir)
+        return install_manifest.load_manifest(self.work_dir)
+
+    def test_manifest_records_files(self):
+        """Every installed file is listed with its size and digest."""
+        manifest = self.install()
+        self.assertEqual(set(manifest['files']), set(LINUX_FILES))
+        for name, (content, _) in LINUX_FILES.items():
+            self.assertEqual(manifest['files'][name]['size'], len(content))
+            self.assertEqual(manifest['files'][name]['sha256'], hashlib.sha256(content).hexdigest())
+
+    def test_manifest_records_archive(self):
+        """Version and archive digest come from the download hand-off file, which is removed."""
+        manifest = self.install()
+        self.assertEqual(manifest['version'], '1449')
+        self.assertEqual(manifest['archive'], {'name': 'terraria-server-1449.zip', 'size': 123, 'sha256': 'abc'})
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, install_manifest.DOWNLOAD_INFO_NAME)))
+
+    def test_verify_clean_install(self):
+        """A fresh install verifies in both modes."""
+        self.install()
+        self.assertEqual(install_manifest.verify(self.work_dir), [])
+        self.assertEqual(install_manifest.verify(self.work_dir, full=True), [])
+
+    def test_verify_whole_second_mtimes(self):
+        """Modification times truncated to whole seconds, as after a push and pull, still verify."""
+        self.install()
+        for root, _, files in os.walk(self.work_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns // 10**9 * 10**9))
+        self.assertEqual(install_manifest.verify(self.work_dir), [])
+        path = os.path.join(self.work_dir, 'TerrariaServer.exe')
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertEqual(install_manifest.verify(self.work_dir), ['TerrariaServer.exe: modified since install'])
+
+    def test_verify_detects_problems(self):
+        """Missing, truncated and rewritten files are reported."""
+        self.install()
+        os.remove(os.path.join(self.work_dir, 'System.dll'))
+        with open(os.path.join(self.work_dir, 'TerrariaServer.exe'), 'ab') as f:
+            f.write(b'extra')
+        path = os.path.join(self.work_dir, 'lib64', 'libsteam_api.so')
+        st = os.stat(path)
+        with open(path, 'wb') as f:
+            f.write(b'STEAM')
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        fast = install_manifest.verify(self.work_dir)
+        self.assertEqual(len(fast), 2)
+        full = install_manifest.verify(self.work_dir, full=True)
+        self.assertEqual(len(full), 3)
+        self.assertTrue(any('sha256 mismatch' in p for p in full))
+
+    def test_verify_command_exit_codes(self):
+        """The CLI exits 0 when clean, 1 on problems and 2 without a manifest."""
+        with patch('sys.stderr', new_callable=io.StringIO):
+            self.assertEqual(install_manifest.main(['verify', self.work_dir]), 2)
+            self.install()
+            self.assertEqual(install_manifest.main(['verify', self.work_dir]), 0)
+            os.remove(os.path.join(self.work_dir, 'System.dll'))
+            self.assertEqual(install_manifest.main(['verify', self.work_dir]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
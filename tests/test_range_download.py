@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Unit tests for range_download.py against a local HTTP server.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add scripts directory to path to import the scripts
+script_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import http_pool
+import range_download
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    supports_ranges = True
+    fail_ranges = set()
+    requested_ranges = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        range_header = self.headers.get('Range')
+        if self.supports_ranges and range_header:
+            start, end = range_header.split('=')[1].split('-')
+            start, end = int(start), min(int(end), len(PAYLOAD) - 1)
+            with Handler.lock:
+                Handler.requested_ranges.append((start, end))
+            body = PAYLOAD[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(PAYLOAD)}')
+            self.send_header('ETag', '"v1"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if start in Handler.fail_ranges:
+                # Send half the body, then drop the connection
+                Handler.fail_ranges.discard(start)
+                self.wfile.write(body[:len(body) // 2])
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+            self.wfile.write(body)
+        else:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(PAYLOAD)))
+            self.end_headers()
+            self.wfile.write(PAYLOAD)
+
+
+class TestRangeDownload(unittest.TestCase):
+    """Test parallel, resumable and fallback downloads."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/terraria-server-1449.zip'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.supports_ranges = True
+        Handler.fail_ranges = set()
+        Handler.requested_ranges = []
+        self.tmp = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.tmp.name, 'terraria-server.zip')
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+
+    def tearDown(self):
+        self.stdout.stop()
+        http_pool.close_all()
+        self.tmp.cleanup()
+
+    def read_output(self):
+        with open(self.output, 'rb') as f:
+            return f.read()
+
+    def test_parallel_download(self):
+        """The file is fetched in ranges and reassembled correctly."""
+        result = range_download.fetch(self.url, self.output, connections=4, chunk_size=128 * 1024)
+        self.assertEqual(result.size, len(PAYLOAD))
+        self.assertEqual(result.sha256, hashlib.sha256(PAYLOAD).hexdigest())
+        self.assertEqual(self.read_output(), PAYLOAD)
+        # 1-byte probe + 8 chunks
+        self.assertEqual(len(Handler.requested_ranges), 9)
+        self.assertFalse(os.path.exists(self.output + '.part'))
+        self.assertFalse(os.path.exists(self.output + '.part.json'))
+
+    def test_interrupted_range_is_retried(self):
+        """A range cut off mid-transfer is resumed from where it stopped."""
+        Handler.fail_ranges = {256 * 1024}
+        range_download.fetch(self.url, self.output, connections=2, chunk_size=256 * 1024)
+        self.assertEqual(self.read_output(), PAYLOAD)
+        self.assertIn((256 * 1024 + 128 * 1024, 512 * 1024 - 1), Handler.requested_ranges)
+
+    def test_resume_from_sidecar(self):
+        """Chunks recorded in the sidecar state are not downloaded again."""
+        chunk = 256 * 1024
+        with open(self.output + '.part', 'wb') as f:
+            f.write(PAYLOAD[:2 * chunk] + b'\0' * (len(PAYLOAD) - 2 * chunk))
+        with open(self.output + '.part.json', 'w') as f:
+            json.dump({'size': len(PAYLOAD), 'validator': '"v1"', 'chunk_size': chunk, 'done': [0, 1]}, f)
+
+        result = range_download.fetch(self.url, self.output, connections=2, chunk_size=chunk)
+        self.assertEqual(self.read_output(), PAYLOAD)
+        self.assertEqual(result.sha256, hashlib.sha256(PAYLOAD).hexdigest())
+        starts = sorted(start for start, _ in Handler.requested_ranges[1:])
+        self.assertEqual(starts, [2 * chunk, 3 * chunk])
+
+    def test_stale_sidecar_restarts(self):
+        """A sidecar for a different remote file is discarded."""
+        with open(self.output + '.part', 'wb') as f:
+            f.write(b'\xff' * len(PAYLOAD))
+        with open(self.output + '.part.json', 'w') as f:
+            json.dump({'size': len(PAYLOAD), 'validator': '"old"', 'chunk_size': 262144, 'done': [0, 1, 2]}, f)
+        range_download.fetch(self.url, self.output, chunk_size=262144)
+        self.assertEqual(self.read_output(), PAYLOAD)
+
+    def test_fallback_without_ranges(self):
+        """Servers that ignore Range get a single streamed download."""
+        Handler.supports_ranges = False
+        result = range_download.fetch(self.url, self.output)
+        self.assertEqual(result, (len(PAYLOAD), hashlib.sha256(PAYLOAD).hexdigest()))
+        self.assertEqual(self.read_output(), PAYLOAD)
+        self.assertIn('single stream', sys.stdout.getvalue())
+
+
+class TestSequentialHasher(unittest.TestCase):
+    """Test hashing of pieces written out of order."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryFile()
+        self.tmp.write(PAYLOAD)
+        self.tmp.flush()
+
+    def tearDown(self):
+        self.tmp.close()
+
+    def test_out_of_order_pieces(self):
+        """Pieces fed in any order give the digest of the whole file."""
+        hasher = range_download.SequentialHasher()
+        pieces = [(o, PAYLOAD[o:o + 1000]) for o in range(0, len(PAYLOAD), 1000)]
+        for offset, data in reversed(pieces):
+            hasher.feed(offset, data)
+        self.assertEqual(hasher.finish(self.tmp.fileno(), len(PAYLOAD)), hashlib.sha256(PAYLOAD).hexdigest())
+
+    def test_gaps_read_from_file(self):
+        """Pieces that were never fed or exceeded the cap are read from the file."""
+        hasher = range_download.SequentialHasher(max_pending=5000)
+        for offset in range(len(PAYLOAD) - 100000, len(PAYLOAD), 1000):
+            hasher.feed(offset, PAYLOAD[offset:offset + 1000])
+        self.assertEqual(hasher.finish(self.tmp.fileno(), len(PAYLOAD)), hashlib.sha256(PAYLOAD).hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Unit tests for remote_zip.py against a local range-capable HTTP server.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import tempfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+for path in (script_dir, tests_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import http_pool
+import remote_zip
+import download_server
+import prune_unused_files
+from test_prune_unused_files import LINUX_FILES, build_server_zip
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    archive = b''
+    supports_ranges = True
+    bytes_served = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = Handler.archive
+        range_header = self.headers.get('Range')
+        if self.supports_ranges and range_header:
+            start, end = (int(x) for x in range_header.split('=')[1].split('-'))
+            end = min(end, len(data) - 1)
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with Handler.lock:
+            Handler.bytes_served += len(body)
+
+
+class TestRemoteZip(unittest.TestCase):
+    """Test fetching only selected members of a remote archive."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/terraria-server-1449.zip'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work_dir = self.tmp.name
+        archive_path = os.path.join(self.tmp.name, 'source.zip')
+        build_server_zip(archive_path)
+        # Incompressible platform data, larger than the tail read for the central directory
+        with zipfile.ZipFile(archive_path, 'a') as zf:
+            zf.writestr('1449/Windows/steam_api64.dll', os.urandom(256 * 1024))
+        with open(archive_path, 'rb') as f:
+            Handler.archive = f.read()
+        os.remove(archive_path)
+        Handler.supports_ranges = True
+        Handler.bytes_served = 0
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+
+    def tearDown(self):
+        self.stdout.stop()
+        http_pool.close_all()
+        self.tmp.cleanup()
+
+    def test_extracts_only_linux_members(self):
+        """Only Linux members are written, under their archive path."""
+        count, fetched, size = remote_zip.extract_remote(self.url, self.work_dir, download_server.is_linux_member)
+        self.assertEqual(count, len(LINUX_FILES))
+        self.assertEqual(size, len(Handler.archive))
+        for name, (content, _) in LINUX_FILES.items():
+            with open(os.path.join(self.work_dir, '1449', 'Linux', name), 'rb') as f:
+                self.assertEqual(f.read(), content)
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, '1449', 'Windows')))
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, '1449', 'Mac')))
+
+    def test_transfers_less_than_archive(self):
+        """The Mac and Windows data never crosses the network."""
+        remote_zip.extract_remote(self.url, self.work_dir, download_server.is_linux_member)
+        self.assertLess(Handler.bytes_served, len(Handler.archive) / 2)
+
+    def test_small_spans_fetched_in_parallel(self):
+        """Splitting into many small spans gives the same result."""
+        remote_zip.extract_remote(self.url, self.work_dir, download_server.is_linux_member,
+                                  connections=4, max_span_size=1)
+        with open(os.path.join(self.work_dir, '1449', 'Linux', 'Content', 'Images', 'Item_1.xnb'), 'rb') as f:
+            self.assertEqual(f.read(), LINUX_FILES['Content/Images/Item_1.xnb'][0])
+
+    def test_prune_installs_remote_extraction(self):
+        """prune_unused_files moves the remotely extracted tree into place."""
+        remote_zip.extract_remote(self.url, self.work_dir, download_server.is_linux_member)
+        prune_unused_files.prune(self.work_dir)
+        with open(os.path.join(self.work_dir, 'TerrariaServer.bin.x86_64'), 'rb') as f:
+            self.assertEqual(f.read(), LINUX_FILES['TerrariaServer.bin.x86_64'][0])
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, '1449')))
+
+    def test_zip64_archive(self):
+        """Archives with a zip64 end of central directory are parsed."""
+        buffer = io.BytesIO()
+        # Lowering the entry limit makes zipfile write the zip64 end records
+        with patch.object(zipfile, 'ZIP_FILECOUNT_LIMIT', 1):
+            with zipfile.ZipFile(buffer, 'w') as zf:
+                with zf.open('1449/Linux/big.bin', 'w', force_zip64=True) as f:
+                    f.write(b'z' * 1000)
+                zf.writestr('1449/Windows/other.bin', b'w')
+        Handler.archive = buffer.getvalue()
+        self.assertIn(remote_zip.EOCD64_LOCATOR_SIGNATURE, Handler.archive)
+        remote_zip.extract_remote(self.url, self.work_dir, download_server.is_linux_member)
+        with open(os.path.join(self.work_dir, '1449', 'Linux', 'big.bin'), 'rb') as f:
+            self.assertEqual(f.read(), b'z' * 1000)
+
+    def test_no_range_support(self):
+        """Servers without range support raise RangesNotSupported."""
+        Handler.supports_ranges = False
+        with self.assertRaises(remote_zip.RangesNotSupported):
+            remote_zip.extract_remote(self.url, self.work_dir, download_server.is_linux_member)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Unit tests for tracing.py, run against the simulated terraria.org.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import json
+import tempfile
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+for path in (script_dir, tests_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import download_server
+import get_latest_version
+import http_pool
+import prune_unused_files
+import tracing
+import fake_terraria
+
+
+class TracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake = fake_terraria.FakeTerraria(['1449', '1450', '1451'], wiki_version='1449',
+                                               archive_size=64 * 1024).start()
+        self.original = fake_terraria.route_to(self.fake.base_url)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {'TERRARIA_CACHE_DIR': self.tmp.name})
+        self.env.start()
+        for name in ('TERRARIA_TRACE', 'TERRARIA_TRACE_FORMAT', 'TERRARIA_ARTIFACT_CACHE', 'TERRARIA_MIRROR'):
+            os.environ.pop(name, None)
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+        self.stderr = patch('sys.stderr', new_callable=io.StringIO)
+        self.stderr.start()
+
+    def tearDown(self):
+        tracing.finish()
+        self.stderr.stop()
+        self.stdout.stop()
+        self.env.stop()
+        http_pool.request = self.original
+        http_pool.close_all()
+        self.fake.stop()
+        self.tmp.cleanup()
+
+    def trace_path(self, name):
+        return os.path.join(self.tmp.name, 'trace', name)
+
+    def events(self, path, kind):
+        with open(path) as f:
+            return [event for event in map(json.loads, f) if event['event'] == kind]
+
+
+class TestDisabled(TracingTestCase):
+    """Without a trace file nothing is recorded or written."""
+
+    def test_no_op(self):
+        self.assertFalse(tracing.setup())
+        self.assertFalse(tracing.enabled())
+        self.assertIs(tracing.phase('download'), tracing.phase('extract'))
+        with tracing.phase('download') as phase:
+            phase.bytes = 10
+        self.assertIsNone(tracing.start_request('GET', 'https://terraria.org/', False))
+        self.assertEqual(get_latest_version.find_highest_version(jobs=4), '1451')
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, 'trace')))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            tracing.setup(self.trace_path('trace.txt'), 'xml')
+        self.assertFalse(tracing.enabled())
+
+
+class TestJsonLines(TracingTestCase):
+    """One JSON object per request, probe and phase."""
+
+    def test_search(self):
+        path = self.trace_path('trace.jsonl')
+        with patch.dict(os.environ, {'TERRARIA_TRACE': path}):
+            self.assertTrue(tracing.setup())
+        stats = {}
+        self.assertEqual(get_latest_version.find_highest_version(jobs=4, stats=stats), '1451')
+        tracing.finish()
+
+        requests = self.events(path, 'request')
+        self.assertEqual(len(requests), self.fake.counters()['requests'])
+        for request in requests:
+            self.assertIn(request['status'], (200, 404))
+            self.assertGreaterEqual(request['ttfb'], 0)
+            self.assertGreaterEqual(request['transfer'], 0)
+        opened = [request for request in requests if not request['reused']]
+        self.assertTrue(opened)
+        self.assertTrue(all(request['dns'] is not None and request['connect'] is not None for request in opened))
+        wiki = [request for request in requests if request['url'].endswith('/wiki/Server')]
+        self.assertEqual(len(wiki), 1)
+        self.assertGreater(wiki[0]['bytes'], 0)
+
+        probes = self.events(path, 'probe')
+        self.assertEqual(len(probes), stats['probes'])
+        self.assertIn({'version': '1451', 'result': 'available'},
+                      [{'version': p['version'], 'result': p['result']} for p in probes])
+        self.assertEqual([p['name'] for p in self.events(path, 'phase')], ['wiki_scrape', 'probe_search'])
+        summary, = self.events(path, 'summary')
+        totals = {(c['name'], tuple(sorted(c['labels'].items()))): c['value'] for c in summary['counters']}
+        self.assertEqual(totals[('terraria_probes_total', (('result', 'available'),))], 2)
+
+    def test_download_and_extract(self):
+        """The download and extraction phases report their bytes and throughput."""
+        path = self.trace_path('trace.jsonl')
+        tracing.setup(path)
+        install_dir = os.path.join(self.tmp.name, 'server')
+        os.makedirs(install_dir)
+        download_server.download_server('1450', install_dir, use_cache=False)
+        prune_unused_files.prune(install_dir)
+        tracing.finish()
+
+        phases = {event['name']: event for event in self.events(path, 'phase')}
+        size = len(self.fake.archive('1450'))
+        self.assertEqual(phases['download']['bytes'], size)
+        self.assertEqual(phases['download']['source'], 'network')
+        self.assertGreater(phases['download']['throughput'], 0)
+        self.assertGreater(phases['extract']['bytes'], 0)
+        self.assertIn('activate', phases)
+        received = sum(event['bytes'] for event in self.events(path, 'request'))
+        self.assertEqual(received, self.fake.counters()['bytes'])
+
+
+class TestOpenMetrics(TracingTestCase):
+    """Counters written at exit and added up across runs."""
+
+    def run_search(self, path):
+        tracing.setup(path)
+        get_latest_version.find_highest_version(jobs=4)
+        tracing.finish()
+        return tracing.read_openmetrics(path)
+
+    def test_runs_accumulate(self):
+        path = self.trace_path('metrics.prom')
+        first = self.run_search(path)
+        http_pool.close_all()
+        second = self.run_search(path)
+        key = ('terraria_probes_total', (('result', 'available'),))
+        self.assertEqual(first[key], 2)
+        self.assertEqual(second[key], 4)
+        requests = sum(value for (name, _), value in second.items() if name == 'terraria_http_requests_total')
+        self.assertEqual(requests, self.fake.counters()['requests'])
+
+        with open(path) as f:
+            text = f.read()
+        self.assertTrue(text.endswith('# EOF\n'))
+        self.assertIn('# TYPE terraria_http_seconds counter', text)
+        self.assertIn('stage="dns"', text)
+        self.assertIn('terraria_http_throughput_bytes_per_second{host="127.0.0.1"}', text)
+        self.assertEqual(text.count('# EOF'), 1)
+
+    def test_format_from_environment(self):
+        path = self.trace_path('metrics.out')
+        with patch.dict(os.environ, {'TERRARIA_TRACE': path, 'TERRARIA_TRACE_FORMAT': 'openmetrics'}):
+            tracing.setup()
+        with tracing.phase('extract') as phase:
+            phase.bytes = 1000
+        tracing.finish()
+        samples = tracing.read_openmetrics(path)
+        self.assertEqual(samples[('terraria_phase_bytes_total', (('phase', 'extract'),))], 1000)
+        self.assertEqual(samples[('terraria_phase_runs_total', (('phase', 'extract'), ('result', 'ok')))], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Unit tests for upgrade.py.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import tempfile
+import threading
+import zipfile
+from http.server import ThreadingHTTPServer
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+for path in (script_dir, tests_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import http_pool
+import install_layout
+import install_manifest
+import prune_unused_files
+import remote_zip
+import upgrade
+from test_prune_unused_files import LINUX_FILES, build_server_zip
+from test_remote_zip import Handler
+
+NEW_LINUX_FILES = dict(LINUX_FILES)
+NEW_LINUX_FILES['TerrariaServer.exe'] = (b'MZ-server-1450', 0o644)  # different size
+NEW_LINUX_FILES['System.dll'] = (b'SYSTEM', 0o644)  # same size, different content
+NEW_LINUX_FILES['Content/Images/Item_2.xnb'] = (b'new item', 0o644)
+del NEW_LINUX_FILES['lib64/libsteam_api.so']
+
+
+class UpgradeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work_dir = os.path.join(self.tmp.name, 'install')
+        os.makedirs(self.work_dir)
+        build_server_zip(os.path.join(self.work_dir, 'terraria-server.zip'))
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+        install_manifest.write_download_info(self.work_dir, '1449', 'terraria-server-1449.zip')
+        prune_unused_files.prune(self.work_dir)
+        os.makedirs(os.path.join(self.work_dir, 'Worlds'))
+        with open(os.path.join(self.work_dir, 'Worlds', 'world1.wld'), 'wb') as f:
+            f.write(b'world')
+        self.new_zip = os.path.join(self.tmp.name, 'terraria-server-1450.zip')
+        build_server_zip(self.new_zip, version='1450', linux_files=NEW_LINUX_FILES)
+
+    def tearDown(self):
+        self.stdout.stop()
+        self.tmp.cleanup()
+
+    def read(self, name):
+        with open(os.path.join(self.work_dir, name), 'rb') as f:
+            return f.read()
+
+    def assert_no_staging(self):
+        entries = os.listdir(install_layout.versions_dir(self.work_dir))
+        self.assertEqual([name for name in entries if name.startswith(install_layout.STAGING_PREFIX)], [])
+
+    def assert_upgraded(self):
+        for name, (content, _) in NEW_LINUX_FILES.items():
+            self.assertEqual(self.read(name), content)
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, 'lib64')))
+        self.assertEqual(self.read('Worlds/world1.wld'), b'world')
+        self.assert_no_staging()
+        manifest = install_manifest.load_manifest(self.work_dir)
+        self.assertEqual(manifest['version'], '1450')
+        self.assertEqual(set(manifest['files']), set(NEW_LINUX_FILES))
+        self.assertEqual(install_manifest.verify(self.work_dir, full=True), [])
+
+
+class TestUpgrade(UpgradeTestCase):
+    """Test upgrading from a local archive."""
+
+    def test_only_changed_files_written(self):
+        """Changed and new files are written, unchanged files keep their inode."""
+        unchanged = os.stat(os.path.join(self.work_dir, 'TerrariaServer.bin.x86_64')).st_ino
+        written, removed = upgrade.upgrade(self.work_dir, archive=self.new_zip)
+        self.assertEqual((written, removed), (3, 1))
+        self.assertEqual(os.stat(os.path.join(self.work_dir, 'TerrariaServer.bin.x86_64')).st_ino, unchanged)
+        self.assert_upgraded()
+
+    def test_same_size_change_detected(self):
+        """A member with the same size but a different CRC32 is replaced."""
+        changed, _, kept = upgrade.plan_upgrade(
+            install_layout.current_dir(self.work_dir), install_manifest.load_manifest(self.work_dir)['files'],
+            upgrade.linux_members(zipfile.ZipFile(self.new_zip).infolist()))
+        self.assertIn('System.dll', changed)
+        self.assertIn('TerrariaServer.bin.x86_64', kept)
+
+    def test_without_manifest(self):
+        """Without a manifest the files on disk are compared instead."""
+        os.remove(os.path.join(install_layout.current_dir(self.work_dir), install_manifest.MANIFEST_NAME))
+        written, removed = upgrade.upgrade(self.work_dir, archive=self.new_zip)
+        self.assertEqual((written, removed), (3, 0))
+        self.assertEqual(self.read('System.dll'), b'SYSTEM')
+
+    def test_locally_modified_file_rewritten(self):
+        """A file changed since the install is compared by content, not by the manifest."""
+        with open(os.path.join(self.work_dir, 'TerrariaServer.bin.x86_64'), 'wb') as f:
+            f.write(b'\x7fELF-SERVER')
+        written, _ = upgrade.upgrade(self.work_dir, archive=self.new_zip)
+        self.assertEqual(written, 4)
+        self.assert_upgraded()
+
+    def test_interrupted_switch_leaves_old_version(self):
+        """An upgrade interrupted before the switch leaves the old install active."""
+        with patch.object(upgrade.install_layout, 'commit', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                upgrade.upgrade(self.work_dir, archive=self.new_zip)
+        self.assertEqual(install_manifest.load_manifest(self.work_dir)['version'], '1449')
+        self.assertEqual(install_manifest.verify(self.work_dir, full=True), [])
+
+        # The next run throws away the abandoned staging directory
+        upgrade.upgrade(self.work_dir, archive=self.new_zip)
+        self.assert_upgraded()
+
+    def test_failure_while_staging_leaves_install_untouched(self):
+        """Errors while staging leave the old install and no staging directory."""
+        with patch.object(upgrade, 'stage_from_zip', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                upgrade.upgrade(self.work_dir, archive=self.new_zip)
+        self.assertEqual(install_manifest.verify(self.work_dir, full=True), [])
+        self.assert_no_staging()
+
+    def test_rollback(self):
+        """The previous version stays installed and can be switched back to."""
+        upgrade.upgrade(self.work_dir, archive=self.new_zip)
+        self.assertEqual(install_layout.rollback(self.work_dir), '1449')
+        for name, (content, _) in LINUX_FILES.items():
+            self.assertEqual(self.read(name), content)
+        self.assertFalse(os.path.exists(os.path.join(self.work_dir, 'Content', 'Images', 'Item_2.xnb')))
+        self.assertEqual(install_manifest.verify(self.work_dir, full=True), [])
+
+    def test_already_installed(self):
+        """Nothing is downloaded when the installed version is current."""
+        with patch.object(upgrade.download_server, 'download_server') as mock_download:
+            self.assertEqual(upgrade.upgrade(self.work_dir, version='1449'), (0, 0))
+        mock_download.assert_not_called()
+
+
+class TestArchUpgrade(UpgradeTestCase):
+    """An install pruned for one architecture is upgraded with the same rules."""
+
+    def test_arm64_stays_pruned(self):
+        build_server_zip(os.path.join(self.work_dir, 'terraria-server.zip'))
+        prune_unused_files.prune(self.work_dir, arch='arm64')
+        upgrade.upgrade(self.work_dir, archive=self.new_zip)
+        manifest = install_manifest.load_manifest(self.work_dir)
+        self.assertEqual(manifest['arch'], 'arm64')
+        self.assertEqual(set(manifest['files']), {'TerrariaServer.exe', 'Content/Images/Item_1.xnb',
+                                                  'Content/Images/Item_2.xnb'})
+        self.assertFalse(os.path.lexists(os.path.join(self.work_dir, 'System.dll')))
+        self.assertEqual(install_manifest.verify(self.work_dir, full=True), [])
+
+
+class TestRemoteUpgrade(UpgradeTestCase):
+    """Test upgrading with range requests against a local HTTP server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/terraria-server-1450.zip'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        super().setUp()
+        with open(self.new_zip, 'rb') as f:
+            Handler.archive = f.read()
+        Handler.supports_ranges = True
+        Handler.bytes_served = 0
+        self.url_patch = patch.object(upgrade.download_server, 'archive_url', return_value=self.url)
+        self.url_patch.start()
+
+    def tearDown(self):
+        self.url_patch.stop()
+        http_pool.close_all()
+        super().tearDown()
+
+    def test_fetches_only_changed_members(self):
+        """Only the central directory and the changed members are downloaded."""
+        with patch.object(remote_zip, 'extract_remote', wraps=remote_zip.extract_remote) as mock_extract:
+            upgrade.upgrade(self.work_dir, version='1450', linux_only=True)
+        wanted = mock_extract.call_args.args[2]
+        self.assertTrue(wanted('1450/Linux/System.dll'))
+        self.assertFalse(wanted('1450/Linux/TerrariaServer.bin.x86_64'))
+        self.assert_upgraded()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Unit tests for version_index.py, run against the simulated terraria.org.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import tempfile
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+for path in (script_dir, tests_dir):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import download_server
+import get_latest_filename
+import get_latest_version
+import http_pool
+import version_index
+import fake_terraria
+
+
+class VersionIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.fake = fake_terraria.FakeTerraria(['1440', '1449', '1450'], archive_size=1024).start()
+        self.original = fake_terraria.route_to(self.fake.base_url)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {'TERRARIA_CACHE_DIR': self.tmp.name})
+        self.env.start()
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+        self.stderr = patch('sys.stderr', new_callable=io.StringIO)
+        self.stderr.start()
+
+    def tearDown(self):
+        self.stderr.stop()
+        self.stdout.stop()
+        self.env.stop()
+        http_pool.request = self.original
+        http_pool.close_all()
+        self.fake.stop()
+        self.tmp.cleanup()
+
+    def refreshed(self):
+        index = version_index.VersionIndex()
+        self.assertEqual(index.refresh(), ['1440', '1449', '1450'])
+        return index
+
+
+class TestVersionIndex(VersionIndexTestCase):
+    """Building, storing and querying the index."""
+
+    def test_queries(self):
+        index = self.refreshed()
+        self.assertEqual(index.versions(), ['1440', '1449', '1450'])
+        self.assertEqual(index.latest(), '1450')
+        self.assertEqual(index.latest('1.4.4'), '1449')
+        self.assertIsNone(index.latest('1.3'))
+        self.assertIs(index.exists('1.4.4.9'), True)
+        self.assertIsNone(index.exists('1451'))
+        self.assertIsNone(index.exists('banana'))
+
+    def test_only_probed_versions_absent(self):
+        """Versions the list skips or does not go back to are unknown; probed ones in range are absent."""
+        index = self.refreshed()
+        # Below the oldest entry, and a gap nobody probed
+        self.assertIsNone(index.exists('1353'))
+        self.assertIsNone(index.exists('1448'))
+        # 1451 was probed absent, but is above the newest entry until 1460 comes out
+        self.assertIsNone(index.exists('1451'))
+        self.fake.versions = sorted(self.fake.versions + ['1460'])
+        self.assertEqual(index.refresh(), ['1460'])
+        self.assertIs(version_index.VersionIndex().exists('1451'), False)
+        self.assertIsNone(index.exists('1455'))
+
+    def test_stored_compactly(self):
+        """The index survives a reload and takes a header plus two 1000-bit bitmaps."""
+        index = self.refreshed()
+        self.assertEqual(os.path.getsize(index.path), 258)
+        reloaded = version_index.VersionIndex()
+        self.assertEqual(reloaded.versions(), index.versions())
+        self.assertEqual(reloaded.absent, index.absent)
+        self.assertGreater(reloaded.refreshed_at, 0)
+
+    def test_first_format_read(self):
+        with open(version_index.default_index_path(), 'wb') as f:
+            f.write(version_index.HEADER.pack(b'TVX1', 1) + b'\x80' + bytes(version_index.BITMAP_SIZE - 1))
+        index = version_index.VersionIndex()
+        self.assertEqual(index.versions(), ['1000'])
+        self.assertEqual(index.refreshed_at, 1)
+
+    def test_corrupt_file_ignored(self):
+        with open(version_index.default_index_path(), 'wb') as f:
+            f.write(b'garbage')
+        self.assertEqual(version_index.VersionIndex().versions(), [])
+        self.assertIn('corrupt version index', sys.stderr.getvalue())
+
+    def test_incremental_refresh(self):
+        """Only versions above the newest entry are probed, following each release found."""
+        index = self.refreshed()
+        self.fake.versions = sorted(self.fake.versions + ['1451', '1460', '1461'])
+        self.fake.reset_counters()
+        # The names list lags behind; the probes find the new releases anyway
+        with patch.object(get_latest_filename, 'get_filenames', return_value=['terraria-server-1450.zip']):
+            self.assertEqual(index.refresh(), ['1451', '1460', '1461'])
+        # 1451, 1460, 1500, then 1452 and 1461, then 1462 and 1470
+        self.assertEqual(self.fake.counters()['requests'], 7)
+
+    def test_incomplete_refresh(self):
+        """Found versions are kept, but an unanswered probe fails the refresh."""
+        index = self.refreshed()
+        refreshed_at = index.refreshed_at
+        with patch.object(get_latest_version, 'probe_versions', return_value={'1451': True, '1460': None}):
+            with patch.object(get_latest_version, 'next_candidates', side_effect=[['1451', '1460'], []]):
+                self.assertIsNone(index.refresh())
+        self.assertIn('1451', index.versions())
+        self.assertEqual(index.refreshed_at, refreshed_at)
+
+    def test_cli(self):
+        self.assertEqual(version_index.main(['refresh']), 0)
+        self.assertEqual(version_index.main(['exists', '1449']), 0)
+        self.assertEqual(version_index.main(['exists', '1448']), 1)
+        self.assertEqual(version_index.main(['exists', '1451']), 1)
+        self.fake.versions = sorted(self.fake.versions + ['1460'])
+        self.assertEqual(version_index.main(['refresh']), 0)
+        self.assertEqual(version_index.main(['exists', '1451']), version_index.NOT_RELEASED_EXIT)
+        self.assertEqual(version_index.main(['latest', '1.4.4']), 0)
+        self.assertTrue(sys.stdout.getvalue().endswith('1449\n'))
+
+
+class TestPinnedDownload(VersionIndexTestCase):
+    """download_server checks pinned versions against the index without a request."""
+
+    def test_unreleased_version_rejected(self):
+        self.refreshed()
+        self.fake.versions = sorted(self.fake.versions + ['1460'])
+        version_index.VersionIndex().refresh()
+        self.fake.reset_counters()
+        with self.assertRaises(ValueError):
+            download_server.download_server('1.4.5.1', self.tmp.name, use_cache=False)
+        self.assertEqual(self.fake.counters()['requests'], 0)
+
+    def test_unknown_version_allowed(self):
+        """Without an index, or for versions it never probed, the download goes ahead."""
+        download_server.download_server('1449', self.tmp.name, use_cache=False)
+        self.refreshed()
+        for version in ('1451', '1353', '1448'):
+            with self.assertRaises(Exception) as context:
+                download_server.download_server(version, self.tmp.name, use_cache=False)
+            self.assertNotIsInstance(context.exception, ValueError)
+
+
+if __name__ == '__main__':
+    unittest.main()
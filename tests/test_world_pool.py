@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Unit tests for world_pool.py, with a small Python script standing in for TerrariaServer.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import tempfile
+import threading
+import time
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import world_pool
+import create_server_config
+
+# Reads its config, "generates" the world (writing the config into it), then
+# opens the port and waits for the "exit" console command. Start and end times
+# are appended to FAKE_LOG to check how many ran at once; with FAKE_FAIL set it
+# exits before writing anything.
+FAKE_SERVER = '''
+import os, socket, sys, time
+config = sys.argv[sys.argv.index("-config") + 1]
+settings = dict(line.split("=", 1) for line in open(config).read().splitlines())
+if os.environ.get("FAKE_FAIL"):
+    sys.exit(2)
+with open(os.environ["FAKE_LOG"], "a") as log:
+    log.write(f"start {time.monotonic()}\\n")
+time.sleep(0.3)
+with open(settings["world"], "w") as f:
+    f.write(f"size={settings['autocreate']} difficulty={settings['difficulty']} seed={settings['seed']}\\n")
+with open(os.environ["FAKE_LOG"], "a") as log:
+    log.write(f"end {time.monotonic()}\\n")
+listener = socket.create_server(("127.0.0.1", int(settings["port"])))
+for line in sys.stdin:
+    if line.strip() == "exit":
+        break
+'''
+
+
+class PoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.worldpath = os.path.join(self.tmp.name, 'Worlds')
+        os.makedirs(self.worldpath)
+        self.pool = world_pool.pool_dir(self.worldpath)
+        fake_path = os.path.join(self.tmp.name, 'fake_server.py')
+        with open(fake_path, 'w') as f:
+            f.write(FAKE_SERVER)
+        self.command = [sys.executable, fake_path]
+        self.log = os.path.join(self.tmp.name, 'runs.log')
+        self.environ = patch.dict(os.environ, {'FAKE_LOG': self.log})
+        self.environ.start()
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+        self.stderr = patch('sys.stderr', new_callable=io.StringIO)
+        self.stderr.start()
+
+    def tearDown(self):
+        self.stderr.stop()
+        self.stdout.stop()
+        self.environ.stop()
+        self.tmp.cleanup()
+
+    def fill(self, specs, count=1, cpus=1):
+        return world_pool.fill(self.pool, specs, count, cpus, command=self.command, timeout=10)
+
+    def most_at_once(self):
+        events = []
+        with open(self.log) as f:
+            for line in f:
+                kind, when = line.split()
+                events.append((float(when), 1 if kind == 'start' else -1))
+        running = most = 0
+        for _, change in sorted(events, key=lambda event: (event[0], event[1])):
+            running += change
+            most = max(most, running)
+        return most
+
+
+class TestSpec(unittest.TestCase):
+    def test_parse_spec(self):
+        self.assertEqual(world_pool.parse_spec('2:1, 3:2:my:seed,2:1'), [(2, 1, ''), (3, 2, 'my:seed')])
+        for spec in ('', '2', '4:1', '2:5', 'a:1', '2:1,'):
+            with self.assertRaises(ValueError, msg=spec):
+                world_pool.parse_spec(spec)
+
+    def test_tuple_name(self):
+        self.assertEqual(world_pool.tuple_name(2, 1, ''), '2-1-random')
+        self.assertNotEqual(world_pool.tuple_name(2, 1, 'a'), world_pool.tuple_name(2, 1, 'b'))
+        self.assertNotIn('/', world_pool.tuple_name(2, 1, '../x'))
+
+
+class TestFill(PoolTestCase):
+    def test_fills_every_tuple_within_cpu_budget(self):
+        specs = [(1, 0, ''), (3, 2, 'myseed')]
+        self.assertEqual(self.fill(specs, count=3, cpus=2), 6)
+        self.assertEqual(len(world_pool.pooled_worlds(self.pool, 1, 0, '')), 3)
+        seeded = world_pool.pooled_worlds(self.pool, 3, 2, 'myseed')
+        self.assertEqual(len(seeded), 3)
+        with open(seeded[0]) as f:
+            self.assertEqual(f.read(), 'size=3 difficulty=2 seed=myseed\n')
+        self.assertEqual(self.most_at_once(), 2)
+        self.assertEqual(sorted(os.listdir(self.pool)), ['.lock', '1-0-random', world_pool.tuple_name(*specs[1])])
+        # Already full
+        self.assertEqual(self.fill(specs, count=3, cpus=2), 0)
+
+    def test_single_fill_per_pool(self):
+        started = threading.Event()
+        results = []
+
+        def first():
+            results.append(self.fill([(1, 0, '')], count=2))
+
+        with patch.object(world_pool, 'generate_world',
+                          side_effect=lambda *args: started.set() or time.sleep(0.5)) as generate:
+            thread = threading.Thread(target=first)
+            thread.start()
+            started.wait(10)
+            self.assertIsNone(self.fill([(1, 0, '')]))
+            thread.join()
+        self.assertIn('Another fill', sys.stdout.getvalue())
+        self.assertEqual(generate.call_count, 2)
+
+    def test_failed_generation_stops(self):
+        os.makedirs(os.path.join(self.pool, world_pool.GENERATING_PREFIX + 'old'))
+        with patch.dict(os.environ, {'FAKE_FAIL': '1'}):
+            self.assertEqual(self.fill([(1, 0, '')], count=2), 0)
+        self.assertIn('could not generate a 1-0-random world', sys.stderr.getvalue())
+        self.assertEqual(os.listdir(self.pool), ['.lock'])
+
+
+class TestClaim(PoolTestCase):
+    def test_claims_are_exclusive(self):
+        self.fill([(1, 0, '')], count=2)
+        destinations = [os.path.join(self.worldpath, f'w{i}.wld') for i in range(4)]
+        results = [None] * 4
+
+        def take(i):
+            results[i] = world_pool.claim(self.pool, 1, 0, '', destinations[i])
+
+        threads = [threading.Thread(target=take, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        claimed = [path for path in results if path]
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(len(set(claimed)), 2)
+        self.assertEqual(sum(os.path.exists(path) for path in destinations), 2)
+        self.assertEqual(world_pool.pooled_worlds(self.pool, 1, 0, ''), [])
+
+    def test_config_step_claims_matching_world(self):
+        self.fill([(2, 1, '')])
+        config = os.path.join(self.tmp.name, 'server-config.conf')
+        environ = {'worldpool': '2:1,3:1', 'worldpath': self.worldpath, 'world': 'castle.wld',
+                   'autocreate': '2', 'difficulty': '1'}
+        with patch.object(world_pool, 'start_fill') as start_fill:
+            create_server_config.create_config(config, environ)
+        start_fill.assert_called_once_with(self.worldpath, '2:1,3:1', 1, 1)
+        world = os.path.join(self.worldpath, 'castle.wld')
+        self.assertTrue(os.path.isfile(world))
+        with open(config) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[1], f'world={world}')
+        self.assertNotIn('autocreate=2', lines)
+        self.assertIn('Using pre-generated world', sys.stdout.getvalue())
+        self.assertIn(f'{world} is named World in the game, not castle', sys.stderr.getvalue())
+
+    def test_other_tuple_not_claimed(self):
+        self.fill([(2, 1, '')])
+        config = os.path.join(self.tmp.name, 'server-config.conf')
+        environ = {'worldpool': '2:1', 'worldpath': self.worldpath, 'world': 'castle.wld',
+                   'autocreate': '2', 'difficulty': '2'}
+        with patch.object(world_pool, 'start_fill'):
+            create_server_config.create_config(config, environ)
+        self.assertFalse(os.path.exists(os.path.join(self.worldpath, 'castle.wld')))
+        self.assertEqual(len(world_pool.pooled_worlds(self.pool, 2, 1, '')), 1)
+        with open(config) as f:
+            self.assertIn('autocreate=2', f.read().splitlines())
+
+    def test_world_name_respected(self):
+        """Pooled worlds are named World, so another worldname is not given one."""
+        self.fill([(2, 1, '')], count=2)
+        config = os.path.join(self.tmp.name, 'server-config.conf')
+        environ = {'worldpool': '2:1', 'worldpath': self.worldpath, 'autocreate': '2', 'difficulty': '1'}
+        with patch.object(world_pool, 'start_fill'):
+            create_server_config.create_config(config, dict(environ, worldname='castle'))
+            self.assertIn('Not using a pre-generated world', sys.stdout.getvalue())
+            self.assertEqual(len(world_pool.pooled_worlds(self.pool, 2, 1, '')), 2)
+            create_server_config.create_config(config, dict(environ, worldname='World'))
+        self.assertTrue(os.path.isfile(os.path.join(self.worldpath, 'World.wld')))
+        self.assertEqual(len(world_pool.pooled_worlds(self.pool, 2, 1, '')), 1)
+        self.assertEqual(sys.stderr.getvalue(), '')
+
+    def test_fill_only_when_short(self):
+        self.fill([(2, 1, '')])
+        with patch('subprocess.Popen') as popen:
+            self.assertIsNone(world_pool.start_fill(self.worldpath, '2:1', count=1))
+            popen.assert_not_called()
+            world_pool.start_fill(self.worldpath, '2:1,3:1', count=1, cpus=2)
+        command = popen.call_args.args[0]
+        self.assertEqual(command[2:], ['fill', '--worldpath', self.worldpath, '--spec', '2:1,3:1',
+                                       '--count', '1', '--cpus', '2'])
+
+    def test_invalid_spec_rejected(self):
+        with self.assertRaises(create_server_config.ConfigError) as context:
+            create_server_config.load_settings({'worldpool': '2:9'})
+        self.assertTrue(context.exception.errors[0].startswith('worldpool'))
+
+
+if __name__ == '__main__':
+    unittest.main()
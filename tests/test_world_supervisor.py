@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Unit tests for world_supervisor.py, with a small Python script standing in for TerrariaServer.
+"""
+
+import unittest
+from unittest.mock import patch
+import sys
+import io
+import os
+import tempfile
+import time
+
+# Add scripts directory to path to import the scripts
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+script_dir = os.path.join(tests_dir, '..', 'scripts')
+if script_dir not in sys.path:
+    sys.path.insert(0, script_dir)
+
+import world_supervisor
+
+# Counts its runs next to its config, exits with status 3 for the first
+# FAKE_CRASHES runs, and otherwise waits for the "exit" console command
+FAKE_SERVER = '''
+import os, sys
+config = sys.argv[sys.argv.index("-config") + 1]
+state = os.path.join(os.path.dirname(config), "runs")
+runs = int(open(state).read()) + 1 if os.path.exists(state) else 1
+open(state, "w").write(str(runs))
+print("running", flush=True)
+if runs <= int(os.environ.get("FAKE_CRASHES", "0")):
+    sys.exit(3)
+for line in sys.stdin:
+    if line.strip() == "exit":
+        print("saving", flush=True)
+        sys.exit(0)
+'''
+
+
+class SupervisorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.instances_dir = os.path.join(self.tmp.name, 'instances')
+        fake_path = os.path.join(self.tmp.name, 'fake_server.py')
+        with open(fake_path, 'w') as f:
+            f.write(FAKE_SERVER)
+        self.command = [sys.executable, fake_path]
+        self.supervisor = None
+        self.stdout = patch('sys.stdout', new_callable=io.StringIO)
+        self.stdout.start()
+        self.stderr = patch('sys.stderr', new_callable=io.StringIO)
+        self.stderr.start()
+
+    def tearDown(self):
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        self.stderr.stop()
+        self.stdout.stop()
+        self.tmp.cleanup()
+
+    def build(self, worlds, defaults=None):
+        return world_supervisor.build_instances(defaults or {}, worlds, self.instances_dir, environ={},
+                                                command=self.command)
+
+    def read_config(self, name):
+        with open(os.path.join(self.instances_dir, name, 'server-config.conf')) as f:
+            return f.read().splitlines()
+
+    def runs(self, name):
+        path = os.path.join(self.instances_dir, name, 'runs')
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return int(f.read() or 0)
+
+    def poll_until(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'timed out')
+            self.supervisor.poll()
+            time.sleep(0.02)
+
+
+class TestWorldDefinitions(SupervisorTestCase):
+    def test_configs_written(self):
+        instances = self.build([{'name': 'castle', 'port': 7777, 'world': 'castle.wld'},
+                                {'name': 'sandbox', 'port': 7778, 'maxplayers': 4}],
+                               defaults={'maxplayers': 8, 'worldpath': self.tmp.name})
+        self.assertEqual([instance.name for instance in instances], ['castle', 'sandbox'])
+        castle, sandbox = self.read_config('castle'), self.read_config('sandbox')
+        self.assertIn(f'world={self.tmp.name}/castle.wld', castle)
+        self.assertIn('worldname=castle', castle)
+        self.assertIn('port=7777', castle)
+        self.assertIn('maxplayers=8', castle)
+        self.assertIn(f'world={self.tmp.name}/sandbox.wld', sandbox)
+        self.assertIn('port=7778', sandbox)
+        self.assertIn('maxplayers=4', sandbox)
+        banlist = os.path.join(os.path.abspath(self.instances_dir), 'sandbox', 'banlist.txt')
+        self.assertIn(f'banlist={banlist}', sandbox)
+        self.assertTrue(os.path.exists(banlist))
+        self.assertEqual(instances[0].command[-2:], ['-config', os.path.abspath(
+            os.path.join(self.instances_dir, 'castle', 'server-config.conf'))])
+
+    def test_environment_world_ignored(self):
+        world_supervisor.build_instances({'worldpath': self.tmp.name},
+                                         [{'name': 'castle', 'port': 7777, 'worldname': 'keep'},
+                                          {'name': 'sandbox', 'port': 7778, 'world': 'sandbox.wld'}],
+                                         self.instances_dir, environ={'world': 'foo.wld', 'worldname': 'foo'},
+                                         command=self.command)
+        castle, sandbox = self.read_config('castle'), self.read_config('sandbox')
+        self.assertIn(f'world={self.tmp.name}/keep.wld', castle)
+        self.assertIn('worldname=keep', castle)
+        self.assertIn(f'world={self.tmp.name}/sandbox.wld', sandbox)
+        self.assertIn('worldname=sandbox', sandbox)
+
+    def test_every_error_reported(self):
+        worlds = [{'name': 'a', 'port': 7777},
+                  {'name': 'b', 'port': 7777},
+                  {'name': 'c'},
+                  {'name': 'd', 'port': 7779, 'maxplayer': 4},
+                  {'name': 'e', 'port': 7780, 'maxplayers': 'abc'},
+                  {'name': 'f', 'port': 7781, 'cpus': '0-1x'},
+                  {'name': 'g', 'port': 7782, 'nice': 40},
+                  {'name': 'a', 'port': 7783},
+                  {'name': '../x', 'port': 7784}]
+        with self.assertRaises(world_supervisor.WorldsError) as context:
+            self.build(worlds)
+        self.assertEqual([error.split(':')[0] for error in context.exception.errors],
+                         ['b', 'c', 'd', 'e', 'f', 'g', 'a', '../x'])
+        self.assertIn('already used by a', context.exception.errors[0])
+        self.assertFalse(os.path.exists(self.instances_dir))
+
+    def test_cpus(self):
+        available = sorted(os.sched_getaffinity(0))
+        self.assertEqual(world_supervisor.parse_cpus('0-2,5', range(8)), [0, 1, 2, 5])
+        self.assertEqual(world_supervisor.parse_cpus([3, 1], range(8)), [1, 3])
+        with self.assertRaises(ValueError):
+            world_supervisor.parse_cpus('7', range(4))
+        instances = self.build([{'name': f'w{i}', 'port': 7777 + i, 'cpus': 'auto'} for i in range(3)])
+        self.assertEqual([instance.cpus for instance in instances],
+                         [[available[i % len(available)]] for i in range(3)])
+
+    def test_load_worlds(self):
+        path = os.path.join(self.tmp.name, 'worlds.json')
+        with open(path, 'w') as f:
+            f.write('[{"name": "a", "port": 7777}]')
+        self.assertEqual(world_supervisor.load_worlds(path), ({}, [{'name': 'a', 'port': 7777}]))
+        with open(path, 'w') as f:
+            f.write('{"worlds": []}')
+        with self.assertRaises(world_supervisor.WorldsError):
+            world_supervisor.load_worlds(path)
+
+
+class TestSupervision(SupervisorTestCase):
+    def test_crash_restarted_with_backoff(self):
+        instances = self.build([{'name': 'a', 'port': 7777}, {'name': 'b', 'port': 7778}])
+        self.supervisor = world_supervisor.Supervisor(instances, stop_timeout=5)
+        with patch.object(world_supervisor, 'RESTART_BASE', 0.05), patch.dict(os.environ, {'FAKE_CRASHES': '2'}):
+            self.poll_until(lambda: self.runs('a') == 3 and self.runs('b') == 3)
+        self.assertEqual([instance.failures for instance in instances], [2, 2])
+        self.assertIn('[a] exited with status 3', sys.stdout.getvalue())
+        self.assertIn('restarting in 0.1s', sys.stdout.getvalue())
+        processes = [instance.process for instance in instances]
+        self.supervisor.stop()
+        self.assertEqual([process.returncode for process in processes], [0, 0])
+        self.poll_until(lambda: '[b] saving' in sys.stdout.getvalue())
+        self.assertFalse(self.supervisor.poll())
+
+    def test_clean_exit_not_restarted(self):
+        instance, = self.build([{'name': 'a', 'port': 7777}])
+        self.supervisor = world_supervisor.Supervisor([instance])
+        self.poll_until(lambda: instance.process is not None)
+        instance.process.stdin.write(b'exit\n')
+        instance.process.stdin.flush()
+        self.poll_until(lambda: instance.stopped)
+        self.assertFalse(self.supervisor.poll())
+        self.assertEqual(self.runs('a'), 1)
+
+    def test_affinity_and_nice(self):
+        cpu = sorted(os.sched_getaffinity(0))[-1]
+        nice = max(5, os.getpriority(os.PRIO_PROCESS, 0))
+        instance, = self.build([{'name': 'a', 'port': 7777, 'cpus': [cpu], 'nice': nice}])
+        self.assertEqual(instance.launch_command()[:3], ['taskset', '-c', str(cpu)])
+        self.supervisor = world_supervisor.Supervisor([instance])
+        self.poll_until(lambda: self.runs('a') == 1)
+        self.assertEqual(os.sched_getaffinity(instance.process.pid), {cpu})
+        self.assertEqual(os.getpriority(os.PRIO_PROCESS, instance.process.pid), nice)
+
+
+if __name__ == '__main__':
+    unittest.main()